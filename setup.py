@@ -22,7 +22,8 @@ setuptools.setup(
             'nftmint = tcr.nftmint:main',
             'nftstatus = tcr.status:main',
             'nftipfs = tcr.ipfs:main',
-            'nftbuybot = tcr.buybot:main'
+            'nftbuybot = tcr.buybot:main',
+            'nftdedupe = tcr.dedupe:main'
             ],
         },
     data_files = [
@@ -29,15 +29,27 @@ from typing import Dict, List, Tuple
 
 import json
 from tcr.command import Command
+import tcr.cbor
 import copy
+import hashlib
 from tcr.nft import Nft
+from tcr.policy import Policy
+from tcr.policy import PolicyCache
+import tcr.policy
+from tcr.transaction import Transaction
+from tcr.utxo import Utxo
+import tcr.utxo
 from tcr.wallet import Wallet
 import logging
 from tcr.database import Database
-import time
 
 logger = logging.getLogger('cardano')
 
+# Where Cardano.query_utxos reads the unspent outputs from
+UTXO_SOURCE_NODE = 'node'
+UTXO_SOURCE_DBSYNC = 'db-sync'
+UTXO_SOURCES = [UTXO_SOURCE_NODE, UTXO_SOURCE_DBSYNC]
+
 class Cardano:
     def __init__(self,
                  network:str,
@@ -45,6 +57,9 @@ class Cardano:
         self.network = network
         self.protocol_parameters_file = protocol_parameters_file
         self.protocol_parameters = {}
+        self.protocol_parameters_epoch = None
+        self.utxo_database = None
+        self.policies = PolicyCache(network)
 
     def get_network(self) -> str:
         return self.network
@@ -65,6 +80,24 @@ class Cardano:
             self.protocol_parameters = json.loads(file.read())
         return self.protocol_parameters
 
+    def refresh_protocol_parameters(self, epoch: int) -> bool:
+        """
+        Query the protocol parameters again only if the epoch changed since
+        they were last queried.  Parameter updates take effect at the start of
+        an epoch.
+
+        @param epoch The current epoch, e.g. Database.query_latest_epoch
+        @return True if the parameters were queried
+        """
+
+        if epoch == self.protocol_parameters_epoch and len(self.protocol_parameters) > 0:
+            return False
+
+        logger.info('Query protocol parameters for epoch: {}'.format(epoch))
+        self.query_protocol_parameters()
+        self.protocol_parameters_epoch = epoch
+        return True
+
     def get_protocol_parameters_file(self) -> str:
         return self.protocol_parameters_file
 
@@ -78,9 +111,95 @@ class Cardano:
 
         return min_utxo_value
 
+    def set_utxo_source(self, source: str, database: Database = None) -> None:
+        """
+        Select where UTXOs are read from.  The node is always correct, db-sync
+        saves the node round trip but is only as current as the last synced
+        block.
+        """
+
+        if not source in UTXO_SOURCES:
+            raise Exception('Invalid UTXO source: {}'.format(source))
+
+        if source == UTXO_SOURCE_DBSYNC:
+            if database == None:
+                raise Exception('UTXO source: {}, requires a database'.format(source))
+            self.utxo_database = database
+        else:
+            self.utxo_database = None
+
+    @staticmethod
+    def parse_asset_name(name: str) -> str:
+        """
+        Decode a hex asset name, as written by 'cardano-cli query utxo
+        --out-file'.  @see Utxo.decode_asset_name
+        """
+
+        return Utxo.decode_asset_name(bytes.fromhex(name))
+
+    @staticmethod
+    def parse_utxo_json(output: str) -> List[Utxo]:
+        """
+        Parse the JSON written by 'cardano-cli query utxo --out-file'.  Unlike
+        the table output each entry includes the address.
+        """
+
+        # cardano-cli writes the UTXOs ordered by tx hash and index
+        utxos = []
+        asset_names = {}
+        for (txin, txout) in json.loads(output).items():
+            (tx_hash, separator, tx_ix) = txin.partition('#')
+            value = txout['value']
+            assets = {}
+            if len(value) > 1:
+                for policy_id in value:
+                    if policy_id != 'lovelace':
+                        for (name, amount) in value[policy_id].items():
+                            if not name in asset_names:
+                                asset_names[name] = Cardano.parse_asset_name(name)
+                            assets[(policy_id, asset_names[name])] = amount
+
+            # inline datums only have a hash in the inlineDatumhash field
+            datum_hash = txout.get('datumhash')
+            if datum_hash == None:
+                datum_hash = txout.get('inlineDatumhash')
+
+            utxos.append(Utxo(tx_hash, int(tx_ix), value['lovelace'], assets, datum_hash, txout['address']))
+
+        return utxos
+
+    @staticmethod
+    def parse_utxo_table(output: str) -> List[Utxo]:
+        """
+        Parse the table printed by 'cardano-cli query utxo'.  The table does not
+        include the address and the datum column is only reliable for the
+        simple 'TxOutDatumNone' / 'TxOutDatumHash' variants.  Prefer
+        parse_utxo_json.
+        """
+
+        utxos = []
+        utxo_table = output.splitlines()
+        for x in range(2, len(utxo_table)):
+            cells = utxo_table[x].split()
+            assets = {}
+            for x in range(4, len(cells), 3):
+                if cells[x] == '+':
+                    if cells[x+1].isnumeric():
+                        # The table names are kept as printed, only the
+                        # JSON output is known to be hex
+                        (policy_id, name) = Utxo.split_full_name(cells[x+2])
+                        assets[(policy_id, name)] = int(cells[x+1])
+
+            datum_hash = cells[len(cells) - 1]
+            if datum_hash == tcr.utxo.DATUM_NONE:
+                datum_hash = None
+            utxos.append(Utxo(cells[0], int(cells[1]), int(cells[2]), assets, datum_hash))
+
+        return utxos
+
     def query_utxos(self,
                     wallet: Wallet,
-                    addresses: List[str]=None) -> Tuple[List, int]:
+                    addresses: List[str]=None) -> Tuple[List[Utxo], int]:
         if addresses == None:
             # query all the known addresses and make sure the addresses are unique
             # which they may not be if using an "external" wallet
@@ -97,53 +216,67 @@ class Cardano:
         total_lovelace = 0
         utxos = []
 
-        for payment_address in addresses:
-            if payment_address == None:
-                # if the requested address is not setup for the wallet then skip it.
-                continue
-
-            command = ['cardano-cli', 'query', 'utxo', '--address', payment_address]
+        # if the requested address is not setup for the wallet then skip it.
+        addresses = [address for address in addresses if address != None]
+        if len(addresses) == 0:
+            return (utxos, total_lovelace)
+
+        if self.utxo_database != None:
+            utxos = self.utxo_database.query_address_utxos(addresses)
+        else:
+            # One node query for all the addresses.  The table output does not
+            # say which address each UTXO belongs to, the JSON output does.
+            command = ['cardano-cli', 'query', 'utxo']
+            for address in addresses:
+                command.extend(['--address', address])
+            command.extend(['--out-file', '/dev/stdout'])
             output = Command.run(command, self.network)
+            utxos = Cardano.parse_utxo_json(output)
 
-            # Calculate total lovelace of the UTXO(s) inside the wallet address
-            utxo_table = output.splitlines()
-            for x in range(2, len(utxo_table)):
-                cells = utxo_table[x].split()
-                assets = {}
-                for x in range(4, len(cells), 3):
-                    if cells[x] == '+':
-                        if cells[x+1].isnumeric():
-                            asset_amount = int(cells[x+1])
-                            asset_name = cells[x+2]
-                            assets[asset_name] = asset_amount
-
-                tx_out_datum_hash = cells[len(cells) - 1]
-                utxos.append({'tx-hash':cells[0], 'tx-ix':int(cells[1]), 'amount': int(cells[2]), 'assets': assets, 'tx-out-datum-hash': tx_out_datum_hash})
-                total_lovelace +=  int(cells[2])
+        for utxo in utxos:
+            total_lovelace += utxo.amount
 
         return (utxos, total_lovelace)
 
-    def query_utxos_time(self, database: Database, utxos: List):
+    def query_utxos_by_address(self,
+                               wallet: Wallet,
+                               addresses: List[str]=None) -> Dict[str, List[Utxo]]:
+        """
+        Query the UTXOs for all addresses at once and split them by address.
+
+        @return {address: [utxo, ...]}
+        """
+
+        (utxos, lovelace) = self.query_utxos(wallet, addresses)
+        by_address = {}
+        if addresses != None:
+            by_address = {address: [] for address in addresses if address != None}
+
         for utxo in utxos:
-            (txtime, txslotno) = (None, None)
-            tries = 0
-            while txtime == None and txslotno == None and tries < 5:
-                (txtime, txslotno) = database.query_txhash_time(utxo['tx-hash'])
-                if txtime == None and txslotno == None:
-                    logger.warning('time and slotno not found for tx {}, try again'.format(utxo['tx-hash']))
-                    time.sleep(1)
-                    tries += 1
-                    continue
-
-                utxo['time'] = txtime
-                utxo['slot-no'] = txslotno
-                break
-
-            if not 'time' in utxo:
-                utxo['time'] = 0
-                utxo['slot-no'] = 0
+            by_address.setdefault(utxo.address, []).append(utxo)
 
-        return utxos
+        return by_address
+
+    def query_utxos_time(self, database: Database, utxos: List[Utxo]) -> List[Utxo]:
+        """
+        Set the block time and slot of each UTXO.  All the transactions are
+        looked up at once.  UTXOs from transactions db-sync has not seen yet
+        are left out, the next pass picks them up once it has caught up.
+
+        @return The UTXOs with a time and slot
+        """
+
+        (times, missing) = database.query_txhash_times(set([utxo.tx_hash for utxo in utxos]))
+        if len(missing) > 0:
+            logger.warning('time and slotno not found for {} tx, skip until db-sync has them'.format(len(missing)))
+
+        found = []
+        for utxo in utxos:
+            if utxo.tx_hash in times:
+                (utxo.time, utxo.slot_no) = times[utxo.tx_hash]
+                found.append(utxo)
+
+        return found
 
     def query_utxos_dict(self,
                          wallet: Wallet,
@@ -190,7 +323,7 @@ class Cardano:
                         txhash: str) -> bool:
         (utxos, lovelace) = self.query_utxos(wallet)
         for utxo in utxos:
-            if utxo['tx-hash'] == txhash:
+            if utxo.tx_hash == txhash:
                 return True
 
         return False
@@ -198,22 +331,22 @@ class Cardano:
     def contains_token(self,
                        wallet,
                        full_token_name) -> bool:
+        key = Utxo.split_full_name(full_token_name)
         (utxos, lovelace) = self.query_utxos(wallet)
         for utxo in utxos:
-            for a in utxo['assets']:
-                if a == full_token_name:
-                    return True
+            if key in utxo.assets:
+                return True
 
         return False
 
     def get_utxo(self,
                  wallet,
-                 full_token_name) -> None:
+                 full_token_name) -> Utxo:
+        key = Utxo.split_full_name(full_token_name)
         (utxos, lovelace) = self.query_utxos(wallet)
         for utxo in utxos:
-            for a in utxo['assets']:
-                if a == full_token_name:
-                    return utxo
+            if key in utxo.assets:
+                return utxo
 
         return None
 
@@ -223,6 +356,42 @@ class Cardano:
         output = Command.run(command, None)
         return output
 
+    @staticmethod
+    def calculate_transaction_id(transaction_file: str) -> str:
+        """
+        Calculate the transaction id without running cardano-cli.  The id is the
+        blake2b-256 hash of the transaction body, the first item of the
+        transaction array.
+
+        @return The transaction id or None if the file is not a transaction this
+                knows how to read.
+        """
+
+        with open(transaction_file, 'r') as file:
+            envelope = json.load(file)
+
+        if not envelope['type'].startswith('Tx '):
+            return None
+
+        transaction = bytes.fromhex(envelope['cborHex'])
+        body = tcr.cbor.array_items(transaction)[0]
+        return hashlib.blake2b(body, digest_size=32).hexdigest()
+
+    @staticmethod
+    def transaction_id_inprocess(command: List[str]) -> str:
+        """
+        In-process handler for 'cardano-cli transaction txid --tx-file <file>'
+        """
+
+        if not '--tx-file' in command:
+            return None
+
+        try:
+            return Cardano.calculate_transaction_id(command[command.index('--tx-file') + 1])
+        except Exception as e:
+            logger.warning('In-process txid failed, {}'.format(e))
+            return None
+
     def calculate_min_required_utxo(self, address, amount, assets):
         minimum = 1000000
         count = assets.count('+')
@@ -243,45 +412,52 @@ class Cardano:
 #
 #        return int(cells[1])
 
-    def create_transfer_transaction_file(self,
-                                         utxo_inputs,
-                                         address_outputs,
-                                         fee_amount,
-                                         transaction_file) -> str:
-        command = ['cardano-cli', 'transaction', 'build-raw']
+    def build_transfer_transaction(self,
+                                   utxo_inputs,
+                                   address_outputs,
+                                   fee_amount) -> Transaction:
+        transaction = Transaction()
 
         for utxo in utxo_inputs:
-            command.append('--tx-in')
-            command.append('{}#{}'.format(utxo['tx-hash'], utxo['tx-ix']))
-
+            transaction.add_input(utxo.tx_hash, utxo.tx_ix)
 
         for address in address_outputs:
-            assets_string = ''
+            assets = {}
             for asset in address['assets']:
                 if address['assets'][asset] > 0:
-                    assets_string += '+{} {}'.format(address['assets'][asset], asset)
+                    assets[asset] = address['assets'][asset]
 
             # Note that if the amount is zero (or just too small) but there is a
             # valid asset in the output then this transaction will fail when
             # it is submitted
-            if address['amount'] > 0 or len(assets_string) > 0:
-                command.append('--tx-out')
-                command.append('{}+{}{}'.format(address['address'], address['amount'], assets_string))
-
-        command.extend(['--fee', '{}'.format(fee_amount),
-                        '--out-file', transaction_file])
+            if address['amount'] > 0 or len(assets) > 0:
+                transaction.add_output(address['address'], address['amount'], assets)
 
-        output = Command.run(command, None)
-        return output
+        transaction.set_fee(fee_amount)
+        return transaction
 
-    def create_mint_nft_transaction_file(self,
-                                         input_utxos,
+    def create_transfer_transaction_file(self,
+                                         utxo_inputs,
                                          address_outputs,
                                          fee_amount,
-                                         policy_name,
-                                         nft_metadata_file,
-                                         transaction_file):
-        nft_metadata = Nft.parse_metadata_file(nft_metadata_file)
+                                         transaction_file) -> Transaction:
+        transaction = self.build_transfer_transaction(utxo_inputs, address_outputs, fee_amount)
+        transaction.write_file(transaction_file)
+        return transaction
+
+    def build_mint_nft_transaction(self,
+                                   input_utxos,
+                                   address_outputs,
+                                   fee_amount,
+                                   policy_name,
+                                   raw_metadata: Dict,
+                                   invalid_hereafter: int = None) -> Tuple[Transaction, Dict]:
+        """
+        @param raw_metadata The transaction metadata, {'721': {...}}
+        @param invalid_hereafter Optional TTL, never later than the policy allows
+        """
+
+        nft_metadata = Nft.parse_metadata(raw_metadata)
         policy_id = nft_metadata['policy-id']
         token_names = nft_metadata['token-names']
 
@@ -296,23 +472,21 @@ class Cardano:
         for item in input_utxos:
             nfts_to_mint += item['count']
         if nfts_to_mint != len(token_names):
-            logger.error('Mint count mismatch {} != {}'.format(len(nfts_to_mint, len(token_names))))
-            raise Exception('Mint count mismatch {} != {}'.format(len(nfts_to_mint, len(token_names))))
+            logger.error('Mint count mismatch {} != {}'.format(nfts_to_mint, len(token_names)))
+            raise Exception('Mint count mismatch {} != {}'.format(nfts_to_mint, len(token_names)))
 
-        mint = ''
+        transaction = Transaction()
         token_index = 0
         address_index = 1 # index 0 is the project wallet so skip it
 
         mint_map = {}
         for item in input_utxos:
             count = item['count']
-            key = item['utxo']['tx-hash']+'#'+str(item['utxo']['tx-ix'])
+            key = item['utxo'].tx_hash+'#'+str(item['utxo'].tx_ix)
             mint_map[key] = {}
             for i in range(0, count):
-                if len(mint) > 0:
-                    mint += '+'
                 full_name = '{}.{}'.format(policy_id, token_names[token_index])
-                mint += '1 {}'.format(full_name)
+                transaction.add_mint(full_name, 1)
                 # add the nft being minted to the output
                 address_outputs[address_index]['assets'][full_name] = 1
                 logger.debug('Mint {} to {}'.format(token_names[token_index], address_outputs[address_index]['address']))
@@ -324,48 +498,50 @@ class Cardano:
                 token_index += 1
             address_index += 1
 
-        invalid_hereafter = 0
-        with open('policy/{}/{}.script'.format(self.network, policy_name), "r") as file:
-            script = json.loads(file.read())
-            for s in script['scripts']:
-                if s['type'] == 'before':
-                    invalid_hereafter = s['slot']
-
-        command = ['cardano-cli', 'transaction', 'build-raw', '--fee', '{}'.format(fee_amount)]
-
         for item in input_utxos:
-            command.append('--tx-in')
-            command.append('{}#{}'.format(item['utxo']['tx-hash'], item['utxo']['tx-ix']))
+            transaction.add_input(item['utxo'].tx_hash, item['utxo'].tx_ix)
 
         for address in address_outputs:
-            assets_string = ''
-            for asset in address['assets']:
-                assets_string += '+{} {}'.format(address['assets'][asset], asset)
-
             # Note that if the amount is zero (or just too small) but there is a
             # valid asset in the output then this transaction will fail when
             # it is submitted
-            if address['amount'] > 0 or len(assets_string) > 0:
-                command.append('--tx-out')
-                command.append('{}+{}{}'.format(address['address'], address['amount'], assets_string))
-
-        command.extend(['--mint={}'.format(mint),
-                        '--mint-script-file', 'policy/{}/{}.script'.format(self.network, policy_name),
-                        '--metadata-json-file', nft_metadata_file,
-                        '--invalid-hereafter', '{}'.format(invalid_hereafter),
-                        '--out-file', transaction_file])
-
-        output = Command.run(command, None)
-        return (output, mint_map)
+            if address['amount'] > 0 or len(address['assets']) > 0:
+                transaction.add_output(address['address'], address['amount'], address['assets'])
+
+        script = self.get_policy_script(policy_name)
+        policy_before = Cardano.get_invalid_hereafter(script)
+        if invalid_hereafter == None or invalid_hereafter > policy_before:
+            invalid_hereafter = policy_before
+        transaction.set_fee(fee_amount)
+        transaction.add_script(script)
+        transaction.set_metadata(raw_metadata)
+        transaction.set_invalid_hereafter(invalid_hereafter)
+        return (transaction, mint_map)
 
-    def create_mint_royalty_token_transaction_file(self,
-                                                   input_utxo,
-                                                   output_address,
-                                                   fee_amount,
-                                                   policy_name,
-                                                   nft_metadata_file,
-                                                   transaction_file):
-        nft_metadata = Nft.parse_metadata_file(nft_metadata_file)
+    def create_mint_nft_transaction_file(self,
+                                         input_utxos,
+                                         address_outputs,
+                                         fee_amount,
+                                         policy_name,
+                                         raw_metadata: Dict,
+                                         transaction_file,
+                                         invalid_hereafter: int = None):
+        (transaction, mint_map) = self.build_mint_nft_transaction(input_utxos,
+                                                                  address_outputs,
+                                                                  fee_amount,
+                                                                  policy_name,
+                                                                  raw_metadata,
+                                                                  invalid_hereafter)
+        transaction.write_file(transaction_file)
+        return (transaction, mint_map)
+
+    def build_mint_royalty_token_transaction(self,
+                                             input_utxo,
+                                             output_address,
+                                             fee_amount,
+                                             policy_name,
+                                             raw_metadata: Dict) -> Transaction:
+        nft_metadata = Nft.parse_metadata(raw_metadata)
         if nft_metadata['policy-id'] != '777':
             logger.error('Unexpected policy-id: {}'.format(nft_metadata['policy-id']))
             raise Exception('Unexpected policy-id: {}'.format(nft_metadata['policy-id']))
@@ -375,39 +551,38 @@ class Cardano:
             raise Exception('too many tokens for royalty token: {}'.format(len(nft_metadata['token-names'])))
 
         policy_id = self.get_policy_id(policy_name)
-        token_names = nft_metadata['token-names']
-
-        mint = '1 {}'.format(policy_id)
-
-        invalid_hereafter = 0
-        with open('policy/{}/{}.script'.format(self.network, policy_name), "r") as file:
-            script = json.loads(file.read())
-            for s in script['scripts']:
-                if s['type'] == 'before':
-                    invalid_hereafter = s['slot']
-
-        command = ['cardano-cli', 'transaction', 'build-raw', '--fee', '{}'.format(fee_amount)]
+        script = self.get_policy_script(policy_name)
+
+        transaction = Transaction()
+        transaction.add_input(input_utxo.tx_hash, input_utxo.tx_ix)
+        transaction.add_output(output_address, input_utxo.amount - fee_amount, {policy_id: 1})
+        transaction.add_mint(policy_id, 1)
+        transaction.set_fee(fee_amount)
+        transaction.add_script(script)
+        transaction.set_metadata(raw_metadata)
+        transaction.set_invalid_hereafter(Cardano.get_invalid_hereafter(script))
+        return transaction
 
-        command.append('--tx-in')
-        command.append('{}#{}'.format(input_utxo['tx-hash'], input_utxo['tx-ix']))
-
-        command.append('--tx-out')
-        command.append('{}+{}+{}'.format(output_address, input_utxo['amount'] - fee_amount, mint))
-
-        command.extend(['--mint={}'.format(mint),
-                        '--mint-script-file', 'policy/{}/{}.script'.format(self.network, policy_name),
-                        '--metadata-json-file', nft_metadata_file,
-                        '--invalid-hereafter', '{}'.format(invalid_hereafter),
-                        '--out-file', transaction_file])
-
-        output = Command.run(command, None)
-        return output
+    def create_mint_royalty_token_transaction_file(self,
+                                                   input_utxo,
+                                                   output_address,
+                                                   fee_amount,
+                                                   policy_name,
+                                                   raw_metadata: Dict,
+                                                   transaction_file):
+        transaction = self.build_mint_royalty_token_transaction(input_utxo,
+                                                                output_address,
+                                                                fee_amount,
+                                                                policy_name,
+                                                                raw_metadata)
+        transaction.write_file(transaction_file)
+        return transaction
 
     def calculate_min_required_utxo_mint(self,
                                          input_utxos: List,
                                          address_outputs: List,
-                                         nft_metadata_file: str):
-        nft_metadata = Nft.parse_metadata_file(nft_metadata_file)
+                                         raw_metadata: Dict):
+        nft_metadata = Nft.parse_metadata(raw_metadata)
         policy_id = nft_metadata['policy-id']
         token_names = nft_metadata['token-names']
 
@@ -422,8 +597,8 @@ class Cardano:
         for item in input_utxos:
             nfts_to_mint += item['count']
         if nfts_to_mint != len(token_names):
-            logger.error('Mint count mismatch {} != {}'.format(len(nfts_to_mint, len(token_names))))
-            raise Exception('Mint count mismatch {} != {}'.format(len(nfts_to_mint, len(token_names))))
+            logger.error('Mint count mismatch {} != {}'.format(nfts_to_mint, len(token_names)))
+            raise Exception('Mint count mismatch {} != {}'.format(nfts_to_mint, len(token_names)))
 
         token_index = 0
         address_index = 1 # index 0 is the project wallet so skip it
@@ -448,66 +623,76 @@ class Cardano:
         return True
 
     # burning is just like minting except the value is negative
-    def create_burn_nft_transaction_file(self,
-                                         utxo_inputs: List,
-                                         address_outputs: List[Dict],
-                                         fee_amount: int,
-                                         policy_name: str,
-                                         token_names: str,
-                                         nft_token_amount: int,
-                                         transaction_file: str) -> str:
+    def build_burn_nft_transaction(self,
+                                   utxo_inputs: List,
+                                   address_outputs: List[Dict],
+                                   fee_amount: int,
+                                   policy_name: str,
+                                   token_names: str,
+                                   nft_token_amount: int) -> Transaction:
         # copy some stuff so it doesn't get modified to the caller
         address_outputs_cp = copy.deepcopy(address_outputs)
 
+        transaction = Transaction()
         policy_id = self.get_policy_id(policy_name)
-        burn = ''
         for token_name in token_names:
-            if len(burn) == 0:
-                burn += '{} {}.{}'.format(-1*nft_token_amount, policy_id, token_name)
-            else:
-                burn += '+{} {}.{}'.format(-1*nft_token_amount, policy_id, token_name)
             # remove the nft being burned from the output
             if token_name == '':
                 # special case for royalty tokens
                 full_name = policy_id
             else:
                 full_name = '{}.{}'.format(policy_id, token_name)
+            transaction.add_mint(full_name, -1*nft_token_amount)
             index = len(address_outputs_cp)-1
             address_outputs_cp[index]['assets'][full_name] -= nft_token_amount
 
-        invalid_hereafter = 0
-        with open('policy/{}/{}.script'.format(self.network, policy_name), "r") as file:
-            script = json.loads(file.read())
-            for s in script['scripts']:
-                if s['type'] == 'before':
-                    invalid_hereafter = s['slot']
-
-        command = ['cardano-cli', 'transaction', 'build-raw', '--fee', '{}'.format(fee_amount)]
-
         for utxo in utxo_inputs:
-            command.append('--tx-in')
-            command.append('{}#{}'.format(utxo['tx-hash'], utxo['tx-ix']))
+            transaction.add_input(utxo.tx_hash, utxo.tx_ix)
 
         for address in address_outputs_cp:
-            assets_string = ''
+            assets = {}
             for asset in address['assets']:
                 if address['assets'][asset] != 0:
-                    assets_string += '+{} {}'.format(address['assets'][asset], asset)
+                    assets[asset] = address['assets'][asset]
 
             # Note that if the amount is zero (or just too small) but there is a
             # valid asset in the output then this transaction will fail when
             # it is submitted
-            if address['amount'] > 0 or len(assets_string) > 0:
-                command.append('--tx-out')
-                command.append('{}+{}{}'.format(address['address'], address['amount'], assets_string))
+            if address['amount'] > 0 or len(assets) > 0:
+                transaction.add_output(address['address'], address['amount'], assets)
 
-        command.extend(['--mint={}'.format(burn),
-                        '--mint-script-file', 'policy/{}/{}.script'.format(self.network, policy_name),
-                        '--invalid-hereafter', '{}'.format(invalid_hereafter),
-                        '--out-file', transaction_file])
+        script = self.get_policy_script(policy_name)
+        transaction.set_fee(fee_amount)
+        transaction.add_script(script)
+        transaction.set_invalid_hereafter(Cardano.get_invalid_hereafter(script))
+        return transaction
 
-        output = Command.run(command, None)
-        return output
+    def create_burn_nft_transaction_file(self,
+                                         utxo_inputs: List,
+                                         address_outputs: List[Dict],
+                                         fee_amount: int,
+                                         policy_name: str,
+                                         token_names: str,
+                                         nft_token_amount: int,
+                                         transaction_file: str) -> Transaction:
+        transaction = self.build_burn_nft_transaction(utxo_inputs,
+                                                      address_outputs,
+                                                      fee_amount,
+                                                      policy_name,
+                                                      token_names,
+                                                      nft_token_amount)
+        transaction.write_file(transaction_file)
+        return transaction
+
+    def calculate_transaction_fee(self,
+                                  transaction: Transaction,
+                                  witness_count: int) -> int:
+        """
+        Calculate the minimum fee of a transaction built in memory from the
+        protocol parameters.  No cardano-cli process or draft file needed.
+        """
+
+        return transaction.calculate_min_fee(self.protocol_parameters, witness_count)
 
     def calculate_min_fee(self,
                           transaction_file: str,
@@ -527,7 +712,7 @@ class Cardano:
                          unsigned_transaction_file: str,
                          signing_key_file: List[str],
                          signed_transaction_file: str) -> str:
-        command = ['cardano-cli', 'transaction', 'sign', '--tx-body-file', unsigned_transaction_file]
+        command = ['cardano-cli', 'transaction', 'sign', '--tx-file', unsigned_transaction_file]
         for file in signing_key_file:
             command.extend(['--signing-key-file', file])
         command.extend(['--out-file', signed_transaction_file])
@@ -598,6 +783,24 @@ class Cardano:
 
         return output
 
+    def get_policy(self, policy_name: str) -> Policy:
+        """
+        The policy files, cached until one of them changes.
+        """
+
+        return self.policies.get(policy_name)
+
+    def get_policy_script(self, policy_name: str) -> Dict:
+        script = self.get_policy(policy_name).script
+        if script == None:
+            logger.error('Policy script not found: {}'.format(policy_name))
+            raise Exception('Policy script not found: {}'.format(policy_name))
+        return script
+
+    @staticmethod
+    def get_invalid_hereafter(script: Dict) -> int:
+        return tcr.policy.get_invalid_hereafter(script)
+
     def get_policy_verification_key_file(self, policy_name) -> str:
         file_name = 'policy/{}/{}.vkey'.format(self.network, policy_name)
         return file_name
@@ -608,24 +811,10 @@ class Cardano:
 
     def get_policy_id(self,
                       policy_name: str) -> str:
-        policy_id = None
-
-        try:
-            with open('policy/{}/{}.id'.format(self.network, policy_name), 'r') as file:
-                policy_id = file.read()
-        except FileNotFoundError as e:
-            policy_id = None
-
-        return policy_id
+        return self.get_policy(policy_name).policy_id
 
     def get_policy_owner(self,
                          policy_name: str) -> str:
-        policy_owner = None
-
-        try:
-            with open('policy/{}/{}.owner'.format(self.network, policy_name), 'r') as file:
-                policy_owner = file.read()
-        except FileNotFoundError as e:
-            policy_owner = None
+        return self.get_policy(policy_name).owner
 
-        return policy_owner
+Command.register_inprocess('cardano-cli transaction txid', Cardano.transaction_id_inprocess)
@@ -0,0 +1,162 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+File: cbor.py
+Author: SuperKK
+
+Minimal CBOR (RFC 8949) helpers.  Just enough to work with the cborHex
+payloads cardano-cli writes into its text envelope files.
+"""
+
+MAJOR_UNSIGNED = 0
+MAJOR_NEGATIVE = 1
+MAJOR_BYTES = 2
+MAJOR_TEXT = 3
+MAJOR_ARRAY = 4
+MAJOR_MAP = 5
+MAJOR_TAG = 6
+MAJOR_SIMPLE = 7
+
+BREAK = 0xff
+
+def read_head(data: bytes, offset: int):
+    """
+    Read the head of the item at offset.
+
+    @return (major type, argument, offset of the item content).  The argument is
+            None for indefinite length items.
+    """
+
+    if offset >= len(data):
+        raise Exception('CBOR, Unexpected end of data at {}'.format(offset))
+
+    initial = data[offset]
+    major = initial >> 5
+    info = initial & 0x1f
+    offset += 1
+
+    if info < 24:
+        return (major, info, offset)
+    elif info < 28:
+        size = 1 << (info - 24)
+        if offset + size > len(data):
+            raise Exception('CBOR, Unexpected end of data at {}'.format(offset))
+        return (major, int.from_bytes(data[offset:offset+size], 'big'), offset + size)
+    elif info == 31 and major in (MAJOR_BYTES, MAJOR_TEXT, MAJOR_ARRAY, MAJOR_MAP):
+        return (major, None, offset)
+
+    raise Exception('CBOR, Invalid additional info {} at {}'.format(info, offset-1))
+
+def item_end(data: bytes, offset: int = 0) -> int:
+    """
+    Find the end of the CBOR data item starting at offset without decoding it.
+
+    @return The offset of the first byte after the item.
+    """
+
+    (major, argument, offset) = read_head(data, offset)
+
+    if major in (MAJOR_UNSIGNED, MAJOR_NEGATIVE, MAJOR_SIMPLE):
+        return offset
+    elif major in (MAJOR_BYTES, MAJOR_TEXT):
+        if argument != None:
+            return offset + argument
+        # indefinite length string, a series of definite length chunks
+        while data[offset] != BREAK:
+            offset = item_end(data, offset)
+        return offset + 1
+    elif major == MAJOR_TAG:
+        return item_end(data, offset)
+
+    # arrays and maps
+    if argument == None:
+        while data[offset] != BREAK:
+            offset = item_end(data, offset)
+        return offset + 1
+
+    count = argument if major == MAJOR_ARRAY else 2 * argument
+    for i in range(0, count):
+        offset = item_end(data, offset)
+    return offset
+
+def array_items(data: bytes, offset: int = 0) -> list:
+    """
+    Split the CBOR array starting at offset into the raw bytes of each item.
+    """
+
+    (major, argument, offset) = read_head(data, offset)
+    if major != MAJOR_ARRAY:
+        raise Exception('CBOR, Expected array, got major type {}'.format(major))
+
+    items = []
+    while (argument == None and data[offset] != BREAK) or (argument != None and len(items) < argument):
+        end = item_end(data, offset)
+        items.append(data[offset:end])
+        offset = end
+
+    return items
+
+def encode_head(major: int, argument: int) -> bytes:
+    if argument < 24:
+        return bytes([(major << 5) | argument])
+    elif argument < 0x100:
+        return bytes([(major << 5) | 24]) + argument.to_bytes(1, 'big')
+    elif argument < 0x10000:
+        return bytes([(major << 5) | 25]) + argument.to_bytes(2, 'big')
+    elif argument < 0x100000000:
+        return bytes([(major << 5) | 26]) + argument.to_bytes(4, 'big')
+    elif argument < 0x10000000000000000:
+        return bytes([(major << 5) | 27]) + argument.to_bytes(8, 'big')
+
+    raise Exception('CBOR, Integer too large: {}'.format(argument))
+
+def encode(value) -> bytes:
+    """
+    Encode a python value as CBOR.  Supports int, bytes, str, list, tuple, dict,
+    bool and None.  Dictionaries are encoded in insertion order.
+    """
+
+    if value is True:
+        return b'\xf5'
+    elif value is False:
+        return b'\xf4'
+    elif value is None:
+        return b'\xf6'
+    elif isinstance(value, int):
+        if value >= 0:
+            return encode_head(MAJOR_UNSIGNED, value)
+        return encode_head(MAJOR_NEGATIVE, -1 - value)
+    elif isinstance(value, (bytes, bytearray)):
+        return encode_head(MAJOR_BYTES, len(value)) + bytes(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        return encode_head(MAJOR_TEXT, len(data)) + data
+    elif isinstance(value, (list, tuple)):
+        return encode_head(MAJOR_ARRAY, len(value)) + b''.join([encode(item) for item in value])
+    elif isinstance(value, dict):
+        encoded = [encode(k) + encode(value[k]) for k in value]
+        return encode_head(MAJOR_MAP, len(value)) + b''.join(encoded)
+
+    raise Exception('CBOR, Unsupported type: {}'.format(type(value)))
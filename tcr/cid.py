@@ -0,0 +1,182 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: cid.py
+Author: SuperKK
+
+Calculate the IPFS CID of a file locally, the same as 'ipfs add' with the
+default options: 256 KiB chunks in a balanced DAG with up to 174 links per
+node.  CIDv0 wraps every chunk in a UnixFS dag-pb node.  CIDv1, like
+'ipfs add --cid-version=1', uses raw leaves.
+"""
+
+from typing import List, Tuple
+import base64
+import hashlib
+
+CHUNK_SIZE = 262144
+MAX_LINKS = 174
+
+CODEC_RAW = 0x55
+CODEC_DAG_PB = 0x70
+MULTIHASH_SHA2_256 = 0x12
+
+UNIXFS_FILE = 2
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+def encode_varint(value: int) -> bytes:
+    data = bytearray()
+    while value >= 0x80:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+def encode_bytes(field: int, value: bytes) -> bytes:
+    return encode_varint((field << 3) | 2) + encode_varint(len(value)) + value
+
+def encode_uint(field: int, value: int) -> bytes:
+    return encode_varint(field << 3) + encode_varint(value)
+
+def base58_encode(data: bytes) -> str:
+    value = int.from_bytes(data, 'big')
+    encoded = ''
+    while value > 0:
+        (value, remainder) = divmod(value, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+
+    leading_zeros = len(data) - len(data.lstrip(b'\0'))
+    return BASE58_ALPHABET[0] * leading_zeros + encoded
+
+def get_multihash(block: bytes) -> bytes:
+    return bytes([MULTIHASH_SHA2_256, 32]) + hashlib.sha256(block).digest()
+
+def encode_unixfs(data: bytes, filesize: int, blocksizes: List[int]) -> bytes:
+    unixfs = encode_uint(1, UNIXFS_FILE)
+    if data != None:
+        unixfs += encode_bytes(2, data)
+    unixfs += encode_uint(3, filesize)
+    for blocksize in blocksizes:
+        unixfs += encode_uint(4, blocksize)
+    return unixfs
+
+def encode_node(links: List[Tuple[bytes, int]], unixfs: bytes) -> bytes:
+    """
+    dag-pb node, links are encoded before the data.
+
+    @param links [(cid bytes, cumulative size), ...]
+    """
+
+    node = b''
+    for (cid, tsize) in links:
+        link = encode_bytes(1, cid) + encode_bytes(2, b'') + encode_uint(3, tsize)
+        node += encode_bytes(2, link)
+    return node + encode_bytes(1, unixfs)
+
+class CidBuilder:
+    """
+    Feed the content of a file and calculate its CID.
+    """
+
+    def __init__(self, version: int = 0):
+        if version not in [0, 1]:
+            raise Exception('Unsupported CID version: {}'.format(version))
+
+        self.version = version
+        self.buffer = b''
+        # Each leaf is (cid bytes, cumulative size, file size)
+        self.leaves = []
+        self.leaf_block = None
+
+    def get_cid(self, codec: int, block: bytes) -> bytes:
+        if self.version == 0:
+            return get_multihash(block)
+        return encode_varint(1) + encode_varint(codec) + get_multihash(block)
+
+    def add_leaf(self, chunk: bytes) -> None:
+        if self.version == 0:
+            # An empty file has no data field at all
+            block = encode_node([], encode_unixfs(chunk if len(chunk) > 0 else None, len(chunk), []))
+            codec = CODEC_DAG_PB
+        else:
+            block = chunk
+            codec = CODEC_RAW
+
+        self.leaves.append((self.get_cid(codec, block), len(block), len(chunk)))
+        self.leaf_block = block
+
+    def update(self, data: bytes) -> None:
+        self.buffer += data
+        while len(self.buffer) >= CHUNK_SIZE:
+            self.add_leaf(self.buffer[:CHUNK_SIZE])
+            self.buffer = self.buffer[CHUNK_SIZE:]
+
+    def digest(self) -> bytes:
+        """
+        @return The binary CID of all the content
+        """
+
+        if len(self.buffer) > 0 or len(self.leaves) == 0:
+            self.add_leaf(self.buffer)
+            self.buffer = b''
+
+        # Group each level into parents until there is a single root
+        level = self.leaves
+        while len(level) > 1:
+            parents = []
+            for start in range(0, len(level), MAX_LINKS):
+                children = level[start:start + MAX_LINKS]
+                filesize = sum([child[2] for child in children])
+                unixfs = encode_unixfs(None, filesize, [child[2] for child in children])
+                block = encode_node([(child[0], child[1]) for child in children], unixfs)
+                tsize = len(block) + sum([child[1] for child in children])
+                parents.append((self.get_cid(CODEC_DAG_PB, block), tsize, filesize))
+            level = parents
+
+        return level[0][0]
+
+    def hexdigest(self) -> str:
+        """
+        @return The CID as text, base58 for CIDv0 and base32 for CIDv1
+        """
+
+        cid = self.digest()
+        if self.version == 0:
+            return base58_encode(cid)
+        return 'b' + base64.b32encode(cid).decode('ascii').lower().rstrip('=')
+
+def calc_cid(data: bytes, version: int = 0) -> str:
+    builder = CidBuilder(version)
+    builder.update(data)
+    return builder.hexdigest()
+
+def calc_file_cid(filename: str, version: int = 0) -> str:
+    builder = CidBuilder(version)
+    with open(filename, 'rb') as file:
+        buf = file.read(CHUNK_SIZE)
+        while len(buf) > 0:
+            builder.update(buf)
+            buf = file.read(CHUNK_SIZE)
+    return builder.hexdigest()
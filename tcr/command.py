@@ -25,8 +25,12 @@ File: command.py
 Author: SuperKK
 """
 
-from typing import List
+from typing import Callable, Dict, List
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 import subprocess
+import threading
+import time
 import os
 import logging
 
@@ -41,6 +45,9 @@ node_socket_env = {
     'active': 'CARDANO_NODE_SOCKET_PATH'
 }
 
+# Maximum number of command processes allowed to run at the same time
+DEFAULT_MAX_WORKERS = 4
+
 logger = logging.getLogger('command')
 
 class Command:
@@ -50,8 +57,101 @@ class Command:
     Sets the environment variables based on which network is being used.
     Valid networks are 'testnet' and 'mainnet' defined in the networks
     dictionary object above.
+
+    Commands run through a shared pool.  The number of processes running at
+    once is bounded by max_workers, the time spent in each command is recorded
+    and commands that are pure functions of their input files can be answered
+    in-process by a registered handler instead of spawning a process.
     """
 
+    max_workers = DEFAULT_MAX_WORKERS
+    use_inprocess = True
+    executor = None
+    semaphore = threading.BoundedSemaphore(DEFAULT_MAX_WORKERS)
+    inprocess_handlers = {}
+    timings = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def set_max_workers(max_workers: int) -> None:
+        """
+        Set the maximum number of command processes that may run concurrently.
+        """
+
+        if max_workers < 1:
+            raise Exception('Invalid max workers: {}'.format(max_workers))
+
+        with Command.lock:
+            if Command.executor != None:
+                Command.executor.shutdown(wait=True)
+                Command.executor = None
+            Command.max_workers = max_workers
+            Command.semaphore = threading.BoundedSemaphore(max_workers)
+
+    @staticmethod
+    def get_executor() -> ThreadPoolExecutor:
+        with Command.lock:
+            if Command.executor == None:
+                Command.executor = ThreadPoolExecutor(max_workers=Command.max_workers,
+                                                      thread_name_prefix='command')
+            return Command.executor
+
+    @staticmethod
+    def register_inprocess(name: str, handler: Callable[[List[str]], str]) -> None:
+        """
+        Register a handler to run a command in-process.
+
+        @param name The command and sub commands, e.g. 'cardano-cli transaction txid'
+        @param handler Called with the command list.  Returns the command output or
+                       None to fall back to running the real command.
+        """
+
+        Command.inprocess_handlers[name] = handler
+
+    @staticmethod
+    def get_command_name(command: List[str]) -> str:
+        """
+        The name used for timings and in-process handlers.  The executable plus
+        the first two sub commands.
+        """
+
+        return ' '.join([c for c in command[0:3] if not c.startswith('-')])
+
+    @staticmethod
+    def record_timing(name: str, elapsed: float) -> None:
+        with Command.lock:
+            if not name in Command.timings:
+                Command.timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0}
+            timing = Command.timings[name]
+            timing['count'] += 1
+            timing['total'] += elapsed
+            if elapsed > timing['max']:
+                timing['max'] = elapsed
+
+    @staticmethod
+    def get_timings() -> Dict:
+        """
+        Return a copy of the timings, {name: {'count', 'total', 'max'}} in seconds.
+        """
+
+        with Command.lock:
+            return {name: dict(Command.timings[name]) for name in Command.timings}
+
+    @staticmethod
+    def reset_timings() -> None:
+        with Command.lock:
+            Command.timings = {}
+
+    @staticmethod
+    def log_timings() -> None:
+        timings = Command.get_timings()
+        for name in sorted(timings):
+            timing = timings[name]
+            logger.debug('Timing: {}, count = {}, avg = {:.3f}s, max = {:.3f}s'.format(name,
+                                                                                     timing['count'],
+                                                                                     timing['total'] / timing['count'],
+                                                                                     timing['max']))
+
     @staticmethod
     def write_to_file(filename, data):
         """
@@ -77,20 +177,32 @@ class Command:
         logger.debug(cmdstr)
 
     @staticmethod
-    def run_generic(command: List[str]):
-        Command.print_command(command)
+    def run_process(command: List[str], input: str = None, env: Dict = None) -> str:
+        """
+        Run the command as a new process, bounded by the pool size and timed.
+        """
 
+        name = Command.get_command_name(command)
+        start = time.perf_counter()
         try:
-            completed = subprocess.run(command, check=True, capture_output=True, text=True)
+            with Command.semaphore:
+                completed = subprocess.run(command, check=True, capture_output=True, text=True, input=input, env=env)
         except subprocess.CalledProcessError as e:
             logger.error('{}, return code: {}'.format(command[0], e.returncode))
             logger.error('output: {}'.format(e.output))
             logger.error('stdout: {}'.format(e.stdout))
             logger.error('stderr: {}'.format(e.stderr))
             raise e
+        finally:
+            Command.record_timing(name, time.perf_counter() - start)
 
         return completed.stdout.strip('\r\n')
 
+    @staticmethod
+    def run_generic(command: List[str]):
+        Command.print_command(command)
+        return Command.run_process(command)
+
     @staticmethod
     def run(command: List[str], network: str, input: str = None):
         """
@@ -113,13 +225,39 @@ class Command:
             logger.debug('\tinput: {}'.format(input))
         else:
             logger.debug('\tinput: None')
-        try:
-            completed = subprocess.run(command, check=True, capture_output=True, text=True, input=input, env=envvars)
-        except subprocess.CalledProcessError as e:
-            logger.error('{}, return code: {}'.format(command[0], e.returncode))
-            logger.error('output: {}'.format(e.output))
-            logger.error('stdout: {}'.format(e.stdout))
-            logger.error('stderr: {}'.format(e.stderr))
-            raise e
 
-        return completed.stdout.strip('\r\n')
+        name = Command.get_command_name(command)
+        if Command.use_inprocess and name in Command.inprocess_handlers:
+            start = time.perf_counter()
+            output = Command.inprocess_handlers[name](command)
+            if output != None:
+                Command.record_timing('{} (in-process)'.format(name), time.perf_counter() - start)
+                return output
+            logger.debug('\tin-process handler declined, run command')
+
+        return Command.run_process(command, input=input, env=envvars)
+
+    @staticmethod
+    def submit(command: List[str], network: str, input: str = None) -> Future:
+        """
+        Run the specified command on the pool without waiting for it.
+
+        @see Command.run
+        @return A Future for the command output.
+        """
+
+        return Command.get_executor().submit(Command.run, command, network, input)
+
+    @staticmethod
+    def run_many(commands: List[List[str]], network: str) -> List[str]:
+        """
+        Run several independent commands concurrently on the pool.
+
+        @return The output of each command in the same order as commands.
+        """
+
+        if len(commands) == 1:
+            return [Command.run(commands[0], network)]
+
+        futures = [Command.submit(command, network) for command in commands]
+        return [future.result() for future in futures]
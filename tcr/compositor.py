@@ -0,0 +1,167 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: compositor.py
+Author: SuperKK
+
+Compose NFT images from layer images with Pillow.  Replaces running an
+ImageMagick convert process per image.
+"""
+
+from typing import Dict, Iterator, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import collections
+import functools
+import hashlib
+import io
+import logging
+import os
+
+from PIL import Image
+
+import tcr.phash
+
+logger = logging.getLogger('compositor')
+
+# Decoded layers kept by each worker process.  Layers are cropped to the
+# visible area before they are cached.
+LAYER_CACHE_SIZE = 256
+
+@functools.lru_cache(maxsize=LAYER_CACHE_SIZE)
+def load_layer(path: str) -> Tuple[Image.Image, int, int]:
+    """
+    Decode a layer image once.
+
+    @return (image cropped to its non transparent area, crop x, crop y)
+    """
+
+    with Image.open(path) as im:
+        layer = im.convert('RGBA')
+
+    # Empty layers have no bounding box and are skipped entirely
+    bbox = layer.getchannel('A').getbbox()
+    if bbox == None:
+        return (None, 0, 0)
+
+    if bbox != (0, 0) + layer.size:
+        layer = layer.crop(bbox)
+
+    return (layer, bbox[0], bbox[1])
+
+@functools.lru_cache(maxsize=LAYER_CACHE_SIZE)
+def get_size(path: str) -> Tuple[int, int]:
+    with Image.open(path) as im:
+        return im.size
+
+def composite(canvas: Image.Image, layer: Image.Image, x: int, y: int) -> None:
+    """
+    Alpha blend layer onto canvas at x, y.  Parts of the layer outside of the
+    canvas are clipped.
+    """
+
+    source_x = max(0, -x)
+    source_y = max(0, -y)
+    if source_x >= layer.width or source_y >= layer.height:
+        return
+
+    canvas.alpha_composite(layer, dest=(max(0, x), max(0, y)), source=(source_x, source_y))
+
+def get_resize(size: Tuple[int, int], resize: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    The size to fit inside resize keeping the aspect ratio, the same as the
+    ImageMagick -resize WxH option.
+    """
+
+    scale = min(resize[0] / size[0], resize[1] / size[1])
+    return (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+
+def compose_image(layers: List[Tuple[str, int, int]], resize: Tuple[int, int] = None) -> Image.Image:
+    """
+    Compose layers bottom to top.  The canvas is the size of the first layer.
+
+    @param layers [(image file, offset x, offset y), ...]
+    @param resize Optional (width, height) to fit the result into
+    """
+
+    canvas = Image.new('RGBA', get_size(layers[0][0]), (0, 0, 0, 0))
+    for (path, offset_x, offset_y) in layers:
+        (layer, crop_x, crop_y) = load_layer(path)
+        if layer != None:
+            composite(canvas, layer, offset_x + crop_x, offset_y + crop_y)
+
+    if resize != None:
+        size = get_resize(canvas.size, resize)
+        if size != canvas.size:
+            canvas = canvas.resize(size, Image.LANCZOS)
+
+    return canvas
+
+def compose(job: Dict) -> Tuple[bytes, str, int]:
+    """
+    Compose one image and encode it as PNG.  The hashes are calculated in
+    memory so the file never needs to be read back.
+
+    @param job {'layers': [(image file, offset x, offset y), ...], 'resize': (width, height) or None}
+    @return (png bytes, sha256 hex digest of the png, perceptual hash of the image)
+    """
+
+    image = compose_image(job['layers'], job.get('resize'))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    data = buffer.getvalue()
+    return (data, hashlib.sha256(data).hexdigest(), tcr.phash.dhash(image))
+
+class Compositor:
+    """
+    Compose images in a pool of worker processes.  Each worker keeps its own
+    cache of decoded layers.
+    """
+
+    def __init__(self, max_workers: int = None):
+        if max_workers == None:
+            max_workers = os.cpu_count()
+        self.max_workers = max_workers
+
+    def compose_all(self, jobs: List[Dict]) -> Iterator[Tuple[bytes, str, int]]:
+        """
+        Compose every job.  Results are returned in the same order as jobs.
+        Only a few jobs per worker are in flight so finished images do not
+        pile up in memory while an earlier one is still being composed.
+        """
+
+        if self.max_workers <= 1:
+            for job in jobs:
+                yield compose(job)
+            return
+
+        window = self.max_workers * 4
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = collections.deque()
+            for job in jobs:
+                pending.append(executor.submit(compose, job))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+
+            while len(pending) > 0:
+                yield pending.popleft().result()
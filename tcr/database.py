@@ -25,33 +25,321 @@ File: database.py
 Author: SuperKK
 """
 
-from typing import Dict
+from typing import Dict, List, Set, Tuple
 from configparser import ConfigParser
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import contextlib
 import logging
 import binascii
+import select
+import threading
+import time
+from tcr.utxo import Utxo
 
 logger = logging.getLogger('database')
 
+# Channel used to notify listeners when db-sync inserts a new block
+BLOCK_NOTIFY_CHANNEL = 'tcr_new_block'
+
+# Connections kept open in the pool, enough for a few threads to share
+DEFAULT_MAX_CONNECTIONS = 4
+
+# Queries run on every poll are prepared once per connection so Postgres
+# does not plan them again each time.  name: (parameter types, sql)
+PREPARED_STATEMENTS = {
+    'tcr_utxo_inputs': ('bytea',
+                        'select tx_out.address, tx_out.value from tx_out '
+                        'inner join tx_in on tx_out.tx_id = tx_in.tx_out_id '
+                        'inner join tx    on tx.id = tx_in.tx_in_id and tx_in.tx_out_index = tx_out.index '
+                        'where tx.hash = $1'),
+    'tcr_txhash_time': ('bytea',
+                        'select block.time, block.slot_no from tx '
+                        'inner join block on tx.block_id = block.id '
+                        'where tx.hash = $1'),
+    'tcr_txhash_times': ('bytea[]',
+                         'select tx.hash, block.time, block.slot_no from tx '
+                         'inner join block on tx.block_id = block.id '
+                         'where tx.hash = any($1)'),
+    'tcr_stake_address': ('varchar',
+                          'select stake_address.id as stake_address_id, tx_out.address, stake_address.view as stake_address '
+                          'from tx_out inner join stake_address on tx_out.stake_address_id = stake_address.id '
+                          'where address = $1 limit 1'),
+    'tcr_utxo_inputs_by_txids': ('bytea[]',
+                                 'select tx.hash, tx_out.address, tx_out.value from tx_out '
+                                 'inner join tx_in on tx_out.tx_id = tx_in.tx_out_id '
+                                 'inner join tx    on tx.id = tx_in.tx_in_id and tx_in.tx_out_index = tx_out.index '
+                                 'where tx.hash = any($1) '
+                                 'order by tx.hash, tx_in.id'),
+    'tcr_stake_addresses': ('varchar[]',
+                            'select distinct on (tx_out.address) tx_out.address, stake_address.view from tx_out '
+                            'inner join stake_address on tx_out.stake_address_id = stake_address.id '
+                            'where tx_out.address = any($1)'),
+    'tcr_owners_by_fingerprints': ('varchar[]',
+                                   'select distinct on (multi_asset.fingerprint) multi_asset.fingerprint, stake_address.view from ma_tx_out '
+                                   'inner join tx_out on ma_tx_out.tx_out_id = tx_out.id '
+                                   'inner join tx on tx_out.tx_id = tx.id '
+                                   'inner join block on tx.block_id = block.id '
+                                   'inner join stake_address on tx_out.stake_address_id = stake_address.id '
+                                   'inner join multi_asset on ma_tx_out.ident = multi_asset.id '
+                                   'where multi_asset.fingerprint = any($1) '
+                                   'order by multi_asset.fingerprint, block.slot_no desc'),
+    'tcr_mint_names_after': ('bytea, bigint, bigint',
+                             'select distinct multi_asset.name from ma_tx_mint '
+                             'inner join multi_asset on ma_tx_mint.ident = multi_asset.id '
+                             'inner join tx on ma_tx_mint.tx_id = tx.id '
+                             'where multi_asset.policy = $1 and tx.block_id > $2 and tx.block_id <= $3'),
+    'tcr_mint_transactions': ('bytea',
+                              'select multi_asset.name, multi_asset.fingerprint, ma_tx_mint.quantity, tx.hash from ma_tx_mint '
+                              'inner join multi_asset on ma_tx_mint.ident = multi_asset.id '
+                              'inner join tx on ma_tx_mint.tx_id = tx.id '
+                              'where multi_asset.policy = $1')
+}
+
 # https://github.com/input-output-hk/cardano-db-sync/blob/master/doc/schema.md
 # https://github.com/input-output-hk/cardano-db-sync/blob/master/doc/interesting-queries.md
 class Database:
-    def __init__(self, config_file: str):
+    """
+    Queries on the cardano-db-sync database.  Connections come from a pool so
+    the same Database can be used by several threads.  Each query checks out
+    a connection only while it runs.
+    """
+
+    def __init__(self, config_file: str, max_connections: int = DEFAULT_MAX_CONNECTIONS):
         self.config_file = config_file
         self.config_params = Database.read_config_params(self.config_file)
-        self.connection = None
+        self.max_connections = max_connections
+        self.pool = None
+        self.listen_connection = None
+
+        # connections that already have the prepared statements
+        self.prepared = set()
+
+        # query name: {'count', 'total', 'max'} seconds
+        self.timings = {}
+        self.lock = threading.Lock()
+
+        # policy id: {'names', 'block-id', 'block-hash'}, see query_minted_token_names
+        self.minted = {}
 
     def open(self):
-        self.connection = psycopg2.connect(**self.config_params)
-        cursor = self.connection.cursor()
-        cursor.execute('SELECT version()')
-        db_version = cursor.fetchone()
-        cursor.close()
+        # The pool closes connections returned above minconn, keep them all open
+        self.pool = psycopg2.pool.ThreadedConnectionPool(self.max_connections, self.max_connections, **self.config_params)
+        with self.cursor('version') as cursor:
+            cursor.execute('SELECT version()')
+            db_version = cursor.fetchone()
         logger.debug('Postgres SQL Database Version: {}'.format(db_version))
 
     def close(self):
-        if self.connection != None:
-            self.connection.close()
+        if self.pool != None:
+            self.log_timings()
+            self.pool.closeall()
+            self.pool = None
+            self.prepared = set()
+
+        if self.listen_connection != None:
+            self.listen_connection.close()
+            self.listen_connection = None
+
+    def prepare(self, connection) -> None:
+        if id(connection) in self.prepared:
+            return
+
+        # Each query is its own transaction, nothing holds a snapshot between polls
+        connection.autocommit = True
+        cursor = connection.cursor()
+        for (name, (types, sql)) in PREPARED_STATEMENTS.items():
+            cursor.execute('prepare {} ({}) as {};'.format(name, types, sql))
+        cursor.close()
+        self.prepared.add(id(connection))
+
+    @contextlib.contextmanager
+    def cursor(self, query_name: str):
+        """
+        Check out a connection from the pool for one query and record how long
+        the query took.
+        """
+
+        if self.pool == None:
+            raise Exception("Database Not Connected")
+
+        connection = self.pool.getconn()
+        close = False
+        try:
+            self.prepare(connection)
+            start = time.perf_counter()
+            cursor = connection.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+            self.add_timing(query_name, time.perf_counter() - start)
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            # The connection is broken, do not give it to the next query
+            close = True
+            self.prepared.discard(id(connection))
+            raise
+        finally:
+            self.pool.putconn(connection, close=close)
+
+    def add_timing(self, query_name: str, seconds: float) -> None:
+        logger.debug('{}(), {:.3f} ms'.format(query_name, seconds * 1000))
+        with self.lock:
+            timing = self.timings.get(query_name)
+            if timing == None:
+                timing = {'count': 0, 'total': 0.0, 'max': 0.0}
+                self.timings[query_name] = timing
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+
+    def get_timings(self) -> Dict[str, Dict]:
+        """
+        @return {query name: {'count', 'total', 'max', 'mean'}}, times in seconds
+        """
+
+        with self.lock:
+            return {name: dict(timing, mean=timing['total'] / timing['count'])
+                    for (name, timing) in self.timings.items()}
+
+    def log_timings(self) -> None:
+        for (name, timing) in sorted(self.get_timings().items()):
+            logger.debug('Query {}: count = {}, mean = {:.3f} ms, max = {:.3f} ms, total = {:.3f} s'.format(
+                         name, timing['count'], timing['mean'] * 1000, timing['max'] * 1000, timing['total']))
+
+    def install_block_notify_trigger(self) -> None:
+        """
+        Create a trigger on the db-sync block table that sends a NOTIFY on
+        BLOCK_NOTIFY_CHANNEL for every new block.  Requires permission to
+        create functions and triggers in the db-sync database.
+        """
+
+        sql = ('create or replace function tcr_notify_new_block() returns trigger as $$ '
+               'begin '
+               '    perform pg_notify(\'{}\', new.id::text); '
+               '    return new; '
+               'end; '
+               '$$ language plpgsql; '
+               'drop trigger if exists tcr_notify_new_block on block; '
+               'create trigger tcr_notify_new_block after insert on block '
+               '    for each row execute procedure tcr_notify_new_block();'.format(BLOCK_NOTIFY_CHANNEL))
+        logger.debug('install_block_notify_trigger(), sql = {}'.format(sql))
+
+        with self.cursor('install_block_notify_trigger') as cursor:
+            cursor.execute(sql)
+
+    def listen_for_blocks(self) -> None:
+        """
+        Open a second connection, in autocommit mode, that LISTENs for new
+        block notifications.  @see wait_for_block
+        """
+
+        if self.listen_connection != None:
+            return
+
+        self.listen_connection = psycopg2.connect(**self.config_params)
+        self.listen_connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = self.listen_connection.cursor()
+        cursor.execute('listen {};'.format(BLOCK_NOTIFY_CHANNEL))
+        cursor.close()
+        logger.debug('listen_for_blocks(), listening on {}'.format(BLOCK_NOTIFY_CHANNEL))
+
+    def wait_for_block(self, timeout: float) -> int:
+        """
+        Wait for a new block notification.
+
+        @param timeout Maximum seconds to wait.
+        @return The id of the newest block notified or None on timeout.
+        """
+
+        if self.listen_connection == None:
+            raise Exception("Database Not Listening")
+
+        block_id = None
+        if len(self.listen_connection.notifies) == 0:
+            (readable, writable, exceptional) = select.select([self.listen_connection], [], [], timeout)
+            if len(readable) == 0:
+                return None
+
+        self.listen_connection.poll()
+        while len(self.listen_connection.notifies) > 0:
+            notify = self.listen_connection.notifies.pop(0)
+            block_id = int(notify.payload)
+
+        return block_id
+
+    def query_latest_block_id(self) -> int:
+        sql = 'select max(id) from block;'
+        logger.debug('query_latest_block_id(), sql = {}'.format(sql))
+
+        with self.cursor('query_latest_block_id') as cursor:
+            cursor.execute(sql)
+            row = cursor.fetchone()
+        return int(row[0])
+
+    def query_latest_epoch(self) -> int:
+        sql = 'select max(epoch_no) from block;'
+        logger.debug('query_latest_epoch(), sql = {}'.format(sql))
+
+        with self.cursor('query_latest_epoch') as cursor:
+            cursor.execute(sql)
+            row = cursor.fetchone()
+        return int(row[0])
+
+    def query_address_activity(self, addresses: List[str], after_block_id: int) -> bool:
+        """
+        Check if any transaction in a block after after_block_id sent an output
+        to one of the addresses.
+        """
+
+        sql = ('select exists (select 1 from tx_out '
+               'inner join tx on tx_out.tx_id = tx.id '
+               'where tx.block_id > %s and tx_out.address = any(%s));')
+        logger.debug('query_address_activity(), sql = {}'.format(sql))
+
+        with self.cursor('query_address_activity') as cursor:
+            cursor.execute(sql, (after_block_id, addresses))
+            row = cursor.fetchone()
+        return bool(row[0])
+
+    def query_address_utxos(self, addresses: List[str]) -> List[Utxo]:
+        """
+        Read the unspent outputs of the addresses from tx_out / tx_in.  Returns
+        UTXOs in the same form as Cardano.query_utxos.
+        """
+
+        sql = ('select tx_out.id, tx_out.address, tx.hash, tx_out.index, tx_out.value, tx_out.data_hash from tx_out '
+               'inner join tx on tx_out.tx_id = tx.id '
+               'left join tx_in on tx_in.tx_out_id = tx_out.tx_id and tx_in.tx_out_index = tx_out.index '
+               'where tx_in.id is null and tx_out.address = any(%s);')
+        logger.debug('query_address_utxos(), sql = {}'.format(sql))
+
+        with self.cursor('query_address_utxos') as cursor:
+            cursor.execute(sql, (addresses,))
+            rows = cursor.fetchall()
+
+            utxos = {}
+            for row in rows:
+                datum_hash = None
+                if row[5] != None:
+                    datum_hash = bytes(row[5]).hex()
+                utxos[row[0]] = Utxo(bytes(row[2]).hex(), int(row[3]), int(row[4]), {}, datum_hash, row[1])
+
+            if len(utxos) > 0:
+                sql = ('select ma_tx_out.tx_out_id, multi_asset.policy, multi_asset.name, ma_tx_out.quantity from ma_tx_out '
+                       'inner join multi_asset on ma_tx_out.ident = multi_asset.id '
+                       'where ma_tx_out.tx_out_id = any(%s);')
+                logger.debug('query_address_utxos(), sql = {}'.format(sql))
+
+                cursor.execute(sql, (list(utxos.keys()),))
+                for row in cursor.fetchall():
+                    name = Utxo.decode_asset_name(bytes(row[2]))
+                    utxos[row[0]].assets[(bytes(row[1]).hex(), name)] = int(row[3])
+
+        output = list(utxos.values())
+        output.sort(key=lambda item : (item.tx_hash, item.tx_ix))
+        return output
 
     @staticmethod
     def read_config_params(filename: str):
@@ -70,23 +358,16 @@ class Database:
         return config_params
 
     def query_chain_metadata(self):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
-
         sql = 'select * from meta;'
         logger.debug('query_chain_metadata(), sql = {}'.format(sql))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        row = cursor.fetchone()
+        with self.cursor('query_chain_metadata') as cursor:
+            cursor.execute(sql)
+            row = cursor.fetchone()
         logger.debug('query_chain_metadata(), response:\r\n{}'.format(row))
-        cursor.close()
         return row
 
     def query_total_supply(self):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
-
         sql = ('select sum (value) / 1000000 as current_supply from tx_out as tx_outer where '
                '      not exists '
                '          ( select tx_out.id from tx_out inner join tx_in '
@@ -95,149 +376,184 @@ class Database:
                '          );')
         logger.debug('query_total_supply(), sql = {}'.format(sql))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        row = cursor.fetchone()
+        with self.cursor('query_total_supply') as cursor:
+            cursor.execute(sql)
+            row = cursor.fetchone()
         logger.debug('query_total_supply(), response:\r\n{}'.format(row))
-        cursor.close()
         return row[0]
 
     def query_database_size(self):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
-
-        sql = 'select pg_size_pretty (pg_database_size (\'{}\'));'.format(self.config_params['database'])
+        sql = 'select pg_size_pretty (pg_database_size (%s));'
         logger.debug('query_database_size(), sql = {}'.format(sql))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        row = cursor.fetchone()
+        with self.cursor('query_database_size') as cursor:
+            cursor.execute(sql, (self.config_params['database'],))
+            row = cursor.fetchone()
         logger.debug('query_database_size(), response:\r\n{}'.format(row))
-        cursor.close()
         return row[0]
 
     def query_latest_slot(self):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
-
         sql = ('select slot_no from block '
                'where block_no is not null '
                'order by block_no desc limit 1;')
         logger.debug('query_latest_slot(), sql = {}'.format(sql))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        row = cursor.fetchone()
+        with self.cursor('query_latest_slot') as cursor:
+            cursor.execute(sql)
+            row = cursor.fetchone()
         logger.debug('query_latest_slot(), response:\r\n{}'.format(row))
-        cursor.close()
         return int(row[0])
 
     def query_sync_progress(self):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
-
         sql = '''select
                      100 * (extract (epoch from (max (time) at time zone 'UTC')) - extract (epoch from (min (time) at time zone 'UTC')))
                          / (extract (epoch from (now () at time zone 'UTC')) - extract (epoch from (min (time) at time zone 'UTC')))
                      as sync_percent from block ;'''
         logger.debug('query_sync_progress(), sql = {}'.format(sql))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        row = cursor.fetchone()
+        with self.cursor('query_sync_progress') as cursor:
+            cursor.execute(sql)
+            row = cursor.fetchone()
         logger.debug('query_sync_progress(), response:\r\n{}'.format(row))
-        cursor.close()
         return float(row[0])
 
     def query_tx_fee(self, txid: str):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
-
-        sql = 'select tx.id, tx.fee from tx where tx.hash = \'\\x{}\';'.format(txid)
-        logger.debug('query_tx_fee(), sql = {}'.format(sql))
+        sql = 'select tx.id, tx.fee from tx where tx.hash = %s;'
+        logger.debug('query_tx_fee(), sql = {}, txid = {}'.format(sql, txid))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        row = cursor.fetchone()
+        with self.cursor('query_tx_fee') as cursor:
+            cursor.execute(sql, (bytes.fromhex(txid),))
+            row = cursor.fetchone()
         logger.debug('query_tx_fee(), response:\r\n{}'.format(row))
-        cursor.close()
         return (row[0], int(row[1]))
 
     def query_stake_address(self, address: str):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
-
-        sql = ('select stake_address.id as stake_address_id, tx_out.address, stake_address.view as stake_address '
-               'from tx_out inner join stake_address on tx_out.stake_address_id = stake_address.id '
-               'where address = \'{}\';'.format(address))
-
-        logger.debug('query_stake_address(), sql = {}'.format(sql))
+        logger.debug('query_stake_address(), address = {}'.format(address))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        row = cursor.fetchone()
+        with self.cursor('query_stake_address') as cursor:
+            cursor.execute('execute tcr_stake_address (%s);', (address,))
+            row = cursor.fetchone()
         logger.debug('query_stake_address(), response:\r\n{}'.format(row))
-        cursor.close()
 
         if row == None:
             return None
 
         return row[2]
 
-    def query_utxo_outputs(self, txid: str):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
+    def query_stake_addresses(self, addresses: List[str]) -> Dict[str, str]:
+        """
+        Look up the stake address of several addresses in one query.
+
+        @return {address: stake address or None}
+        """
 
-        sql = ('select tx_out.* from tx_out '
+        addresses = list(set(addresses))
+        stake_addresses = {address: None for address in addresses}
+        if len(addresses) == 0:
+            return stake_addresses
+
+        logger.debug('query_stake_addresses(), count = {}'.format(len(addresses)))
+
+        with self.cursor('query_stake_addresses') as cursor:
+            cursor.execute('execute tcr_stake_addresses (%s);', (addresses,))
+            rows = cursor.fetchall()
+
+        for row in rows:
+            stake_addresses[row[0]] = row[1]
+
+        return stake_addresses
+
+    def query_utxo_outputs(self, txid: str):
+        sql = ('select tx_out.address, tx_out.value from tx_out '
                'inner join tx on tx_out.tx_id = tx.id '
-               'where tx.hash = \'\\x{}\';'.format(txid))
-        logger.debug('query_utxo_outputs(), sql = {}'.format(sql))
+               'where tx.hash = %s;')
+        logger.debug('query_utxo_outputs(), sql = {}, txid = {}'.format(sql, txid))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        rows = cursor.fetchall()
+        with self.cursor('query_utxo_outputs') as cursor:
+            cursor.execute(sql, (bytes.fromhex(txid),))
+            rows = cursor.fetchall()
         logger.debug('query_utxo_outputs(), response:\r\n{}'.format(rows))
         outputs = []
         for row in rows:
-            outputs.append({'address': row[3], 'value': int(row[7])})
-        cursor.close()
+            outputs.append({'address': row[0], 'value': int(row[1])})
         return outputs
 
     def query_utxo_inputs(self, txid: str):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
+        logger.debug('query_utxo_inputs(), txid = {}'.format(txid))
 
-        sql = ('select tx_out.* from tx_out '
-               'inner join tx_in on tx_out.tx_id = tx_in.tx_out_id '
-               'inner join tx    on tx.id = tx_in.tx_in_id and tx_in.tx_out_index = tx_out.index '
-               'where tx.hash = \'\\x{}\';'.format(txid))
-        logger.debug('query_utxo_inputs(), sql = {}'.format(sql))
-
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        rows = cursor.fetchall()
+        with self.cursor('query_utxo_inputs') as cursor:
+            cursor.execute('execute tcr_utxo_inputs (%s);', (bytes.fromhex(txid),))
+            rows = cursor.fetchall()
         logger.debug('query_utxo_inputs(), response:\r\n{}'.format(rows))
         inputs = []
         for row in rows:
             value = 0
-            if row[7] != None:
-                value = int(row[7])
-            inputs.append({'address': row[3], 'value': value})
-        cursor.close()
+            if row[1] != None:
+                value = int(row[1])
+            inputs.append({'address': row[0], 'value': value})
+        return inputs
+
+    def query_utxo_inputs_by_txids(self, txids: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Look up the inputs of several transactions in one query.
+
+        @return {txid: [{'address', 'value'}, ...]}, an empty list for
+                transactions not in the database yet
+        """
+
+        txids = list(set(txids))
+        inputs = {txid: [] for txid in txids}
+        if len(txids) == 0:
+            return inputs
+
+        logger.debug('query_utxo_inputs_by_txids(), count = {}'.format(len(txids)))
+
+        with self.cursor('query_utxo_inputs_by_txids') as cursor:
+            cursor.execute('execute tcr_utxo_inputs_by_txids (%s);', ([bytes.fromhex(txid) for txid in txids],))
+            rows = cursor.fetchall()
+
+        for row in rows:
+            value = 0
+            if row[2] != None:
+                value = int(row[2])
+            inputs[bytes(row[0]).hex()].append({'address': row[1], 'value': value})
+
         return inputs
 
+    def query_txhash_times(self, txhashes: List[str]) -> Tuple[Dict[str, Tuple], Set[str]]:
+        """
+        Look up the block time and slot of several transactions in one query.
+
+        @return ({txhash: (time, slot_no)}, {txhash not found in the database})
+        """
+
+        txhashes = set(txhashes)
+        if len(txhashes) == 0:
+            return ({}, set())
+
+        logger.debug('query_txhash_times(), count = {}'.format(len(txhashes)))
+
+        with self.cursor('query_txhash_times') as cursor:
+            cursor.execute('execute tcr_txhash_times (%s);', ([bytes.fromhex(txhash) for txhash in txhashes],))
+            rows = cursor.fetchall()
+
+        times = {}
+        for row in rows:
+            times[bytes(row[0]).hex()] = (row[1], row[2])
+
+        missing = txhashes - times.keys()
+        if len(missing) > 0:
+            logger.warning('Query TX Times: {} of {} not found in database'.format(len(missing), len(txhashes)))
+
+        return (times, missing)
+
     def query_txhash_time(self, txhash: str):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
+        logger.debug('query_txhash_time(), txhash = {}'.format(txhash))
 
-        sql = ('select block.time, block.slot_no from tx '
-               'inner join block on tx.block_id = block.id '
-               'where tx.hash = \'\\x{}\';'.format(txhash))
-        logger.debug('query_txhash_time(), sql = {}'.format(sql))
+        with self.cursor('query_txhash_time') as cursor:
+            cursor.execute('execute tcr_txhash_time (%s);', (bytes.fromhex(txhash),))
+            row = cursor.fetchone()
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        row = cursor.fetchone()
         if row == None:
             logger.warning('Query TX Time: {} not found in database'.format(txhash))
             return (None, None)
@@ -263,18 +579,15 @@ class Database:
     #   bytes   bytea	        The raw bytes of the payload.
     #   tx_id   integer (64)    The Tx table index of the transaction where this metadata was included.
     def query_nft_metadata(self, fingerprint: str) -> str:
-        if self.connection == None:
-            raise Exception("Database Not Connected")
-
         sql = ('select tx_metadata.tx_id, tx_metadata.json, multi_asset.name, multi_asset.policy, tx_metadata.key from tx_metadata '
                'inner join ma_tx_mint on tx_metadata.tx_id = ma_tx_mint.tx_id '
                'inner join multi_asset on ma_tx_mint.ident = multi_asset.id '
-               'where multi_asset.fingerprint = \'{}\''.format(fingerprint))
-        logger.debug('query_nft_metadata(), sql = {}'.format(sql))
+               'where multi_asset.fingerprint = %s')
+        logger.debug('query_nft_metadata(), sql = {}, fingerprint = {}'.format(sql, fingerprint))
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        rows = cursor.fetchall()
+        with self.cursor('query_nft_metadata') as cursor:
+            cursor.execute(sql, (fingerprint,))
+            rows = cursor.fetchall()
 
         if len(rows) == 0:
             return (None, None, None)
@@ -288,19 +601,12 @@ class Database:
         return (token_policy, token_name, {key: metadata})
 
     def query_mint_transactions(self, policy_id: str) -> Dict:
-        if self.connection == None:
-            raise Exception("Database Not Connected")
+        logger.debug('query_mint_transactions(), policy_id = {}'.format(policy_id))
 
-        sql = ('select multi_asset.name, multi_asset.fingerprint, ma_tx_mint.quantity, tx.hash from ma_tx_mint '
-               'inner join multi_asset on ma_tx_mint.ident = multi_asset.id '
-               'inner join tx on ma_tx_mint.tx_id = tx.id '
-               'where multi_asset.policy=\'\\x{}\';'.format(policy_id))
-
-        logger.debug('query_mint_transactions(), sql = {}'.format(sql))
+        with self.cursor('query_mint_transactions') as cursor:
+            cursor.execute('execute tcr_mint_transactions (%s);', (bytes.fromhex(policy_id),))
+            rows = cursor.fetchall()
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        rows = cursor.fetchall()
         tokens = {}
         for row in rows:
             name = binascii.unhexlify(bytes(row[0]).hex()).decode("utf-8")
@@ -318,22 +624,78 @@ class Database:
 
         return tokens
 
-    def query_current_owner(self, policy_id: str):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
+    def query_minted_token_names(self, policy_id: str) -> Set[str]:
+        """
+        Every token name ever minted with the policy.  The names are read from
+        the whole mint history once, after that only the blocks added since
+        the last call are read.  If the last block read was rolled back the
+        history is read again.  Names are never forgotten by a rollback, it can
+        only make a token look minted.  Only remove_minted_token_names forgets
+        a name.
+
+        @return The set of names, shared with the cache.  Do not modify it
+        """
+
+        with self.lock:
+            minted = self.minted.setdefault(policy_id, {'names': set(), 'block-id': 0, 'block-hash': None})
+            (block_id, block_hash) = (minted['block-id'], minted['block-hash'])
+
+        latest_block_id = self.query_latest_block_id()
+        if block_id == latest_block_id:
+            return minted['names']
+
+        if block_id > 0 and self.query_block_hash(block_id) != block_hash:
+            logger.warning('Minted tokens {}: block {} rolled back, read the full history'.format(policy_id, block_id))
+            block_id = 0
+
+        latest_block_hash = self.query_block_hash(latest_block_id)
+        with self.cursor('query_minted_token_names') as cursor:
+            cursor.execute('execute tcr_mint_names_after (%s, %s, %s);', (bytes.fromhex(policy_id), block_id, latest_block_id))
+            rows = cursor.fetchall()
+
+        names = [bytes(row[0]).decode("utf-8") for row in rows]
+        logger.debug('query_minted_token_names(), {} names in blocks {} to {}'.format(len(names), block_id + 1, latest_block_id))
+
+        with self.lock:
+            minted['names'].update(names)
+            minted['block-id'] = latest_block_id
+            minted['block-hash'] = latest_block_hash
+        return minted['names']
+
+    def add_minted_token_names(self, policy_id: str, names: List[str]) -> None:
+        """
+        Remember tokens minted by a transaction just submitted, before db-sync
+        has seen it.
+        """
+
+        with self.lock:
+            minted = self.minted.setdefault(policy_id, {'names': set(), 'block-id': 0, 'block-hash': None})
+            minted['names'].update(names)
+
+    def remove_minted_token_names(self, policy_id: str, names: List[str]) -> None:
+        """
+        Forget tokens added by add_minted_token_names when their transaction
+        was dropped and never made it on chain.
+        """
+
+        with self.lock:
+            if policy_id in self.minted:
+                self.minted[policy_id]['names'].difference_update(names)
 
+    def query_current_owner(self, policy_id: str):
         sql = ('select multi_asset.name, stake_address.view, block.slot_no from ma_tx_out '
                'inner join tx_out on ma_tx_out.tx_out_id = tx_out.id '
                'inner join tx on tx_out.tx_id = tx.id '
                'inner join block on tx.block_id = block.id '
                'inner join stake_address on tx_out.stake_address_id = stake_address.id '
                'inner join multi_asset on ma_tx_out.ident = multi_asset.id '
-               'where multi_asset.policy=\'\\x{}\';'.format(policy_id))
-        logger.debug('query_current_owner(), sql = {}'.format(sql))
+               'where multi_asset.policy = %s;')
+        logger.debug('query_current_owner(), sql = {}, policy_id = {}'.format(sql, policy_id))
+
+        with self.cursor('query_current_owner') as cursor:
+            cursor.execute(sql, (bytes.fromhex(policy_id),))
+            rows = cursor.fetchall()
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        rows = cursor.fetchall()
         tokens = {}
         for row in rows:
             name = bytes(row[0]).decode("utf-8")
@@ -346,9 +708,30 @@ class Database:
 
         return tokens
 
-    def query_owner_by_fingerprint(self, fingerprint: str):
-        if self.connection == None:
-            raise Exception("Database Not Connected")
+    def query_block_hash(self, block_id: int) -> str:
+        """
+        @return The hash of the block or None if it is not in the database,
+                e.g. it was rolled back
+        """
+
+        sql = 'select hash from block where id = %s;'
+        logger.debug('query_block_hash(), sql = {}, block_id = {}'.format(sql, block_id))
+
+        with self.cursor('query_block_hash') as cursor:
+            cursor.execute(sql, (block_id,))
+            row = cursor.fetchone()
+
+        if row == None:
+            return None
+        return bytes(row[0]).hex()
+
+    def query_policy_outputs(self, policy_id: str, after_block_id: int, to_block_id: int) -> List[Tuple]:
+        """
+        Outputs holding tokens of a policy created in blocks after_block_id <
+        block id <= to_block_id, oldest first.
+
+        @return [(token name, stake address, slot), ...]
+        """
 
         sql = ('select multi_asset.name, stake_address.view, block.slot_no from ma_tx_out '
                'inner join tx_out on ma_tx_out.tx_out_id = tx_out.id '
@@ -356,18 +739,59 @@ class Database:
                'inner join block on tx.block_id = block.id '
                'inner join stake_address on tx_out.stake_address_id = stake_address.id '
                'inner join multi_asset on ma_tx_out.ident = multi_asset.id '
-               'where multi_asset.fingerprint=\'{}\';'.format(fingerprint))
-        logger.debug('query_owner_by_fingerprint(), sql = {}'.format(sql))
+               'where multi_asset.policy = %s and tx.block_id > %s and tx.block_id <= %s '
+               'order by block.slot_no, tx_out.id;')
+        logger.debug('query_policy_outputs(), sql = {}, policy_id = {}, blocks = {}..{}'.format(sql, policy_id, after_block_id, to_block_id))
+
+        with self.cursor('query_policy_outputs') as cursor:
+            cursor.execute(sql, (bytes.fromhex(policy_id), after_block_id, to_block_id))
+            rows = cursor.fetchall()
+
+        return [(bytes(row[0]).decode("utf-8"), row[1], row[2]) for row in rows]
+
+    def query_owner_by_fingerprint(self, fingerprint: str):
+        sql = ('select multi_asset.name, stake_address.view, block.slot_no from ma_tx_out '
+               'inner join tx_out on ma_tx_out.tx_out_id = tx_out.id '
+               'inner join tx on tx_out.tx_id = tx.id '
+               'inner join block on tx.block_id = block.id '
+               'inner join stake_address on tx_out.stake_address_id = stake_address.id '
+               'inner join multi_asset on ma_tx_out.ident = multi_asset.id '
+               'where multi_asset.fingerprint = %s;')
+        logger.debug('query_owner_by_fingerprint(), sql = {}, fingerprint = {}'.format(sql, fingerprint))
+
+        with self.cursor('query_owner_by_fingerprint') as cursor:
+            cursor.execute(sql, (fingerprint,))
+            rows = cursor.fetchall()
 
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
         owner = ''
         slot = 0
-
-        rows = cursor.fetchall()
         for row in rows:
             if slot < row[2]:
                 slot = row[2]
                 owner = row[1]
 
         return owner
+
+    def query_owners_by_fingerprints(self, fingerprints: List[str]) -> Dict[str, str]:
+        """
+        Look up the owner of several assets in one query, the stake address of
+        the most recent output holding each one.
+
+        @return {fingerprint: stake address or ''}
+        """
+
+        fingerprints = list(set(fingerprints))
+        owners = {fingerprint: '' for fingerprint in fingerprints}
+        if len(fingerprints) == 0:
+            return owners
+
+        logger.debug('query_owners_by_fingerprints(), count = {}'.format(len(fingerprints)))
+
+        with self.cursor('query_owners_by_fingerprints') as cursor:
+            cursor.execute('execute tcr_owners_by_fingerprints (%s);', (fingerprints,))
+            rows = cursor.fetchall()
+
+        for row in rows:
+            owners[row[0]] = row[1]
+
+        return owners
@@ -0,0 +1,144 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: dedupe.py
+Author: SuperKK
+
+Utility to audit existing NFT images for near duplicates using perceptual
+hashes.
+"""
+
+from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import logging
+import os
+import tcr.nftmint
+import tcr.phash
+import traceback
+
+logger = None
+
+def get_image_files(directory: str) -> List[str]:
+    """
+    All PNG images in directory, or in directory/nft_img for a drop directory.
+    """
+
+    image_dir = os.path.join(directory, 'nft_img')
+    if not os.path.isdir(image_dir):
+        image_dir = directory
+
+    return sorted([os.path.join(image_dir, name) for name in os.listdir(image_dir) if name.lower().endswith('.png')])
+
+def hash_files(filenames: List[str], max_workers: int = None) -> List[int]:
+    """
+    Perceptual hash of each file, in the same order as filenames.
+    """
+
+    if max_workers == None:
+        max_workers = os.cpu_count()
+
+    if max_workers <= 1:
+        return [tcr.phash.dhash_file(filename) for filename in filenames]
+
+    chunksize = max(1, len(filenames) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(tcr.phash.dhash_file, filenames, chunksize=chunksize))
+
+def find_near_duplicates(filenames: List[str],
+                         max_distance: int,
+                         max_workers: int = None) -> List[Tuple[int, str, str]]:
+    """
+    Compare every image against all images before it.
+
+    @return [(distance, earlier file, later file), ...] for each pair of images
+            whose perceptual hashes are within max_distance bits
+    """
+
+    found = []
+    tree = tcr.phash.BKTree()
+    for (filename, hash) in zip(filenames, hash_files(filenames, max_workers)):
+        for (distance, other) in sorted(tree.search(hash, max_distance)):
+            found.append((distance, other, filename))
+        tree.add(hash, filename)
+
+    return found
+
+def main():
+    global logger
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--network',   required=True,
+                                       action='store',
+                                       metavar='NAME',
+                                       help='Which network to use, [mainnet | testnet]')
+    parser.add_argument('--directory', required=True,
+                                       action='store',
+                                       nargs='+',
+                                       metavar='DIR',
+                                       help='Drop or image directories to audit together')
+    parser.add_argument('--distance',  required=False,
+                                       action='store',
+                                       type=int,
+                                       default=4,
+                                       metavar='BITS',
+                                       help='Report images whose hashes differ by at most this many bits')
+
+    args = parser.parse_args()
+
+    network = args.network
+    directories = args.directory
+    max_distance = args.distance
+
+    tcr.nftmint.setup_logging(network, 'dedupe')
+    logger = logging.getLogger(network)
+
+    logger.info('{} NFT Image Dedupe Audit'.format(network.upper()))
+    logger.info('Copyright 2021-2022 The Card Room')
+
+    filenames = []
+    for directory in directories:
+        if not os.path.isdir(directory):
+            logger.error('Directory does not exist: {}'.format(directory))
+            raise Exception('Directory does not exist: {}'.format(directory))
+        filenames.extend(get_image_files(directory))
+
+    logger.info('Images: {}'.format(len(filenames)))
+    logger.info('Distance: {}'.format(max_distance))
+
+    duplicates = find_near_duplicates(filenames, max_distance)
+    for (distance, first, second) in duplicates:
+        logger.warning('Near Duplicate ({} bits): {} and {}'.format(distance, first, second))
+
+    logger.info('Near Duplicates: {}'.format(len(duplicates)))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print('')
+        print('')
+        print('EXCEPTION: {}'.format(e))
+        print('')
+        traceback.print_exc()
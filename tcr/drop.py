@@ -0,0 +1,337 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: drop.py
+Author: SuperKK
+
+State shared by the steps that generate a layered NFT drop.
+"""
+
+from typing import Dict, List, Tuple
+import json
+import logging
+import os
+import numpy
+
+from PIL import Image
+
+logger = logging.getLogger('nft')
+
+# Image sizes are cached next to the drop metametadata in this file
+IMAGE_SIZE_CACHE_FILE = '.image_sizes.json'
+
+# Progress of a drop being generated, saved in the drop directory
+PROGRESS_PLAN_FILE = 'drop_progress.json'
+PROGRESS_JOURNAL_FILE = 'drop_progress.journal'
+
+class DropContext:
+    """
+    Everything needed to generate a drop from a metametadata file, loaded once.
+
+    Each layer set file is parsed once.  The weights of the layer sets and of
+    the images in each layer are kept as cumulative arrays so a random number
+    in [0, 100) maps to a choice with numpy.searchsorted.  Image sizes are
+    cached in a sidecar file keyed by the image modification time.
+    """
+
+    def __init__(self, metametadata: Dict):
+        self.metametadata = metametadata
+        self.dir = os.path.dirname(os.path.abspath(metametadata['self']))
+        self.layer_set_items = metametadata['layer-sets']
+        self.layer_sets = []
+        self.layer_weights = []
+
+        for layer_set_item in self.layer_set_items:
+            with open(os.path.join(self.dir, layer_set_item['file']), 'r') as ls_file:
+                logger.info("Opening Layer Set: {}".format(layer_set_item['file']))
+                layer_set = json.load(ls_file)
+
+            self.layer_sets.append(layer_set)
+            self.layer_weights.append([numpy.cumsum([image['weight'] for image in layer['images']])
+                                       for layer in layer_set['layers']])
+
+        self.layer_set_weights = numpy.cumsum([item['weight'] for item in self.layer_set_items])
+
+        # first combination code of each layer set, see encode()
+        self.code_offsets = [0]
+        for layer_set_index in range(0, len(self.layer_sets) - 1):
+            self.code_offsets.append(self.code_offsets[-1] + self.get_combinations(layer_set_index))
+        self.frequencies = None
+
+        self.image_sizes_file = os.path.join(self.dir, IMAGE_SIZE_CACHE_FILE)
+        self.image_sizes = {}
+        self.image_sizes_changed = False
+        try:
+            with open(self.image_sizes_file, 'r') as file:
+                self.image_sizes = json.load(file)
+        except (FileNotFoundError, ValueError) as e:
+            pass
+
+    def get_image_path(self, image: str) -> str:
+        return os.path.join(self.dir, image)
+
+    def get_combinations(self, layer_set_index: int) -> int:
+        combinations = 1
+        for weights in self.layer_weights[layer_set_index]:
+            combinations *= len(weights)
+        return combinations
+
+    def encode(self, layer_set_index: int, choices: numpy.ndarray) -> numpy.ndarray:
+        """
+        A unique integer for each row of image choices in a layer set.  The
+        choices are digits of a mixed radix number and each layer set gets
+        its own range of numbers.
+        """
+
+        codes = numpy.zeros(len(choices), dtype=numpy.int64)
+        for (layer_index, weights) in enumerate(self.layer_weights[layer_set_index]):
+            codes = codes * len(weights) + choices[:, layer_index]
+        return codes + self.code_offsets[layer_set_index]
+
+    def draw(self, count: int, rng: numpy.random.RandomState) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Draw count random combinations, possibly with duplicates.
+
+        @return (layer set index per row, combination code per row)
+        """
+
+        nums = rng.random(count) * 100
+        self.frequencies += numpy.bincount(numpy.round(nums).astype(numpy.int64), minlength=101)
+        layer_set_indexes = numpy.searchsorted(self.layer_set_weights, nums, side='left')
+        if numpy.any(layer_set_indexes >= len(self.layer_sets)):
+            logger.error('Unexpected layer_set_obj == None')
+            raise Exception('Unexpected layer_set_obj == None')
+
+        codes = numpy.zeros(count, dtype=numpy.int64)
+        for layer_set_index in range(0, len(self.layer_sets)):
+            rows = numpy.nonzero(layer_set_indexes == layer_set_index)[0]
+            if len(rows) == 0:
+                continue
+
+            layer_weights = self.layer_weights[layer_set_index]
+            nums = rng.random((len(rows), len(layer_weights))) * 100
+            self.frequencies += numpy.bincount(numpy.round(nums).astype(numpy.int64).ravel(), minlength=101)
+            choices = numpy.empty((len(rows), len(layer_weights)), dtype=numpy.int64)
+            for (layer_index, weights) in enumerate(layer_weights):
+                choices[:, layer_index] = numpy.searchsorted(weights, nums[:, layer_index], side='left')
+                if numpy.any(choices[:, layer_index] >= len(weights)):
+                    logger.error('Unexpected image_obj == None')
+                    raise Exception('Unexpected image_obj == None')
+
+            codes[rows] = self.encode(layer_set_index, choices)
+
+        return (layer_set_indexes, codes)
+
+    def decode(self, layer_set_index: int, codes: numpy.ndarray) -> numpy.ndarray:
+        """
+        The image choices of each code, the reverse of encode().
+        """
+
+        codes = codes - self.code_offsets[layer_set_index]
+        layer_weights = self.layer_weights[layer_set_index]
+        choices = numpy.empty((len(codes), len(layer_weights)), dtype=numpy.int64)
+        for layer_index in range(len(layer_weights) - 1, -1, -1):
+            choices[:, layer_index] = codes % len(layer_weights[layer_index])
+            codes = codes // len(layer_weights[layer_index])
+        return choices
+
+    def sample(self, total: int, rng: numpy.random.RandomState) -> List[Tuple[int, List[int]]]:
+        """
+        Choose total unique combinations.  Every combination is drawn at once
+        as a matrix, duplicates are removed and only that many combinations are
+        drawn again, until there are enough.  The result only depends on the
+        state of rng.
+
+        @return [(layer set index, [image index for each layer]), ...]
+        """
+
+        combinations = sum([self.get_combinations(i) for i in range(0, len(self.layer_sets))])
+        if total > combinations:
+            logger.error('Not enough combinations: {} < {}'.format(combinations, total))
+            raise Exception('Not enough combinations: {} < {}'.format(combinations, total))
+
+        if combinations >= 2**62:
+            logger.error('Too many combinations to sample: {}'.format(combinations))
+            raise Exception('Too many combinations to sample: {}'.format(combinations))
+
+        self.frequencies = numpy.zeros(101, dtype=numpy.int64)
+
+        layer_set_indexes = numpy.empty(0, dtype=numpy.int64)
+        codes = numpy.empty(0, dtype=numpy.int64)
+        rounds = 0
+        while len(codes) < total:
+            (new_layer_set_indexes, new_codes) = self.draw(total - len(codes), rng)
+
+            # keep the first of each new combination, in the order drawn
+            first = numpy.unique(new_codes, return_index=True)[1]
+            first.sort()
+            first = first[~numpy.isin(new_codes[first], codes)]
+
+            if len(first) < len(new_codes):
+                logger.info('Already exists, try again: {} combinations'.format(len(new_codes) - len(first)))
+
+            layer_set_indexes = numpy.concatenate([layer_set_indexes, new_layer_set_indexes[first]])
+            codes = numpy.concatenate([codes, new_codes[first]])
+            rounds += 1
+
+        logger.info('Sampled {} combinations in {} rounds'.format(total, rounds))
+        for i in range(0, len(self.frequencies)):
+            logger.debug('frequencies[{}] = {}'.format(i, self.frequencies[i]))
+
+        sample = [None] * total
+        for layer_set_index in range(0, len(self.layer_sets)):
+            rows = numpy.nonzero(layer_set_indexes == layer_set_index)[0]
+            for (row, choices) in zip(rows.tolist(), self.decode(layer_set_index, codes[rows]).tolist()):
+                sample[row] = (layer_set_index, choices)
+
+        return sample
+
+    def get_image_size(self, image: str) -> Tuple[int, int]:
+        """
+        The (width, height) of a layer image.  Only decoded when the image
+        changed since the size was cached.
+        """
+
+        path = self.get_image_path(image)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.image_sizes.get(image)
+        if cached != None and cached['mtime'] == mtime:
+            return tuple(cached['size'])
+
+        with Image.open(path) as im:
+            size = im.size
+        self.image_sizes[image] = {'mtime': mtime, 'size': list(size)}
+        self.image_sizes_changed = True
+        return size
+
+    def save_image_sizes(self) -> None:
+        if not self.image_sizes_changed:
+            return
+
+        temp_file = '{}.tmp'.format(self.image_sizes_file)
+        with open(temp_file, 'w') as file:
+            file.write(json.dumps(self.image_sizes, indent=4))
+        os.replace(temp_file, self.image_sizes_file)
+        self.image_sizes_changed = False
+
+class DropProgress:
+    """
+    Checkpoints of a random drop while its images are generated.
+
+    The plan is saved once when generation starts.  Each image written is
+    recorded in a journal with its hash, one JSON record per line.  When
+    generation is restarted the plan must be the same, e.g. the same --seed,
+    and the images in the journal can be skipped once their hashes are
+    checked.
+    """
+
+    def __init__(self, network: str, drop_name: str):
+        drop_dir = 'nft/{}/{}'.format(network, drop_name)
+        self.plan_file = os.path.join(drop_dir, PROGRESS_PLAN_FILE)
+        self.journal_file = os.path.join(drop_dir, PROGRESS_JOURNAL_FILE)
+        self.completed = {}
+        self.journal = None
+
+    def start(self, plan: List[Dict]) -> None:
+        """
+        Save the plan or, if generation was started before, check it is the
+        same plan and load the images already written.
+        """
+
+        plan = json.loads(json.dumps(plan))
+        if os.path.isfile(self.plan_file):
+            with open(self.plan_file, 'r') as file:
+                saved_plan = json.load(file)
+
+            if saved_plan != plan:
+                logger.error('Drop progress: {} is for a different plan.  Use the same seed or remove it'.format(self.plan_file))
+                raise Exception('Drop progress: {} is for a different plan.  Use the same seed or remove it'.format(self.plan_file))
+
+            self.read_journal()
+            logger.info('Drop progress: {} of {} images written before'.format(len(self.completed), len(plan)))
+        else:
+            if os.path.isfile(self.journal_file):
+                os.remove(self.journal_file)
+
+            temp_file = '{}.tmp'.format(self.plan_file)
+            with open(temp_file, 'w') as file:
+                file.write(json.dumps(plan))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_file, self.plan_file)
+
+        self.journal = open(self.journal_file, 'a')
+
+    def read_journal(self) -> None:
+        with open(self.journal_file, 'rb') as file:
+            data = file.read()
+
+        offset = 0
+        while offset < len(data):
+            end = data.find(b'\n', offset)
+            if end < 0:
+                break
+
+            try:
+                record = json.loads(data[offset:end])
+            except ValueError:
+                break
+
+            self.completed[record['card-number']] = record
+            offset = end + 1
+
+        if offset < len(data):
+            logger.warning('Truncate incomplete drop progress record at: {}'.format(offset))
+            with open(self.journal_file, 'r+b') as file:
+                file.truncate(offset)
+
+    def get_completed(self, card_number: int) -> Dict:
+        """
+        @return {'card-number', 'file', 'sha256', 'dhash'} if the image was written before
+        """
+
+        return self.completed.get(card_number)
+
+    def set_completed(self, card_number: int, filename: str, sha256: str, dhash: int) -> None:
+        record = {'card-number': card_number, 'file': filename, 'sha256': sha256, 'dhash': dhash}
+        self.journal.write(json.dumps(record) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.completed[card_number] = record
+
+    def close(self) -> None:
+        if self.journal != None:
+            self.journal.close()
+            self.journal = None
+
+    def remove(self) -> None:
+        """
+        Delete the checkpoints once the drop metadata set has been saved.
+        """
+
+        self.close()
+        for filename in [self.plan_file, self.journal_file]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
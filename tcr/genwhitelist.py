@@ -24,6 +24,7 @@
 from tcr.wallet import Wallet
 from tcr.cardano import Cardano
 from tcr.database import Database
+from tcr.holders import HolderIndex
 import logging
 import argparse
 import traceback
@@ -109,7 +110,10 @@ def main():
     by_address = {}
     # TODO: Generalize for any policy / token
     if cardano.get_policy_id('tcr_series_1') != None:
-        tokens = database.query_current_owner(cardano.get_policy_id('tcr_series_1'))
+        holder_index = HolderIndex(network)
+        holder_index.refresh(database, cardano.get_policy_id('tcr_series_1'))
+        tokens = holder_index.get_holders(cardano.get_policy_id('tcr_series_1'))
+        holder_index.close()
         for name in tokens:
             address = tokens[name]['address']
             slot = tokens[name]['slot']
@@ -136,6 +140,10 @@ def main():
     utxos = cardano.query_utxos_time(database, utxos)
     utxos.sort(key=lambda item : item['slot-no'])
 
+    # The sender of every payment, looked up together instead of one at a time
+    inputs = database.query_utxo_inputs_by_txids([utxo['tx-hash'] for utxo in utxos])
+    stake_addresses = database.query_stake_addresses([inputs[txid][0]['address'] for txid in inputs if len(inputs[txid]) > 0])
+
     for price in metametadata['presale']:
         logger.info('{} lovelace = {} NFTs'.format(price, metametadata['presale'][price]))
 
@@ -163,8 +171,8 @@ def main():
             used_special = True
 
         logger.info('{}: {} lovelace, request mint {}'.format(utxo['tx-hash'], utxo['amount'], nfts_purchased))
-        input_address = database.query_utxo_inputs(utxo['tx-hash'])[0]['address']
-        stake_address = database.query_stake_address(input_address)
+        input_address = inputs[utxo['tx-hash']][0]['address']
+        stake_address = stake_addresses[input_address]
 
         for hodler in hodlers:
             if stake_address == hodler[0]:
@@ -0,0 +1,122 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: holders.py
+Author: SuperKK
+
+Local index of the current holder of each token of a policy.  Built once from
+db-sync and then refreshed from the blocks added since the last refresh.
+"""
+
+from typing import Dict
+import logging
+import sqlite3
+
+from tcr.database import Database
+
+logger = logging.getLogger('holders')
+
+class HolderIndex:
+    """
+    token -> (stake address, slot) for each policy, stored in SQLite.
+
+    The holder of a token is the stake address of the most recent output
+    holding it, the same as Database.query_current_owner.  The last block
+    processed for each policy is saved with its hash.  If that block is no
+    longer in db-sync the chain was rolled back and the policy is rebuilt from
+    the full history.
+    """
+
+    def __init__(self, network: str, filename: str = None):
+        if filename == None:
+            filename = '{}_holders.sqlite'.format(network)
+
+        self.filename = filename
+        self.connection = sqlite3.connect(self.filename)
+        self.connection.execute('create table if not exists holders ('
+                                'policy text not null, '
+                                'name text not null, '
+                                'address text not null, '
+                                'slot integer not null, '
+                                'primary key (policy, name))')
+        self.connection.execute('create table if not exists progress ('
+                                'policy text primary key, '
+                                'block_id integer not null, '
+                                'block_hash text not null)')
+        self.connection.commit()
+
+    def get_progress(self, policy_id: str):
+        """
+        @return (last block id, its hash) or (0, None) before the first refresh
+        """
+
+        row = self.connection.execute('select block_id, block_hash from progress where policy = ?', (policy_id,)).fetchone()
+        if row == None:
+            return (0, None)
+        return (row[0], row[1])
+
+    def refresh(self, database: Database, policy_id: str) -> int:
+        """
+        Apply the outputs added to db-sync since the last refresh.
+
+        @return The number of outputs read from db-sync
+        """
+
+        (block_id, block_hash) = self.get_progress(policy_id)
+        if block_id > 0 and database.query_block_hash(block_id) != block_hash:
+            logger.warning('Holders {}: block {} rolled back, rebuild from the full history'.format(policy_id, block_id))
+            block_id = 0
+
+        latest_block_id = database.query_latest_block_id()
+        latest_block_hash = database.query_block_hash(latest_block_id)
+        if block_id == latest_block_id:
+            return 0
+
+        outputs = database.query_policy_outputs(policy_id, block_id, latest_block_id)
+        with self.connection:
+            if block_id == 0:
+                self.connection.execute('delete from holders where policy = ?', (policy_id,))
+
+            # outputs are oldest first, a later output for the same token replaces the holder
+            self.connection.executemany('insert into holders (policy, name, address, slot) values (?, ?, ?, ?) '
+                                        'on conflict (policy, name) do update set address = excluded.address, slot = excluded.slot '
+                                        'where excluded.slot >= holders.slot',
+                                        [(policy_id, name, address, slot) for (name, address, slot) in outputs])
+            self.connection.execute('insert or replace into progress (policy, block_id, block_hash) values (?, ?, ?)',
+                                    (policy_id, latest_block_id, latest_block_hash))
+
+        logger.info('Holders {}: {} outputs in blocks {} to {}'.format(policy_id, len(outputs), block_id + 1, latest_block_id))
+        return len(outputs)
+
+    def get_holders(self, policy_id: str) -> Dict[str, Dict]:
+        """
+        @return {token name: {'address': stake address, 'slot': slot}}, the
+                same as Database.query_current_owner
+        """
+
+        rows = self.connection.execute('select name, address, slot from holders where policy = ?', (policy_id,))
+        return {row[0]: {'address': row[1], 'slot': row[2]} for row in rows}
+
+    def close(self) -> None:
+        self.connection.close()
@@ -28,19 +28,26 @@ Author: SuperKK
 Utility to upload files into IPFS and update a drop metametadata
 """
 
-from typing import Dict
+from typing import Dict, List
 import argparse
 import json
 import logging
 import os
-import requests
+import tcr.cid
+import tcr.metadata_store
 import tcr.command
 import tcr.nftmint
 import traceback
+from tcr.uploader import DEFAULT_WORKERS
+from tcr.uploader import UploadManifest
+from tcr.uploader import Uploader
 
 
 logger = None
 
+# Files already uploaded for a drop, kept next to the drop metametadata
+MANIFEST_FILE = 'ipfs_manifest.journal'
+
 def set_metametadata(network: str, drop_name: str, metametadata: Dict) -> None:
     metametadata_file = 'nft/{}/{}/{}_metametadata.json'.format(network, drop_name, drop_name)
     with open(metametadata_file, 'w') as file:
@@ -65,52 +72,51 @@ def get_metadataset(network: str, drop_name: str) -> Dict:
         metadataset = json.load(file)
     return metadataset
 
-def ipfs_upload(projectid: str, projectsecret: str, filename: str) -> str:
-    files = {'file': (os.path.basename(filename), open(filename, 'rb'))}
-
-    logger.info('Uploading: {}'.format(filename))
-    # Thank you!!  https://curl.trillworks.com/#python
-    response = requests.post('https://ipfs.infura.io:5001/api/v0/add?pin=false',
-                             files=files,
-                             auth=(projectid, projectsecret))
+def get_manifest(network: str, drop_name: str) -> UploadManifest:
+    manifest_file = 'nft/{}/{}/{}'.format(network, drop_name, MANIFEST_FILE)
+    logger.info('Upload Manifest: {}'.format(manifest_file))
+    return UploadManifest(manifest_file)
 
-    if response.status_code != 200:
-        logger.error('Upload Status Code: {}'.format(response.status_code))
-        raise Exception('Upload Status Code: {}'.format(response.status_code))
+def set_nft_metadata(filename: str, nftmetadata: Dict) -> None:
+    temp_file = '{}.tmp'.format(filename)
+    with open(temp_file, 'w') as file:
+        file.write(json.dumps(nftmetadata, indent=4))
+    os.replace(temp_file, filename)
 
-    upload_json = response.json()
-    return upload_json['Hash']
+def get_image_token(nftmetadata: Dict) -> Dict:
+    policy_id = list(nftmetadata['721'].keys())[0]
+    token_name = list(nftmetadata['721'][policy_id].keys())[0]
+    return nftmetadata['721'][policy_id][token_name]
 
-def ipfs_pin(projectid: str, projectsecret: str, ipfs_hash: str) -> str:
-    logger.info('Pinning: {}'.format(ipfs_hash))
-    # Thank you!!  https://curl.trillworks.com/#python
-    params = {('arg', ipfs_hash)}
-    response = requests.post('https://ipfs.infura.io:5001/api/v0/pin/add',
-                             params=params,
-                             auth=(projectid, projectsecret))
+def get_cids(uploader: Uploader, filenames: List[str], check_pins: bool) -> Dict[str, str]:
+    """
+    Upload files, or without an uploader only calculate their CIDs.
 
-    if response.status_code != 200:
-        logger.error('Pin Status Code: {}'.format(response.status_code))
-        raise Exception('Pin Status Code: {}'.format(response.status_code))
+    @return {filename: CID}
+    """
 
-    pin_json = response.json()
-    if ipfs_hash not in pin_json['Pins']:
-        logger.error('WUT?  {} != {}'.format(pin_json['Pins'], ipfs_hash))
-        raise Exception('WUT?  {} != {}'.format(pin_json['Pins'], ipfs_hash))
+    if uploader != None:
+        return uploader.upload_all(filenames, check_pins)
 
-    return True
+    cids = {}
+    for filename in filenames:
+        cids[filename] = tcr.cid.calc_file_cid(filename)
+        logger.info('CID: {} = {}'.format(filename, cids[filename]))
+    return cids
 
 def main():
     global logger
 
     # Set parameters for the transactions
     parser = argparse.ArgumentParser(add_help=False)
-    parser.add_argument('--projectid', required=True,
+    parser.add_argument('--projectid', required=False,
                                        action='store',
+                                       default=None,
                                        metavar='ID',
                                        help='Project ID from infura.io')
-    parser.add_argument('--projectsecret', required=True,
+    parser.add_argument('--projectsecret', required=False,
                                            action='store',
+                                           default=None,
                                            metavar='ID',
                                            help='Project secret from infura.io')
     parser.add_argument('--network', required=False,
@@ -128,6 +134,18 @@ def main():
                                      default=None,
                                      metavar='NAME',
                                      help='Filename to upload and pin')
+    parser.add_argument('--workers', required=False,
+                                     action='store',
+                                     type=int,
+                                     default=DEFAULT_WORKERS,
+                                     metavar='COUNT',
+                                     help='Number of files to upload at the same time, default = {}'.format(DEFAULT_WORKERS))
+    parser.add_argument('--check-pins', required=False,
+                                        action='store_true',
+                                        help='Skip files already pinned even if they are not in the upload manifest')
+    parser.add_argument('--offline', required=False,
+                                     action='store_true',
+                                     help='Calculate the CIDs locally and update the metadata without uploading')
 
     args = parser.parse_args()
 
@@ -136,6 +154,9 @@ def main():
     network = args.network
     drop_name = args.drop
     filename = args.file
+    workers = args.workers
+    check_pins = args.check_pins
+    offline = args.offline
 
     tcr.nftmint.setup_logging(network, 'ipfs')
     logger = logging.getLogger(network)
@@ -151,6 +172,10 @@ def main():
         logger.error('Invalid parameters.  With --file, Do not set --network and --drop')
         raise Exception('Invalid parameters.  With --file, Do not set --network and --drop')
 
+    if not offline and (projectid == None or projectsecret == None):
+        logger.error('Invalid parameters.  Must give --projectid and --projectsecret')
+        raise Exception('Invalid parameters.  Must give --projectid and --projectsecret')
+
     if filename == None:
         # Upload and update content in a drop metametadata file
         if not network in tcr.command.networks:
@@ -160,48 +185,51 @@ def main():
         logger.info('Network: {}'.format(network))
         logger.info('Drop: {}'.format(drop_name))
 
+        uploader = None
+        if not offline:
+            uploader = Uploader(projectid, projectsecret, get_manifest(network, drop_name), max_workers=workers)
         metametadata = get_metametadata(network, drop_name)
         if 'cards' in metametadata and len(metametadata['cards']) > 0:
-            for card in metametadata['cards']:
-                nftfilename = './nft/{}/{}/{}'.format(network, drop_name, card['local_source'])
-                ipfs_hash = ipfs_upload(projectid, projectsecret, nftfilename)
-                pin_state = ipfs_pin(projectid, projectsecret, ipfs_hash)
-                logger.info('PIN State: {}'.format(pin_state))
-                logger.info('   Verify: http://ipfs.io/ipfs/{}'.format(ipfs_hash))
-                logger.info('')
-                card['image'] = 'ipfs://{}'.format(ipfs_hash)
+            nftfilenames = ['./nft/{}/{}/{}'.format(network, drop_name, card['local_source']) for card in metametadata['cards']]
+            cids = get_cids(uploader, nftfilenames, check_pins)
+            for (card, nftfilename) in zip(metametadata['cards'], nftfilenames):
+                card['image'] = 'ipfs://{}'.format(cids[nftfilename])
             set_metametadata(network, drop_name, metametadata)
         elif 'layer-sets' in metametadata and len(metametadata['layer-sets']) > 0:
+            # Upload every image first then save each changed metadata file once
             metadataset = get_metadataset(network, drop_name)
+            updates = []
             for filename in metadataset['files']:
-                nftmetadata = {}
-                logger.info("Open NFT Metadata: {}".format(filename))
+                logger.debug("Open NFT Metadata: {}".format(filename))
                 with open(filename, 'r') as mdfile:
                     nftmetadata = json.load(mdfile)
 
-                policy_id = list(nftmetadata['721'].keys())[0]
-                token_name = list(nftmetadata['721'][policy_id].keys())[0]
-                if not nftmetadata['721'][policy_id][token_name]['image'].startswith('ipfs://'):
-                    logger.info('Upload: {} / {}'.format(nftmetadata['721'][policy_id][token_name]['image'], filename))
-                    ipfs_hash = ipfs_upload(projectid, projectsecret, nftmetadata['721'][policy_id][token_name]['image'])
-                    pin_state = ipfs_pin(projectid, projectsecret, ipfs_hash)
-                    logger.info('PIN State: {}'.format(pin_state))
-
-                    nftmetadata['721'][policy_id][token_name]['image'] = 'ipfs://{}'.format(ipfs_hash)
-                    with open(filename, 'w') as f:
-                        f.write(json.dumps(nftmetadata, indent=4))
-                        logger.info('Saved MetaMetaData: {}'.format(filename))
-
-                    logger.info('   Verify: http://ipfs.io/ipfs/{}'.format(ipfs_hash))
-                    logger.info('')
+                image = get_image_token(nftmetadata)['image']
+                if not image.startswith('ipfs://'):
+                    updates.append((filename, nftmetadata, image))
+
+            logger.info('Upload: {} of {} images'.format(len(updates), len(metadataset['files'])))
+            cids = get_cids(uploader, [image for (filename, nftmetadata, image) in updates], check_pins)
+            for (filename, nftmetadata, image) in updates:
+                get_image_token(nftmetadata)['image'] = 'ipfs://{}'.format(cids[image])
+                set_nft_metadata(filename, nftmetadata)
+            logger.info('Saved {} NFT Metadata files'.format(len(updates)))
+
+            # The minter reads the metadata from the pack, compile it again
+            if len(updates) > 0:
+                tcr.metadata_store.build_pack('nft/{}/{}/{}.json'.format(network, drop_name, drop_name))
+
+        if uploader != None:
+            uploader.close()
     else:
         # Just upload and pin the specified file
         logger.info('File: {}'.format(filename))
-        ipfs_hash = ipfs_upload(projectid, projectsecret, filename)
-        pin_state = ipfs_pin(projectid, projectsecret, ipfs_hash)
-        logger.info('PIN State: {}'.format(pin_state))
-        logger.info('   Verify: http://ipfs.io/ipfs/{}'.format(ipfs_hash))
-        logger.info('')
+        if offline:
+            logger.info('CID: {}'.format(tcr.cid.calc_file_cid(filename)))
+        else:
+            uploader = Uploader(projectid, projectsecret)
+            uploader.upload(filename)
+            uploader.close()
 
 if __name__ == '__main__':
     try:
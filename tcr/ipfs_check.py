@@ -21,7 +21,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from typing import Dict
+from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 import json
 import logging
@@ -31,6 +33,9 @@ import tcr.command
 import tcr.nftmint
 import traceback
 import hashlib
+import time
+from requests.adapters import HTTPAdapter
+from tcr.uploader import hash_file
 
 """
 File: ipfs_check.py
@@ -41,22 +46,167 @@ sure each metadata file has been correctly updated as well as the file on IPFS
 is able to be downloaded and matches the original
 """
 
-logger = None
+logger = logging.getLogger('ipfs')
 
-def calc_sha256(filepath: str) :
-    BLOCKSIZE = 65536
-    hasher = hashlib.sha256()
-    with open(filepath, 'rb') as afile:
-        buf = afile.read(BLOCKSIZE)
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = afile.read(BLOCKSIZE)
-    return hasher.hexdigest()
+DEFAULT_GATEWAY = 'http://ipfs.io/ipfs/'
+DEFAULT_WORKERS = 16
+DOWNLOAD_TIMEOUT = 60
+DOWNLOAD_RETRIES = 3
+BLOCKSIZE = 65536
+
+# Local hashes keyed by path, reused while the size and mtime are the same
+CACHE_FILE = '.ipfs_check_cache.json'
+REPORT_FILE = 'ipfs_check_report.json'
 
 def sort_filename(value: str) -> int:
     number = value.split('x')[2]
     return int(number)
 
+def get_image_cid(metadata_file: str) -> str:
+    with open(metadata_file, 'r') as file:
+        md = json.load(file)
+    erc721 = md['721']
+    policy = erc721[list(erc721.keys())[0]]
+    token = policy[list(policy.keys())[0]]
+
+    image = token['image']
+    return image[7:]
+
+def get_local_hashes(filenames: List[str], cache_file: str = None, max_workers: int = None) -> Dict[str, Dict]:
+    """
+    Hash local files in a pool of processes.  Files with the same size and
+    modification time as in the cache are not read again.
+
+    @return {filename: {'size', 'mtime', 'sha256', 'cid'}}
+    """
+
+    cache = {}
+    if cache_file != None and os.path.isfile(cache_file):
+        with open(cache_file, 'r') as file:
+            cache = json.load(file)
+
+    hashes = {}
+    missing = []
+    for filename in filenames:
+        stat = os.stat(filename)
+        entry = cache.get(filename)
+        if entry != None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            hashes[filename] = entry
+        else:
+            hashes[filename] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            missing.append(filename)
+
+    logger.info('Local hashes: {} cached, {} to calculate'.format(len(filenames) - len(missing), len(missing)))
+    if max_workers != None and max_workers <= 1:
+        results = map(hash_file, missing)
+        for (filename, (sha256, cid)) in zip(missing, results):
+            hashes[filename].update({'sha256': sha256, 'cid': cid})
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(hash_file, missing, chunksize=max(1, len(missing) // 64))
+            for (filename, (sha256, cid)) in zip(missing, results):
+                hashes[filename].update({'sha256': sha256, 'cid': cid})
+
+    if cache_file != None and len(missing) > 0:
+        cache.update(hashes)
+        temp_file = '{}.tmp'.format(cache_file)
+        with open(temp_file, 'w') as file:
+            file.write(json.dumps(cache))
+        os.replace(temp_file, cache_file)
+
+    return hashes
+
+def download_sha256(session: requests.Session, url: str) -> Tuple[str, int]:
+    """
+    Stream a download through the hasher so the file is never held in memory.
+
+    @return (sha256 hex digest, size)
+    """
+
+    attempt = 0
+    while True:
+        try:
+            hasher = hashlib.sha256()
+            size = 0
+            with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code != 200:
+                    raise Exception('Download Status Code: {}'.format(response.status_code))
+                for chunk in response.iter_content(BLOCKSIZE):
+                    hasher.update(chunk)
+                    size += len(chunk)
+            return (hasher.hexdigest(), size)
+        except Exception as e:
+            attempt += 1
+            if attempt >= DOWNLOAD_RETRIES:
+                raise
+            logger.warning('Download {} failed, retry: {}'.format(url, e))
+            time.sleep(attempt)
+
+def verify(items: List[Tuple[str, str]],
+           gateway: str = DEFAULT_GATEWAY,
+           max_workers: int = DEFAULT_WORKERS,
+           offline: bool = False,
+           cache_file: str = None,
+           hash_workers: int = None) -> Dict:
+    """
+    Compare each image with the content of the CID in its metadata.
+
+    @param items [(metadata file, image file), ...]
+    @param offline Compare the CIDs calculated locally instead of downloading
+    @return Report with 'checked', 'mismatches' and 'timings'
+    """
+
+    start_time = time.time()
+    hashes = get_local_hashes([image_file for (metadata_file, image_file) in items], cache_file, hash_workers)
+    hash_time = time.time()
+
+    cids = [get_image_cid(metadata_file) for (metadata_file, image_file) in items]
+    mismatches = []
+    downloads = []
+
+    if offline:
+        for ((metadata_file, image_file), cid) in zip(items, cids):
+            if hashes[image_file]['cid'] != cid:
+                logger.error('CID Not Equal!!  {}: {} != {}'.format(metadata_file, hashes[image_file]['cid'], cid))
+                mismatches.append({'metadata': metadata_file, 'image': image_file, 'cid': cid,
+                                   'local-cid': hashes[image_file]['cid']})
+    else:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        def download(cid: str) -> Dict:
+            download_start = time.time()
+            try:
+                (sha256, size) = download_sha256(session, '{}{}'.format(gateway, cid))
+                return {'sha256': sha256, 'size': size, 'seconds': time.time() - download_start}
+            except Exception as e:
+                return {'error': str(e), 'seconds': time.time() - download_start}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for ((metadata_file, image_file), cid, result) in zip(items, cids, executor.map(download, cids)):
+                logger.info('Verify: {} {:.2f}s'.format(metadata_file, result['seconds']))
+                downloads.append(result['seconds'])
+                local_sha256 = hashes[image_file]['sha256']
+                if result.get('sha256') != local_sha256:
+                    logger.error('HASH Not Equal!!  {}: {}'.format(metadata_file, result.get('error', result.get('sha256'))))
+                    mismatch = {'metadata': metadata_file, 'image': image_file, 'cid': cid, 'local-sha256': local_sha256}
+                    mismatch.update(result)
+                    mismatches.append(mismatch)
+        session.close()
+
+    end_time = time.time()
+    timings = {'local-hash-seconds': hash_time - start_time,
+               'verify-seconds': end_time - hash_time,
+               'total-seconds': end_time - start_time}
+    if len(downloads) > 0:
+        downloads.sort()
+        timings['download-seconds-median'] = downloads[len(downloads) // 2]
+        timings['download-seconds-max'] = downloads[-1]
+
+    return {'checked': len(items), 'mismatches': mismatches, 'timings': timings}
+
 def main():
     global logger
 
@@ -76,11 +226,37 @@ def main():
                                        type=int,
                                        default=0,
                                        help='Start index, default = 0')
+    parser.add_argument('--offline',   required=False,
+                                       action='store_true',
+                                       help='Compare the CIDs calculated locally instead of downloading')
+    parser.add_argument('--workers',   required=False,
+                                       action='store',
+                                       metavar='COUNT',
+                                       type=int,
+                                       default=DEFAULT_WORKERS,
+                                       help='Downloads at the same time, default = {}'.format(DEFAULT_WORKERS))
+    parser.add_argument('--gateway',   required=False,
+                                       action='store',
+                                       metavar='URL',
+                                       default=DEFAULT_GATEWAY,
+                                       help='IPFS gateway, default = {}'.format(DEFAULT_GATEWAY))
+    parser.add_argument('--report',    required=False,
+                                       action='store',
+                                       metavar='FILE',
+                                       default=None,
+                                       help='JSON report, default = <directory>/{}'.format(REPORT_FILE))
 
     args = parser.parse_args()
     directory = args.directory
     network = args.network
     start = args.start
+    offline = args.offline
+    workers = args.workers
+    gateway = args.gateway
+    report_file = args.report
+
+    if report_file == None:
+        report_file = os.path.join(directory, REPORT_FILE)
 
     tcr.nftmint.setup_logging(network, 'ipfs_check')
     logger = logging.getLogger(network)
@@ -98,29 +274,19 @@ def main():
         logger.error('Length not equal, {} != {}'.format(len(image_files), len(metadata_files)))
 
     logger.info('Start at index = {}'.format(start))
-    for i in range(start, len(image_files)):
-        with open(os.path.join(md_dir, metadata_files[i]), 'r') as file:
-                md = json.load(file)
-                erc721 = md['721']
-                policy = erc721[list(erc721.keys())[0]]
-                token = policy[list(policy.keys())[0]]
-
-                image = token['image']
-                cid = image[7:]
-
-                logger.info('Verify: {}'.format(metadata_files[i]))
-                download_url = 'http://ipfs.io/ipfs/{}'.format(cid)
-                logger.info('Download: {}'.format(download_url))
-                r = requests.get(download_url)
-                hasher = hashlib.sha256()
-                hasher.update(r.content)
-                ipfs_hash = hasher.hexdigest()
-                logger.info('Compare: {}'.format(image_files[i]))
-                local_hash = calc_sha256(os.path.join(img_dir, image_files[i]))
-
-                if local_hash != ipfs_hash:
-                    logger.error('HASH Not Equal!!')
-                    raise Exception('HASH Not Equal!!')
+    items = [(os.path.join(md_dir, metadata_files[i]), os.path.join(img_dir, image_files[i]))
+             for i in range(start, min(len(image_files), len(metadata_files)))]
+
+    report = verify(items, gateway, workers, offline, os.path.join(directory, CACHE_FILE))
+    with open(report_file, 'w') as file:
+        file.write(json.dumps(report, indent=4))
+
+    logger.info('Checked: {}, Mismatches: {}'.format(report['checked'], len(report['mismatches'])))
+    logger.info('Report: {}'.format(report_file))
+
+    if len(report['mismatches']) > 0:
+        logger.error('HASH Not Equal!!')
+        raise Exception('HASH Not Equal!!')
 
 if __name__ == '__main__':
     try:
@@ -26,15 +26,34 @@ File: metadata_list.py
 Author: SuperKK
 """
 
+from typing import List
 import logging
 import json
+import os
 
 logger = logging.getLogger('metadata-list')
 
 class MetadataList:
+    """
+    Queue of the NFT metadata files remaining in a drop.
+
+    The metadata set file is never rewritten.  The number of files committed
+    is kept in a cursor file next to it, <metadata set file>.cursor, which is
+    replaced atomically on each commit.  The cursor also records the last
+    committed file so a cursor that does not belong to the metadata set is
+    detected instead of silently skipping NFTs.
+
+    Files committed for a mint transaction that never made it on chain are
+    given back with return_files.  They are kept in the cursor file and handed
+    out again before the rest of the set.
+    """
+
     def __init__(self, metadata_set_file):
         self.metadata_set_file = metadata_set_file
+        self.cursor_file = '{}.cursor'.format(metadata_set_file)
         self.metadata_list = {}
+        self.offset = 0
+        self.returned = []
         self.peek_index = 0
 
         with open(self.metadata_set_file, 'r') as file:
@@ -49,21 +68,86 @@ class MetadataList:
                 logger.error('MetadataList, Series Metadata Set missing \"files\"')
                 raise Exception('MetadataList, Series Metadata Set missing \"files\"')
 
+        try:
+            with open(self.cursor_file, 'r') as file:
+                cursor = json.loads(file.read())
+        except FileNotFoundError as e:
+            cursor = {'offset': 0, 'last': None, 'returned': []}
+
+        files = self.metadata_list['files']
+        offset = cursor['offset']
+        if offset < 0 or offset > len(files) or (offset > 0 and files[offset - 1] != cursor['last']):
+            logger.error('MetadataList, Cursor: {} does not match: {}'.format(self.cursor_file, metadata_set_file))
+            raise Exception('MetadataList, Cursor: {} does not match: {}'.format(self.cursor_file, metadata_set_file))
+
+        self.offset = offset
+        self.returned = cursor.get('returned', [])
+
     def get_remaining(self) -> int:
-        return len(self.metadata_list['files']) - self.peek_index
+        return len(self.metadata_list['files']) - self.offset + len(self.returned) - self.peek_index
 
     def peek_next_file(self) -> str:
-        filename = self.metadata_list['files'][self.peek_index]
+        if self.peek_index < len(self.returned):
+            filename = self.returned[self.peek_index]
+        else:
+            filename = self.metadata_list['files'][self.offset + self.peek_index - len(self.returned)]
         self.peek_index += 1
         return filename
 
+    def get_next_files(self, count: int) -> List[str]:
+        """
+        The files the next count calls to peek_next_file will return, without
+        peeking at them.  Fewer are returned if not enough remain.
+        """
+
+        count = min(count, self.get_remaining())
+        start = self.peek_index
+        files = self.returned[start:start + count]
+        start = self.offset + max(0, start - len(self.returned))
+        files.extend(self.metadata_list['files'][start:start + count - len(files)])
+        return files
+
     def revert(self) -> None:
         self.peek_index = 0
 
     def commit(self) -> None:
-        while self.peek_index > 0:
-            self.metadata_list['files'].pop(0)
-            self.peek_index -= 1
+        if self.peek_index == 0:
+            return
+
+        from_returned = min(self.peek_index, len(self.returned))
+        returned = self.returned[from_returned:]
+        offset = self.offset + self.peek_index - from_returned
+        self.write_cursor(offset, returned)
+
+        self.offset = offset
+        self.returned = returned
+        self.peek_index = 0
+
+    def return_files(self, files: List[str]) -> None:
+        """
+        Give back committed files so they are handed out again, e.g. the mint
+        transaction they were committed for was dropped.  Nothing can be
+        peeked at when files are returned.
+        """
+
+        if self.peek_index != 0:
+            logger.error('MetadataList, Return files while {} files are peeked'.format(self.peek_index))
+            raise Exception('MetadataList, Return files while {} files are peeked'.format(self.peek_index))
+
+        returned = self.returned + files
+        self.write_cursor(self.offset, returned)
+        self.returned = returned
+        logger.info('MetadataList, Returned {} files'.format(len(files)))
+
+    def write_cursor(self, offset: int, returned: List[str]) -> None:
+        last = None
+        if offset > 0:
+            last = self.metadata_list['files'][offset - 1]
+        cursor = {'offset': offset, 'last': last, 'returned': returned}
 
-        with open(self.metadata_set_file, 'w') as file:
-            file.write(json.dumps(self.metadata_list, indent=4))
+        temp_file = '{}.tmp'.format(self.cursor_file)
+        with open(temp_file, 'w') as file:
+            file.write(json.dumps(cursor))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.cursor_file)
@@ -0,0 +1,230 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: metadata_store.py
+Author: SuperKK
+
+The metadata of every NFT in a drop, kept in memory so the mint path never
+reads or writes metadata files.
+
+A drop can be compiled into a pack, <metadata set file>.pack, so the metadata
+is read from one file instead of one file per NFT.  The pack is JSON lines:
+
+    {metadata of the first file}
+    ...
+    {metadata of the last file}
+    {"version": 2, "files": {filename: [offset, length, size, mtime_ns], ...}}
+    <offset of the index line, 19 digits>
+
+The index is found from the last line and each file is read from a memory map
+by its offset, without parsing the rest of the pack.  The size and
+modification time of each metadata file when it was packed are kept so a
+file changed afterwards is detected.
+"""
+
+from typing import Dict, List, Tuple
+import json
+import logging
+import mmap
+import os
+
+from tcr.nft import Nft
+
+logger = logging.getLogger('metadata-store')
+
+PACK_VERSION = 2
+
+# The last line of a pack, the index offset and a new line
+PACK_FOOTER_SIZE = 20
+
+def get_pack_file(metadata_set_file: str) -> str:
+    return '{}.pack'.format(metadata_set_file)
+
+def build_pack(metadata_set_file: str) -> str:
+    """
+    Compile the metadata files of a drop into one pack file.  Run again
+    whenever the metadata files change, e.g. after the images are uploaded.
+
+    @return The pack file
+    """
+
+    with open(metadata_set_file, 'r') as file:
+        files = json.load(file)['files']
+
+    pack_file = get_pack_file(metadata_set_file)
+    temp_file = '{}.tmp'.format(pack_file)
+    index = {}
+    with open(temp_file, 'wb') as pack:
+        offset = 0
+        for filename in files:
+            with open(filename, 'r') as file:
+                stat = os.fstat(file.fileno())
+                line = json.dumps(json.load(file), separators=(',', ':')).encode('utf-8')
+            pack.write(line + b'\n')
+            index[filename] = [offset, len(line), stat.st_size, stat.st_mtime_ns]
+            offset += len(line) + 1
+
+        pack.write(json.dumps({'version': PACK_VERSION, 'files': index}).encode('utf-8') + b'\n')
+        pack.write('{:019}\n'.format(offset).encode('utf-8'))
+        pack.flush()
+        os.fsync(pack.fileno())
+    os.replace(temp_file, pack_file)
+
+    logger.info('MetadataStore, Packed {} files: {}'.format(len(files), pack_file))
+    return pack_file
+
+class DropPack:
+    """
+    Read only view of a pack file.
+    """
+
+    def __init__(self, pack_file: str):
+        self.pack_file = pack_file
+        with open(pack_file, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index_offset = int(self.map[-PACK_FOOTER_SIZE:])
+        index = json.loads(self.map[index_offset:-PACK_FOOTER_SIZE])
+        self.version = index['version']
+        self.index = index['files']
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def is_current(self, files: List[str]) -> bool:
+        """
+        Check that every file is in the pack and has not changed since it
+        was packed.  Only the files are stat'ed, none are opened.
+        """
+
+        if self.version != PACK_VERSION:
+            logger.warning('MetadataStore, Pack version {} is not {}'.format(self.version, PACK_VERSION))
+            return False
+
+        for filename in files:
+            if not filename in self.index:
+                logger.warning('MetadataStore, Not in pack: {}'.format(filename))
+                return False
+
+            (offset, length, size, mtime_ns) = self.index[filename]
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError as e:
+                # The pack still has the metadata
+                continue
+
+            if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                logger.warning('MetadataStore, Changed since packed: {}'.format(filename))
+                return False
+
+        return True
+
+    def get(self, filename: str) -> Dict:
+        """
+        @return The metadata of filename as it was when the pack was built
+        """
+
+        (offset, length, size, mtime_ns) = self.index[filename]
+        return json.loads(self.map[offset:offset + length])
+
+    def close(self) -> None:
+        self.map.close()
+
+def open_pack(metadata_set_file: str, files: List[str]) -> DropPack:
+    """
+    Open the pack of a drop.  It is built first if it does not exist, is
+    older than the metadata set file, does not have every file or one of the
+    files changed since it was packed.
+
+    @param files The metadata files that will be read from the pack
+    """
+
+    pack_file = get_pack_file(metadata_set_file)
+    if (os.path.isfile(pack_file) and
+            os.path.getmtime(pack_file) >= os.path.getmtime(metadata_set_file)):
+        pack = DropPack(pack_file)
+        if pack.is_current(files):
+            return pack
+        pack.close()
+        logger.warning('MetadataStore, Pack is out of date, rebuild: {}'.format(pack_file))
+
+    return DropPack(build_pack(metadata_set_file))
+
+class MetadataStore:
+    """
+    Parsed metadata of NFT metadata files, indexed by file name.  With a pack
+    the metadata is read from the pack when it is needed.  Without one the
+    files are read once when the drop is loaded.  Merged transaction metadata
+    is built from memory and passed to the mint functions as a dictionary.
+    """
+
+    def __init__(self, files: List[str] = None, pack: DropPack = None):
+        self.pack = pack
+        self.nfts = {}
+        if pack != None:
+            logger.info('MetadataStore, Opened pack with {} files: {}'.format(len(pack), pack.pack_file))
+        else:
+            for filename in (files if files != None else []):
+                self.nfts[filename] = Nft.parse_metadata_file(filename)
+            logger.info('MetadataStore, Loaded {} files'.format(len(self.nfts)))
+
+    def get(self, filename: str) -> Dict:
+        """
+        @return The metadata in the format returned by Nft.parse_metadata
+        """
+
+        if not filename in self.nfts:
+            # The pack does not change while it is open, parse each file once
+            if self.pack != None and filename in self.pack:
+                self.nfts[filename] = Nft.parse_metadata(self.pack.get(filename))
+            else:
+                self.nfts[filename] = Nft.parse_metadata_file(filename)
+        return self.nfts[filename]
+
+    def get_token(self, filename: str) -> Tuple[str, Dict]:
+        """
+        @return (token name, properties) of a single asset file
+        """
+
+        nftmd = self.get(filename)
+        token_name = nftmd['token-names'][0]
+        return (token_name, nftmd['properties'][token_name])
+
+    def merge(self, policy_id: str, files: List[str]) -> Dict:
+        """
+        Merge the metadata of single asset files into one transaction metadata,
+        the same as Nft.merge_metadata without reading the files.
+
+        @return {'721': {policy_id: {token_name: {...}, ...}}}
+        """
+
+        merged = {}
+        for filename in files:
+            (token_name, properties) = self.get_token(filename)
+            merged[token_name] = properties
+
+        return {'721': {policy_id: merged}}
@@ -162,10 +162,12 @@ def process_requests(network: str, wallet_name: str) -> None:
     (utxos, total_lovelace) = cardano.query_utxos(wallet,
                                                   [wallet.get_payment_address(addr_index, delegated=True),
                                                    wallet.get_payment_address(addr_index, delegated=False)])
+    inputs = database.query_utxo_inputs_by_txids([utxo['tx-hash'] for utxo in utxos])
     for utxo in utxos:
-        inputs = database.query_utxo_inputs(utxo['tx-hash'])
-        utxo['from'] = inputs[0]['address']
-        utxo['from_stake'] = database.query_stake_address(utxo['from'])
+        utxo['from'] = inputs[utxo['tx-hash']][0]['address']
+    stake_addresses = database.query_stake_addresses([utxo['from'] for utxo in utxos])
+    for utxo in utxos:
+        utxo['from_stake'] = stake_addresses[utxo['from']]
 
     # Setup directories for output files
     if not os.path.exists('normie_pkg'):
@@ -179,11 +181,13 @@ def process_requests(network: str, wallet_name: str) -> None:
     # Process the request and build the mutation package
     logger.info('Mutation Address: {}'.format(wallet.get_payment_address(addr_index)))
     requests = get_collection()
+    owners = database.query_owners_by_fingerprints([r['normie_asset_id'] for r in requests] +
+                                                   [r['mutation_asset_id'] for r in requests])
 
     for r in requests:
         logger.info('Process: {}:\r\n{}/{}'.format(r['from'], r['normie_asset_id'], r['mutation_asset_id']))
-        normie_owner = database.query_owner_by_fingerprint(r['normie_asset_id'])
-        mutation_owner = database.query_owner_by_fingerprint(r['mutation_asset_id'])
+        normie_owner = owners[r['normie_asset_id']]
+        mutation_owner = owners[r['mutation_asset_id']]
 
         if normie_owner != mutation_owner:
             logger.error('Owner mismatch for {}: {} != {}'.format(r['from'], r['normie_asset_id'], r['mutation_asset_id']))
@@ -32,6 +32,11 @@ import os
 import time
 import random
 from tcr.command import Command
+from tcr.compositor import Compositor
+from tcr.drop import DropContext
+from tcr.drop import DropProgress
+from tcr.phash import BKTree
+from tcr.phash import dhash_file
 import logging
 import hashlib
 import numpy
@@ -42,10 +47,10 @@ logger = logging.getLogger('nft')
 
 class Nft:
     @staticmethod
-    def parse_metadata_file(metadata_file: str) -> Dict:
+    def parse_metadata(raw_md: Dict) -> Dict:
         """
-        Parse a NFT metadata file.  The metadata file can define a single asset
-        or multiple assets.
+        Parse NFT metadata already in memory.  The metadata can define a single
+        asset or multiple assets.
 
         The returned dictionary will look like this:
         {
@@ -60,27 +65,37 @@ class Nft:
 
         """
         metadata = {}
-        with open(metadata_file, 'r') as file:
-            raw_md = json.load(file)
-            if '721' in raw_md:
-                policy_id = list(raw_md['721'].keys())[0]
-                token_names = list(raw_md['721'][policy_id].keys())
-                metadata['policy-id'] = policy_id
-                metadata['token-names'] = token_names
-                metadata['properties'] = {}
-                for token_name in token_names:
-                    metadata['properties'][token_name] = raw_md['721'][policy_id][token_name]
-            elif '777' in raw_md:
-                metadata['policy-id'] = '777'
-                metadata['token-names'] = ['']
-                metadata['properties'] = {'': {}}
+        if '721' in raw_md:
+            policy_id = list(raw_md['721'].keys())[0]
+            token_names = list(raw_md['721'][policy_id].keys())
+            metadata['policy-id'] = policy_id
+            metadata['token-names'] = token_names
+            metadata['properties'] = {}
+            for token_name in token_names:
+                metadata['properties'][token_name] = raw_md['721'][policy_id][token_name]
+        elif '777' in raw_md:
+            metadata['policy-id'] = '777'
+            metadata['token-names'] = ['']
+            metadata['properties'] = {'': {}}
 
         return metadata
 
     @staticmethod
-    def merge_metadata_files(policy_id: str, nft_metadata_files: List[str]) -> str:
-        directory = os.path.dirname(nft_metadata_files[0])
-        merged_file = os.path.join(directory, 'nft_merged_metadata_{}.json'.format(round(time.time())))
+    def parse_metadata_file(metadata_file: str) -> Dict:
+        """
+        Parse a NFT metadata file, see parse_metadata.
+        """
+
+        with open(metadata_file, 'r') as file:
+            return Nft.parse_metadata(json.load(file))
+
+    @staticmethod
+    def merge_metadata(policy_id: str, nft_metadata_files: List[str]) -> Dict:
+        """
+        Merge the metadata of single asset files into one transaction metadata.
+
+        @return {'721': {policy_id: {token_name: {...}, ...}}}
+        """
 
         nft_merged_metadata = {}
         nft_merged_metadata['721'] = {}
@@ -90,6 +105,15 @@ class Nft:
             token_name = nftmd['token-names'][0]
             nft_merged_metadata['721'][policy_id][token_name] = nftmd['properties'][token_name]
 
+        return nft_merged_metadata
+
+    @staticmethod
+    def merge_metadata_files(policy_id: str, nft_metadata_files: List[str]) -> str:
+        directory = os.path.dirname(nft_metadata_files[0])
+        merged_file = os.path.join(directory, 'nft_merged_metadata_{}.json'.format(round(time.time())))
+
+        nft_merged_metadata = Nft.merge_metadata(policy_id, nft_metadata_files)
+
         with open(merged_file, 'w') as file:
             file.write(json.dumps(nft_merged_metadata, indent=4))
 
@@ -163,16 +187,13 @@ class Nft:
         return fnames
 
     @staticmethod
-    def calculate_total_combinations(metametadata: Dict):
+    def calculate_total_combinations(metametadata: Dict, context: DropContext = None):
+        if context == None:
+            context = DropContext(metametadata)
+
         total = 0
-        layer_sets = metametadata['layer-sets']
         layer_set_weight = 0
-        dir = os.path.dirname(os.path.abspath(metametadata['self']))
-        for layer_set_item in layer_sets:
-            with open(os.path.join(dir, layer_set_item['file']), 'r') as ls_file:
-                logger.info("Opening Layer Set: {}".format(layer_set_item['file']))
-                layer_set = json.load(ls_file)
-
+        for (layer_set_item, layer_set) in zip(context.layer_set_items, context.layer_sets):
             layer_set_weight += layer_set_item['weight']
             combos = 1
             for layer in layer_set['layers']:
@@ -180,13 +201,9 @@ class Nft:
                 combos = combos * len(layer['images'])
                 image_weight_total = 0
                 for image in layer['images']:
-                    #logger.debug('{} + {} = {}'.format(image_weight_total, image['weight'], image_weight_total+image['weight']))
                     image_weight_total += image['weight']
                     if image['image'] != None:
-                        dir = os.path.dirname(os.path.abspath(metametadata['self']))
-                        image_path = os.path.join(dir, image['image'])
-                        im = Image.open(image_path)
-                        (width, height) = im.size
+                        (width, height) = context.get_image_size(image['image'])
                         if width != layer['width'] or height != layer['height']:
                             logger.error('{} != {} x {}'.format(image['image'], layer['width'], layer['height']))
 
@@ -197,6 +214,8 @@ class Nft:
             logger.info('{} = {}'.format(layer_set_item['file'], combos))
             total += combos
 
+        context.save_image_sizes()
+
         if layer_set_weight != 100:
             logger.error('Layer Set weight {} != 100'.format(layer_set_weight))
             raise Exception('Layer Set weight {} != 100'.format(layer_set_weight))
@@ -277,118 +296,99 @@ class Nft:
                            metametadata: Dict) -> None:
         drop_name = metametadata['drop-name']
 
-        total_combinations = Nft.calculate_total_combinations(metametadata)
+        context = DropContext(metametadata)
+        total_combinations = Nft.calculate_total_combinations(metametadata, context)
         logger.info('Total Combinations: {} images, Layer Sets: {} sets'.format(total_combinations, len(metametadata['layer-sets'])))
 
-        layer_sets = metametadata['layer-sets']
-        layer_set_obj = None
         card_number = 1
-        for layer_set_item in layer_sets:
-            dir = os.path.dirname(os.path.abspath(metametadata['self']))
-            with open(os.path.join(dir, layer_set_item['file']), 'r') as ls_file:
-                layer_set_obj = json.load(ls_file)
-                layers = layer_set_obj['layers']
-                for layer in layers:
-                    # TODO: Generalize layer names as parameters
-                    if layer['name'] == 'Character':
-                        character_image = layer['images'][0]['image']
-                        character_geometry = Nft.get_geometry(layer['images'][0]['offset-x'],
-                                                              layer['images'][0]['offset-y'])
-
-                    # TODO: Generalize layer names as parameters
-                    if layer['name'] == 'Mutation':
-                        for image in layer['images']:
-                            mutation_image = image['image']
-                            mutation_geometry = Nft.get_geometry(image['offset-x'],
-                                                                 image['offset-y'])
-                            result_name = 'nft/{}/{}/nft_img/{:05}_{}'.format(network, drop_name, card_number, os.path.basename(mutation_image))
-                            command = ['convert']
-                            command.extend(['nft/{}/{}/{}'.format(network, drop_name, character_image),
-                                            '-geometry', character_geometry])
-                            command.extend(['nft/{}/{}/{}'.format(network, drop_name, mutation_image),
-                                            '-geometry', mutation_geometry, '-composite'])
-                            command.extend(['-resize', '1200x1680'])
-                            command.append(result_name)
-                            logger.info('Create: {}'.format(result_name))
-                            Command.run_generic(command)
-                            card_number += 1
+        for layer_set_obj in context.layer_sets:
+            layers = layer_set_obj['layers']
+            for layer in layers:
+                # TODO: Generalize layer names as parameters
+                if layer['name'] == 'Character':
+                    character_image = layer['images'][0]['image']
+                    character_geometry = Nft.get_geometry(layer['images'][0]['offset-x'],
+                                                          layer['images'][0]['offset-y'])
+
+                # TODO: Generalize layer names as parameters
+                if layer['name'] == 'Mutation':
+                    for image in layer['images']:
+                        mutation_image = image['image']
+                        mutation_geometry = Nft.get_geometry(image['offset-x'],
+                                                             image['offset-y'])
+                        result_name = 'nft/{}/{}/nft_img/{:05}_{}'.format(network, drop_name, card_number, os.path.basename(mutation_image))
+                        command = ['convert']
+                        command.extend(['nft/{}/{}/{}'.format(network, drop_name, character_image),
+                                        '-geometry', character_geometry])
+                        command.extend(['nft/{}/{}/{}'.format(network, drop_name, mutation_image),
+                                        '-geometry', mutation_geometry, '-composite'])
+                        command.extend(['-resize', '1200x1680'])
+                        command.append(result_name)
+                        logger.info('Create: {}'.format(result_name))
+                        Command.run_generic(command)
+                        card_number += 1
 
         return None
 
     @staticmethod
-    def create_random_drop_set(network: str,
-                         policy_id: str,
-                         metametadata: Dict,
-                         rng: numpy.random.RandomState) -> List[str]:
-        series = metametadata['series']
-        drop_name = metametadata['drop-name']
-        init_nft_id = metametadata['init-nft-id']
-        base_token_name = metametadata['token-name']
-        base_nft_name = metametadata['nft-name']
+    def add_unique_image(image_hashes: Dict,
+                         image_index: BKTree,
+                         filename: str,
+                         sha256: str,
+                         dhash: int,
+                         max_distance: int = None) -> None:
+        """
+        Make sure a generated image is unique before adding it to the index.
 
-        image_hashes = {}
-        image_names = {}
+        Images with the same SHA-256 are always rejected.  With max_distance,
+        images whose perceptual hashes are within max_distance bits are
+        rejected as near duplicates.  Without it, images that look identical
+        are only logged.
+        """
 
-        total_combinations = Nft.calculate_total_combinations(metametadata)
-        logger.info('Total Combinations: {} images, Layer Sets: {} sets'.format(total_combinations, len(metametadata['layer-sets'])))
-        logger.info('NFTs to generate: {}'.format(metametadata['total']))
+        if sha256 in image_hashes:
+            logger.error('Found Duplicate NFT Image: {} exists at {} for {}'.format(image_hashes[sha256], sha256, filename))
+            raise Exception('Found Duplicate NFT Image: {} exists at {} for {}'.format(image_hashes[sha256], sha256, filename))
 
-        total_to_generate = metametadata['total']
-        fnames = []
+        similar = image_index.search(dhash, max_distance if max_distance != None else 0)
+        if len(similar) > 0:
+            (distance, similar_file) = min(similar)
+            if max_distance != None:
+                logger.error('Found Near Duplicate NFT Image: {} is {} bits from {}'.format(similar_file, distance, filename))
+                raise Exception('Found Near Duplicate NFT Image: {} is {} bits from {}'.format(similar_file, distance, filename))
+            logger.warning('Similar NFT Image: {} looks the same as {}'.format(similar_file, filename))
 
-        frequencies = [0] * 101
+        image_hashes[sha256] = filename
+        image_index.add(dhash, filename)
 
-        while len(fnames) < total_to_generate:
-            images = []
-            metadata = {}
-            properties = {}
+    @staticmethod
+    def plan_random_drop_set(network: str,
+                             metametadata: Dict,
+                             context: DropContext,
+                             rng: numpy.random.RandomState) -> List[Dict]:
+        """
+        Choose the layer images of every NFT in the drop without composing any
+        images.  The same rng state always gives the same plan.
 
-            logger.info('Created: {}'.format(len(fnames)))
-            # 1.  Randomly choose a layer-set according to weight of all
-            # layer sets.  The weight must add to 100
-            sum = 0
-            num = rng.random() * 100
-            frequencies[round(num)] += 1
-            layer_sets = metametadata['layer-sets']
-            layer_set_obj = None
-            for layer_set_item in layer_sets:
-                if num <= sum + layer_set_item['weight']:
-                    dir = os.path.dirname(os.path.abspath(metametadata['self']))
-                    with open(os.path.join(dir, layer_set_item['file']), 'r') as ls_file:
-                        layer_set_obj = json.load(ls_file)
-                    break
-                sum += layer_set_item['weight']
+        @return [{'card-number', 'file', 'layers', 'properties'}, ...]
+        """
 
-            if layer_set_obj == None:
-                logger.error('Unexpected layer_set_obj == None')
-                raise Exception('Unexpected layer_set_obj == None')
+        drop_name = metametadata['drop-name']
 
-            card_number = len(fnames) + 1
-            result_name = 'nft/{}/{}/nft_img/{:05}_'.format(network, drop_name, card_number)
+        plan = []
+        for (layer_set_index, image_indexes) in context.sample(metametadata['total'], rng):
+            layer_set_obj = context.layer_sets[layer_set_index]
+            card_number = len(plan) + 1
             image_name = '{}_'.format(layer_set_obj['name'])
-
-            # 2. Now iterate each layer in the chosen layer set and randomly
-            # select an image from it
-            for layer in layer_set_obj['layers']:
-                sum = 0
-                num = rng.random() * 100
-                frequencies[round(num)] += 1
-                img_obj = None
-                img_idx = 0
-                for image in layer['images']:
-                    if num <= sum + image['weight']:
-                        img_obj = image
-                        break
-                    sum += image['weight']
-                    img_idx += 1
-
-                if img_obj == None:
-                    logger.error('Unexpected image_obj == None')
-                    raise Exception('Unexpected image_obj == None')
-
+            layers = []
+            properties = {}
+            for (layer, img_idx) in zip(layer_set_obj['layers'], image_indexes):
+                img_obj = layer['images'][img_idx]
                 image_name = image_name + '_{}'.format(img_idx)
                 if img_obj['image'] != None:
-                    images.append(img_obj)
+                    layers.append(('nft/{}/{}/{}'.format(network, drop_name, img_obj['image']),
+                                   img_obj.get('offset-x', 0),
+                                   img_obj.get('offset-y', 0)))
 
                 # Add any metadata / properties associated with the image layer.  I suppose
                 # later layers could override some properties from previous layers
@@ -397,63 +397,95 @@ class Nft:
                     for k in layer_properties:
                         properties[k] = layer_properties[k]
 
-            # Construct the command to merge image layers
-            if image_name in image_names:
-                logger.info('Already exists, try again: {}'.format(image_name))
-                continue
+            plan.append({'card-number': card_number,
+                         'file': 'nft/{}/{}/nft_img/{:05}_{}.png'.format(network, drop_name, card_number, image_name),
+                         'layers': layers,
+                         'properties': properties})
 
-            image_names[image_name] = True
-            result_name = result_name + image_name + '.png'
-            logger.info('Create: {}'.format(result_name))
-            command = ['convert']
-            for image in images:
-                if 'offset-x' in image:
-                    if image['offset-x'] >= 0:
-                        geometry = '+{}'.format(image['offset-x'])
-                    else:
-                        geometry = '{}'.format(image['offset-x'])
-                else:
-                    geometry = '+0'
-
-                if 'offset-y' in image:
-                    if image['offset-y'] >= 0:
-                        geometry += '+{}'.format(image['offset-y'])
-                    else:
-                        geometry += '{}'.format(image['offset-y'])
-                else:
-                    geometry += '+0'
-
-                if len(command) == 1:
-                    command.extend(['nft/{}/{}/{}'.format(network, drop_name, image['image']), '-geometry', geometry])
-                else:
-                    command.extend(['nft/{}/{}/{}'.format(network, drop_name, image['image']), '-geometry', geometry, '-composite'])
-
-            # Resize if requested in the metametadata
-            if 'output-width' in metametadata and 'output-height' in metametadata:
-                command.extend(['-resize', '{}x{}'.format(metametadata['output-width'],
-                                                          metametadata['output-height'])])
-
-            # Set output name and run the command
-            command.append(result_name)
-            Command.run_generic(command)
-
-            # Make sure it got created
-            if not os.path.isfile(result_name):
-                logger.error('File is missing: {}'.format(result_name))
-                raise Exception('File is missing: {}'.format(result_name))
-
-            # Make sure the generated file is unique
-            logger.info('Verify Unique: {}'.format(result_name))
-            hash = Nft.calc_sha256(result_name)
-            if hash in image_hashes:
-                logger.error('Found Duplicate NFT Image: {} exists at {} for {}'.format(image_hashes[hash], hash, result_name))
-                raise Exception('Found Duplicate NFT Image: {} exists at {} for {}'.format(image_hashes[hash], hash, result_name))
-            image_hashes[hash] = result_name
+        return plan
 
+    @staticmethod
+    def create_random_drop_set(network: str,
+                         policy_id: str,
+                         metametadata: Dict,
+                         rng: numpy.random.RandomState) -> List[str]:
+        series = metametadata['series']
+        drop_name = metametadata['drop-name']
+        init_nft_id = metametadata['init-nft-id']
+        base_token_name = metametadata['token-name']
+        base_nft_name = metametadata['nft-name']
+
+        image_hashes = {}
+        image_index = BKTree()
+        max_distance = metametadata.get('near-duplicate-distance')
+
+        context = DropContext(metametadata)
+        total_combinations = Nft.calculate_total_combinations(metametadata, context)
+        logger.info('Total Combinations: {} images, Layer Sets: {} sets'.format(total_combinations, len(metametadata['layer-sets'])))
+        logger.info('NFTs to generate: {}'.format(metametadata['total']))
+
+        fnames = []
+
+        # 1. and 2. Randomly choose a layer set and an image from each of its
+        # layers for every NFT before composing any images
+        plan = Nft.plan_random_drop_set(network, metametadata, context, rng)
+
+        # Resize if requested in the metametadata
+        resize = None
+        if 'output-width' in metametadata and 'output-height' in metametadata:
+            resize = (metametadata['output-width'], metametadata['output-height'])
+
+        img_dir = 'nft/{}/{}/nft_img'.format(network, drop_name)
+        if not os.path.exists(img_dir):
+            os.makedirs(img_dir)
+
+        # Skip the images written by an earlier run of the same plan, as long
+        # as they have not changed since
+        progress = DropProgress(network, drop_name)
+        progress.start(plan)
+        pending = []
+        for item in plan:
+            completed = progress.get_completed(item['card-number'])
+            if (completed != None and completed['file'] == item['file'] and
+                    os.path.isfile(item['file']) and Nft.calc_sha256(item['file']) == completed['sha256']):
+                Nft.add_unique_image(image_hashes,
+                                     image_index,
+                                     item['file'],
+                                     completed['sha256'],
+                                     completed['dhash'] if 'dhash' in completed else dhash_file(item['file']),
+                                     max_distance)
+            else:
+                pending.append(item)
+
+        if len(pending) < len(plan):
+            logger.info('Resume: {} of {} images already created'.format(len(plan) - len(pending), len(plan)))
+
+        # 3. Compose the planned images on all cores.  Each image is hashed in
+        # memory to make sure it is unique before it is written.
+        compositor = Compositor()
+        jobs = [{'layers': item['layers'], 'resize': resize} for item in pending]
+        for (item, (data, hash, dhash)) in zip(pending, compositor.compose_all(jobs)):
+            result_name = item['file']
+            Nft.add_unique_image(image_hashes, image_index, result_name, hash, dhash, max_distance)
+
+            logger.info('Create: {}'.format(result_name))
+            temp_name = '{}.tmp'.format(result_name)
+            with open(temp_name, 'wb') as file:
+                file.write(data)
+            os.replace(temp_name, result_name)
+            progress.set_completed(item['card-number'], result_name, hash, dhash)
+
+        progress.close()
+
+        # 4. Write the metadata of every NFT
+        for item in plan:
+            card_number = item['card-number']
+            properties = item['properties']
             token_name = base_token_name.format(series, card_number, 1)
             nft_name = base_nft_name.format(series, card_number, 1, 1)
 
-            metadata['image'] = result_name
+            metadata = {}
+            metadata['image'] = item['file']
             if 'id' in properties:
                 properties['id'] = init_nft_id + card_number - 1
             metadata['properties'] = properties
@@ -465,9 +497,6 @@ class Nft:
                                                 metadata)
             fnames.append(metadata_file)
 
-        for i in range(0, len(frequencies)):
-            logger.info('frequencies[{}] = {}'.format(i, frequencies[i]))
-
         return fnames
 
     @staticmethod
@@ -36,6 +36,13 @@ from tcr.nft import Nft
 from tcr.wallet import Wallet
 from tcr.wallet import WalletExternal
 from tcr.metadata_list import MetadataList
+from tcr.metadata_store import MetadataStore
+from tcr.drop import DropProgress
+from tcr.watcher import PaymentWatcher
+import tcr.watcher
+import tcr.pipeline
+import tcr.metadata_store
+import tcr.cardano
 import tcr.command
 import tcr.tcr
 import tcr.words
@@ -59,7 +66,7 @@ def setup_logging(network: str, application: str) -> None:
     file_format = logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s')
     file_handler.setFormatter(file_format)
 
-    logger_names = [network, 'tcr', 'nft', 'cardano', 'wallet', 'command', 'database', 'metadata-list']
+    logger_names = [network, 'tcr', 'nft', 'cardano', 'transaction', 'wallet', 'command', 'database', 'metadata-list', 'metadata-store', 'watcher', 'sales', 'compositor', 'ipfs', 'holders']
     for logger_name in logger_names:
         other_logger = logging.getLogger(logger_name)
         other_logger.setLevel(logging.DEBUG)
@@ -122,6 +129,12 @@ def create_series_metadata_set_file(cardano: Cardano,
     with open(metadata_set_file, 'w') as file:
         file.write(json.dumps(metadata_set, indent=4))
 
+    if files != None:
+        tcr.metadata_store.build_pack(metadata_set_file)
+
+    # The drop is complete, generating it again starts from the beginning
+    DropProgress(cardano.get_network(), drop_name).remove()
+
     return metadata_set_file
 
 def main():
@@ -160,6 +173,28 @@ def main():
                                     action='store_true',
                                     default=False,
                                     help='Process payments, mint NFTs.  Requires --drop, Optional: --whitelist')
+    parser.add_argument('--watch',  required=False,
+                                    action='store',
+                                    choices=tcr.watcher.WATCH_MODES,
+                                    default=tcr.watcher.WATCH_TIP,
+                                    help='How --mint waits for new payments.  notify installs a trigger on the db-sync block table.')
+    parser.add_argument('--poll-interval', required=False,
+                                           action='store',
+                                           metavar='SECONDS',
+                                           type=float,
+                                           default=tcr.watcher.DEFAULT_POLL_INTERVAL,
+                                           help='Maximum time --mint waits between payment queries')
+    parser.add_argument('--max-in-flight', required=False,
+                                           action='store',
+                                           metavar='COUNT',
+                                           type=int,
+                                           default=tcr.pipeline.DEFAULT_MAX_IN_FLIGHT,
+                                           help='Mint transactions --mint submits before waiting for one to be confirmed')
+    parser.add_argument('--utxo-source', required=False,
+                                         action='store',
+                                         choices=tcr.cardano.UTXO_SOURCES,
+                                         default=tcr.cardano.UTXO_SOURCE_NODE,
+                                         help='Read wallet UTXOs from the cardano node or from db-sync')
     parser.add_argument('--whitelist', required=False,
                                     action='store',
                                     metavar='NAME',
@@ -231,6 +266,10 @@ def main():
     confirm = args.confirm
     test_combos = args.test_combos
     whitelist = args.whitelist
+    watch_mode = args.watch
+    poll_interval = args.poll_interval
+    max_in_flight = args.max_in_flight
+    utxo_source = args.utxo_source
     months = args.months
     set_royalty = args.set_royalty
     royalty_address = args.royalty_address
@@ -252,7 +291,7 @@ def main():
 
     if create_wallet != None or create_policy != None or mint or burn or set_royalty:
         tip = cardano.query_tip()
-        cardano.query_protocol_parameters()
+        cardano.refresh_protocol_parameters(tip.get('epoch'))
         database.open()
         tip_slot = tip['slot']
 
@@ -265,6 +304,7 @@ def main():
         logger.info('Cardano Node Tip Slot: {}'.format(tip_slot))
         logger.info(' Database Latest Slot: {}'.format(latest_slot))
         logger.info('Sync Progress: {}'.format(sync_progress))
+        cardano.set_utxo_source(utxo_source, database)
 
     if create_wallet != None:
         #
@@ -386,10 +426,13 @@ def main():
         metadata_set_file = get_series_metadata_set_file(cardano, policy_name, drop_name)
         logger.info('Metadata Set File: {}'.format(metadata_set_file))
 
-        # verify the metadata for each NFT and uploaded to IPFS
+        # Open the compiled metadata of the drop, then verify the metadata for
+        # each NFT and uploaded to IPFS
         metadatalist = MetadataList(metadata_set_file)
+        pack = tcr.metadata_store.open_pack(metadata_set_file, metadatalist.get_next_files(metadatalist.get_remaining()))
+        store = MetadataStore(pack=pack)
         while metadatalist.get_remaining() > 0:
-            nftmd = Nft.parse_metadata_file(metadatalist.peek_next_file())
+            nftmd = store.get(metadatalist.peek_next_file())
             if len(nftmd['token-names']) != 1:
                 logger.error('There should only be one token name')
                 raise Exception('There should only be one token name')
@@ -412,7 +455,8 @@ def main():
             prices[int(price)] = metametadata['prices'][price]
         logger.info('prices: {}'.format(prices))
 
-        max_per_tx = metametadata['max_per_tx']
+        # Optional, payments are packed up to the transaction size limit
+        max_per_tx = metametadata.get('max_per_tx')
 
         if whitelist != None:
             logger.info('Process Presale Whitelist Payments: {}'.format(whitelist))
@@ -429,13 +473,23 @@ def main():
                                       drop_name,
                                       metadata_set_file,
                                       wl_payments,
-                                      max_per_tx)
+                                      max_per_tx,
+                                      store)
             logger.info('Process Whitelist Complete')
         else:
             logger.info('Whitelist Not Given')
 
         try:
             logger.info('Process General Sale Payments:')
+            if watch_mode == tcr.watcher.WATCH_NOTIFY:
+                database.install_block_notify_trigger()
+
+            watcher = PaymentWatcher(database,
+                                     [mint_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT, delegated=True),
+                                      mint_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT, delegated=False)],
+                                     mode=watch_mode,
+                                     poll_interval=poll_interval)
+
             # Listen for incoming payments and mint NFTs when a UTXO matching a payment
             # value is found
             tcr.tcr.process_incoming_payments(cardano,
@@ -445,7 +499,10 @@ def main():
                                               drop_name,
                                               metadata_set_file,
                                               prices,
-                                              max_per_tx)
+                                              max_per_tx,
+                                              watcher,
+                                              max_in_flight,
+                                              store)
         except Exception as e:
             logger.exception("Caught Exception")
     elif set_royalty != 0.0:
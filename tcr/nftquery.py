@@ -25,6 +25,7 @@ from tcr.wallet import Wallet
 from tcr.wallet import WalletExternal
 from tcr.cardano import Cardano
 from tcr.database import Database
+from tcr.holders import HolderIndex
 import logging
 import argparse
 import tcr.command
@@ -98,8 +99,10 @@ def main():
         logger.info('')
 
         by_address = {}
+        holder_index = HolderIndex(network)
         for policy in policies:
-            tokens = database.query_current_owner(policy)
+            holder_index.refresh(database, policy)
+            tokens = holder_index.get_holders(policy)
             logger.info('{} = {} tokens'.format(policy, len(tokens)))
 
             keys = list(tokens.keys())
@@ -111,6 +114,7 @@ def main():
                 else:
                     by_address[address] = [name]
 
+        holder_index.close()
         holders = list(by_address.items())
 
         def sort_by_length(item):
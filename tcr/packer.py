@@ -0,0 +1,231 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: packer.py
+Author: SuperKK
+
+Pack queued payments into mint transactions by estimated transaction size
+instead of a fixed number of NFTs per transaction.
+"""
+
+from typing import Dict, List, Set, Tuple
+import logging
+
+from tcr.cardano import Cardano
+from tcr.metadata_store import MetadataStore
+from tcr.sales import Sales
+from tcr.transaction import Transaction
+from tcr.utxo import Utxo
+
+logger = logging.getLogger('tcr')
+
+# Used when the protocol parameters do not have maxTxSize
+DEFAULT_MAX_TX_SIZE = 16384
+
+# Bytes kept free below maxTxSize.  The estimate uses a placeholder for the
+# purchaser addresses which are only looked up when the transaction is built.
+DEFAULT_SIZE_MARGIN = 512
+
+# Number of payments that did not fit that are passed over looking for smaller
+# ones to fill a transaction.  A payment passed over is the oldest one left so
+# it starts the next transaction.
+DEFAULT_LOOKAHEAD = 16
+
+# Witnesses of a mint transaction: policy, mint and presale signing keys
+MINT_WITNESS_COUNT = 3
+
+class BatchPacker:
+    """
+    Choose the payments minted by the next transaction.
+
+    Payments are taken oldest first.  Each candidate transaction is built in
+    memory the same way as mint_nft_external, with the merged metadata of the
+    NFTs it would mint, to estimate its size, fee and the min-ADA of each
+    output.  A payment is added when the transaction stays under maxTxSize and
+    the payments still cover the fee and the min-ADA outputs.  A payment that
+    cannot cover them even by itself is returned for a refund.
+    """
+
+    def __init__(self,
+                 cardano: Cardano,
+                 policy_name: str,
+                 project_address: str,
+                 tip_address: str,
+                 store: MetadataStore,
+                 max_per_tx: int = None,
+                 size_margin: int = DEFAULT_SIZE_MARGIN,
+                 lookahead: int = DEFAULT_LOOKAHEAD):
+        """
+        @param project_address Receives the payments, also the placeholder for
+                               purchaser addresses
+        @param store The metadata of the NFTs minted
+        @param max_per_tx Optional limit on the NFTs in one transaction
+        """
+
+        self.cardano = cardano
+        self.policy_id = cardano.get_policy_id(policy_name)
+        self.script = cardano.get_policy_script(policy_name)
+        self.project_address = project_address
+        self.tip_address = tip_address
+        self.store = store
+        self.max_per_tx = max_per_tx
+        self.size_margin = size_margin
+        self.lookahead = lookahead
+
+    def get_max_size(self) -> int:
+        """
+        The largest estimated size allowed, from the current protocol parameters.
+        """
+
+        max_tx_size = self.cardano.get_protocol_parameters().get('maxTxSize')
+        if max_tx_size == None:
+            max_tx_size = DEFAULT_MAX_TX_SIZE
+        return max_tx_size - self.size_margin
+
+    def estimate(self, input_utxos: List[Dict], files: List[str]) -> Tuple[int, int, int]:
+        """
+        Estimate the signed mint transaction of input_utxos.
+
+        @param input_utxos [{'utxo', 'count', 'refund'}, ...]
+        @param files The metadata files minted, in order
+        @return (size in bytes, fee, lovelace paid out in the purchaser and tip outputs)
+        """
+
+        metadata = {'721': {self.policy_id: {}}}
+        transaction = Transaction()
+        outputs = [(self.project_address, {})]
+        file_index = 0
+        for item in input_utxos:
+            assets = {}
+            for i in range(0, item['count']):
+                (token_name, properties) = self.store.get_token(files[file_index])
+                full_name = '{}.{}'.format(self.policy_id, token_name)
+                metadata['721'][self.policy_id][token_name] = properties
+                transaction.add_mint(full_name, 1)
+                assets[full_name] = 1
+                file_index += 1
+            transaction.add_input(item['utxo'].tx_hash, item['utxo'].tx_ix)
+            outputs.append((self.project_address, assets))
+        outputs.append((self.tip_address, {}))
+
+        paid = 0
+        for (address, assets) in outputs:
+            transaction.add_output(address, 1, assets)
+        for i in range(0, len(input_utxos)):
+            assets_string = ''.join(['+1 {}'.format(name) for name in outputs[i + 1][1]])
+            paid += self.cardano.calculate_min_required_utxo(outputs[i + 1][0], 1, assets_string) + input_utxos[i]['refund']
+        paid += self.cardano.get_min_utxo_value()
+
+        transaction.add_script(self.script)
+        transaction.set_metadata(metadata)
+        transaction.set_invalid_hereafter(Cardano.get_invalid_hereafter(self.script))
+
+        size = len(transaction.serialize(MINT_WITNESS_COUNT))
+        fee = transaction.calculate_min_fee(self.cardano.get_protocol_parameters(), MINT_WITNESS_COUNT)
+        return (size, fee, paid)
+
+    def fits(self, input_utxos: List[Dict], files: List[str]) -> Tuple[bool, bool]:
+        """
+        @return (under the size limit, the payments cover the fee and outputs)
+        """
+
+        (size, fee, paid) = self.estimate(input_utxos, files)
+        received = sum([item['utxo'].amount for item in input_utxos])
+        return (size <= self.get_max_size(), received >= fee + paid)
+
+    def pack(self,
+             utxos: List[Utxo],
+             prices: Dict[int, int],
+             files: List[str],
+             sales: Sales,
+             pending_inputs: Set[Tuple[str, int]]) -> Tuple[List[Dict], List[Utxo]]:
+        """
+        Collect incoming utxos that match a payment and batch them together
+        for processing.
+
+        @param utxos Sorted oldest first
+        @param files Every metadata file remaining, in the order they are minted
+        @param pending_inputs Payments spent by transactions in flight
+        @return ([{'utxo', 'count', 'refund'}, ...], [payments to refund, ...])
+        """
+
+        input_utxos = []
+        refunds = []
+        nfts_to_mint = 0
+        passed_over = 0
+
+        for utxo in utxos:
+            if sales.contains(utxo.tx_hash, utxo.tx_ix) or (utxo.tx_hash, utxo.tx_ix) in pending_inputs:
+                # If already processed this UTXO then skip it.
+                continue
+
+            if not utxo['amount'] in prices:
+                continue
+
+            num_nfts = prices[utxo['amount']]
+            refund_price = 0
+            sold_out = num_nfts + nfts_to_mint > len(files)
+            if sold_out:
+                # Later payments must not take the last NFTs from an earlier
+                # one.  The first payment gets what is left and the rest is
+                # refunded.
+                if nfts_to_mint > 0:
+                    break
+                price_per_nft = utxo['amount'] / num_nfts
+                refund_nfts = num_nfts - len(files)
+                refund_price = int(refund_nfts * price_per_nft)
+                num_nfts = len(files)
+
+            item = {'utxo': utxo, 'count': num_nfts, 'refund': refund_price}
+            under_max = self.max_per_tx == None or num_nfts + nfts_to_mint <= self.max_per_tx
+            (size_ok, value_ok) = self.fits(input_utxos + [item], files[:nfts_to_mint + num_nfts])
+            if under_max and size_ok and value_ok:
+                logger.info('RX UTXO {}: {} lovelace'.format(utxo['tx-hash'], utxo['amount']))
+                logger.info('Request {} NFTs'.format(num_nfts))
+                input_utxos.append(item)
+                logger.debug('Queue For Mint, UTXO {} = {} NFTs, refund: {}'.format(utxo['tx-hash'], num_nfts, refund_price))
+                nfts_to_mint += num_nfts
+            elif nfts_to_mint == 0:
+                # Can never be minted by itself, refund it and keep packing
+                # the payments after it
+                if not (under_max and size_ok):
+                    logger.error('Configuration error: {} NFTs requested for {} lovelace do not fit in a transaction, refund'.format(num_nfts, utxo['amount']))
+                else:
+                    logger.warning('RX UTXO {}: {} lovelace does not cover the fee and min-ADA, refund'.format(utxo['tx-hash'], utxo['amount']))
+                refunds.append(utxo)
+                continue
+            else:
+                # Look for a later, smaller payment to fill the transaction
+                passed_over += 1
+                if passed_over > self.lookahead:
+                    break
+
+            if sold_out:
+                break
+
+        if len(input_utxos) > 0:
+            (size, fee, paid) = self.estimate(input_utxos, files)
+            logger.debug('Packed {} payments, {} NFTs, estimated size = {} bytes, fee = {} lovelace'.format(len(input_utxos), sum([item['count'] for item in input_utxos]), size, fee))
+
+        return (input_utxos, refunds)
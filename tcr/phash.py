@@ -0,0 +1,117 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: phash.py
+Author: SuperKK
+
+Perceptual image hashes to find images that look the same even though the
+files are different.
+"""
+
+from typing import Any, List, Tuple
+
+from PIL import Image
+
+# Width and height of the grid compared by dhash, 64 bit hashes
+DHASH_SIZE = 8
+
+def dhash(image: Image.Image) -> int:
+    """
+    Difference hash.  The image is reduced to a small grayscale grid and each
+    bit says if a cell is brighter than its right neighbour.  Images that look
+    alike have hashes a small Hamming distance apart.
+    """
+
+    small = image.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.BOX)
+    pixels = small.tobytes()
+
+    value = 0
+    for y in range(0, DHASH_SIZE):
+        row = y * (DHASH_SIZE + 1)
+        for x in range(0, DHASH_SIZE):
+            value = (value << 1) | (1 if pixels[row + x] > pixels[row + x + 1] else 0)
+    return value
+
+def dhash_file(filename: str) -> int:
+    with Image.open(filename) as image:
+        return dhash(image)
+
+def distance(a: int, b: int) -> int:
+    """
+    Hamming distance between two hashes.
+    """
+
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """
+    Burkhard-Keller tree of hashes.  Finds every hash within a Hamming
+    distance of a query without comparing against all of them.
+    """
+
+    def __init__(self):
+        # each node is [hash, item, {distance: child node}]
+        self.root = None
+        self.count = 0
+
+    def add(self, hash: int, item: Any) -> None:
+        self.count += 1
+        if self.root == None:
+            self.root = [hash, item, {}]
+            return
+
+        node = self.root
+        while True:
+            d = distance(hash, node[0])
+            if d in node[2]:
+                node = node[2][d]
+            else:
+                node[2][d] = [hash, item, {}]
+                return
+
+    def search(self, hash: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        @return [(distance, item), ...] for each hash within max_distance
+        """
+
+        found = []
+        if self.root == None:
+            return found
+
+        nodes = [self.root]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            d = distance(hash, node[0])
+            if d <= max_distance:
+                found.append((d, node[1]))
+
+            # triangle inequality, only children in this range can match
+            for child_distance in node[2]:
+                if d - max_distance <= child_distance <= d + max_distance:
+                    nodes.append(node[2][child_distance])
+
+        return found
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,184 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: pipeline.py
+Author: SuperKK
+
+Track mint transactions submitted but not yet on chain so several can be in
+flight at the same time.
+"""
+
+from typing import Dict, List, Set, Tuple
+import json
+import logging
+import os
+import time
+
+from tcr.database import Database
+from tcr.metadata_list import MetadataList
+from tcr.sales import Sales
+from tcr.utxo import Utxo
+
+logger = logging.getLogger('tcr')
+
+# Mint transactions submitted and waiting to be confirmed
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# Slots (seconds) a mint transaction stays valid.  Long enough for a busy
+# mempool, a few blocks are usually enough.
+DEFAULT_TX_TIMEOUT = 600
+
+PIPELINE_FILE = 'mint_pipeline.json'
+
+class MintPipeline:
+    """
+    Mint transactions in flight.  Each one consumes its own payment UTXOs so
+    the next batch can be submitted without waiting for the previous one.
+
+    Each transaction is built to be invalid after a slot, at most timeout
+    slots after it was submitted, see get_invalid_hereafter.  A transaction
+    is confirmed once none of its inputs are unspent.  If db-sync is past
+    that slot and does not have it, it can never be included and was
+    dropped: the payments are removed from Sales so they are processed again
+    and the metadata files are returned to the MetadataList.
+
+    The transactions are saved in nft/<network>/<drop>/mint_pipeline.json so
+    they can still be rolled back after a restart.
+    """
+
+    def __init__(self,
+                 network: str,
+                 drop_name: str,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 timeout: int = DEFAULT_TX_TIMEOUT):
+        self.state_file = 'nft/{}/{}/{}'.format(network, drop_name, PIPELINE_FILE)
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.transactions = []
+
+        if os.path.isfile(self.state_file):
+            with open(self.state_file, 'r') as file:
+                self.transactions = json.load(file)['transactions']
+            logger.info('Mint pipeline, {} transactions in flight'.format(len(self.transactions)))
+
+    def save(self) -> None:
+        temp_file = '{}.tmp'.format(self.state_file)
+        with open(temp_file, 'w') as file:
+            file.write(json.dumps({'transactions': self.transactions}))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.state_file)
+
+    def is_full(self) -> bool:
+        return len(self.transactions) >= self.max_in_flight
+
+    def get_invalid_hereafter(self, slot: int, policy_before: int) -> int:
+        """
+        The slot a transaction submitted at slot becomes invalid, never later
+        than the policy allows.
+        """
+
+        return min(policy_before, slot + self.timeout)
+
+    def get_pending_inputs(self) -> Set[Tuple[str, int]]:
+        """
+        @return (tx hash, tx ix) of every payment consumed by a transaction in flight
+        """
+
+        return set([(hash, ix) for tx in self.transactions for (hash, ix) in tx['inputs']])
+
+    def add(self,
+            tx_id: str,
+            input_utxos: List[Dict],
+            files: List[str],
+            policy_id: str,
+            token_names: List[str],
+            invalid_hereafter: int) -> None:
+        """
+        Track a mint transaction just submitted.
+
+        @param input_utxos The payments, [{'utxo': Utxo, ...}, ...]
+        @param files The metadata files committed for the transaction
+        @param invalid_hereafter The transaction TTL, from get_invalid_hereafter
+        """
+
+        self.transactions.append({'tx-id': tx_id,
+                                  'inputs': [[item['utxo'].tx_hash, item['utxo'].tx_ix] for item in input_utxos],
+                                  'files': files,
+                                  'policy-id': policy_id,
+                                  'token-names': token_names,
+                                  'invalid-hereafter': invalid_hereafter,
+                                  'submitted': time.time()})
+        self.save()
+        logger.debug('Mint pipeline, {} in flight, added {}'.format(len(self.transactions), tx_id))
+
+    def update(self,
+               utxos: List[Utxo],
+               slot: int,
+               database: Database,
+               nft_metadata: MetadataList,
+               sales: Sales) -> None:
+        """
+        Forget confirmed transactions and roll back dropped ones.
+
+        @param utxos The unspent outputs of the mint addresses just queried
+        @param slot The latest slot in db-sync
+        """
+
+        if len(self.transactions) == 0:
+            return
+
+        unspent = set([(utxo.tx_hash, utxo.tx_ix) for utxo in utxos])
+        remaining = []
+        expired = []
+        for tx in self.transactions:
+            if not any([(hash, ix) in unspent for (hash, ix) in tx['inputs']]):
+                logger.info('Mint pipeline, confirmed: {}'.format(tx['tx-id']))
+            elif tx.get('invalid-hereafter') != None and slot > tx['invalid-hereafter']:
+                expired.append(tx)
+            else:
+                remaining.append(tx)
+
+        if len(expired) > 0:
+            # db-sync is past the TTL, a transaction it does not have can no
+            # longer be included.  The node may not have caught up on the
+            # spent inputs of the others.
+            (times, missing) = database.query_txhash_times([tx['tx-id'] for tx in expired])
+            for tx in expired:
+                if tx['tx-id'] in missing:
+                    self.rollback(tx, database, nft_metadata, sales)
+                else:
+                    remaining.append(tx)
+
+        if len(remaining) != len(self.transactions):
+            self.transactions = remaining
+            self.save()
+
+    def rollback(self, tx: Dict, database: Database, nft_metadata: MetadataList, sales: Sales) -> None:
+        logger.warning('Mint pipeline, expired at slot {} after {} seconds: {}'.format(tx['invalid-hereafter'], int(time.time() - tx['submitted']), tx['tx-id']))
+        for (hash, ix) in tx['inputs']:
+            sales.remove_utxo(hash, ix)
+        sales.commit()
+        nft_metadata.return_files(tx['files'])
+        database.remove_minted_token_names(tx['policy-id'], tx['token-names'])
@@ -0,0 +1,106 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: policy.py
+Author: SuperKK
+
+Minting policies loaded from policy/<network>/<name>.id, .owner and .script
+and kept for the life of the process.
+"""
+
+from typing import Dict, Tuple
+import json
+import logging
+import os
+
+logger = logging.getLogger('cardano')
+
+def get_invalid_hereafter(script: Dict) -> int:
+    invalid_hereafter = 0
+    for s in script['scripts']:
+        if s['type'] == 'before':
+            invalid_hereafter = s['slot']
+
+    return invalid_hereafter
+
+class Policy:
+    """
+    The files of a policy.  Any of them can be None if the file does not
+    exist.
+    """
+
+    def __init__(self, name: str, policy_id: str, owner: str, script: Dict):
+        self.name = name
+        self.policy_id = policy_id
+        self.owner = owner
+        self.script = script
+        self.invalid_hereafter = None
+        if script != None:
+            self.invalid_hereafter = get_invalid_hereafter(script)
+
+class PolicyCache:
+    """
+    Policies by name.  A policy is loaded again when the modification time of
+    one of its files changes, e.g. after the policy is created.
+    """
+
+    def __init__(self, network: str):
+        self.network = network
+        # name: (modification times, Policy)
+        self.policies = {}
+
+    def get_files(self, policy_name: str) -> Tuple[str, str, str]:
+        return tuple(['policy/{}/{}.{}'.format(self.network, policy_name, extension)
+                      for extension in ('id', 'owner', 'script')])
+
+    @staticmethod
+    def get_mtime(filename: str) -> int:
+        try:
+            return os.stat(filename).st_mtime_ns
+        except FileNotFoundError as e:
+            return None
+
+    @staticmethod
+    def read(filename: str) -> str:
+        try:
+            with open(filename, 'r') as file:
+                return file.read()
+        except FileNotFoundError as e:
+            return None
+
+    def get(self, policy_name: str) -> Policy:
+        files = self.get_files(policy_name)
+        mtimes = tuple([PolicyCache.get_mtime(filename) for filename in files])
+        if policy_name in self.policies and self.policies[policy_name][0] == mtimes:
+            return self.policies[policy_name][1]
+
+        (id_file, owner_file, script_file) = files
+        script = PolicyCache.read(script_file)
+        if script != None:
+            script = json.loads(script)
+
+        policy = Policy(policy_name, PolicyCache.read(id_file), PolicyCache.read(owner_file), script)
+        self.policies[policy_name] = (mtimes, policy)
+        logger.debug('Loaded policy: {} / {}'.format(policy_name, policy.policy_id))
+        return policy
@@ -26,96 +26,176 @@ File: sales.py
 Author: SuperKK
 """
 
-from typing import List
+from typing import Dict, List
 
 import json
+import logging
+import os
 import time
 from datetime import datetime
 
+logger = logging.getLogger('sales')
+
+# Fold the journal back into sales.json after this many journal records
+JOURNAL_COMPACT_RECORDS = 1000
+
 class Sales:
     """
-    Simple class to track each sale as JSON file
+    Track each sale, indexed by the payment UTXO (tx hash, tx ix).
+
+    The full set of sales is kept in sales.json.  Each commit appends only the
+    sales changed since the last commit to sales.journal, one JSON record per
+    line.  Once the journal holds compact_records records it is folded back
+    into sales.json.  Loading reads sales.json then replays the journal.
     """
-    def __init__(self, network: str, drop: str):
+    def __init__(self, network: str, drop: str, compact_records: int = JOURNAL_COMPACT_RECORDS):
         self.filename = 'nft/{}/{}/sales.json'.format(network, drop)
-        self.sales = {'transactions': []}
+        self.journal_filename = 'nft/{}/{}/sales.journal'.format(network, drop)
+        self.compact_records = compact_records
+        self.transactions = {}
+        self.changed = {}
+        self.journal_records = 0
+
         try:
             with open(self.filename, 'r') as file:
-                self.sales = json.load(file)
+                for item in json.load(file)['transactions']:
+                    self.transactions[(item['input-hash'], item['input-ix'])] = item
         except FileNotFoundError as e:
             pass
 
-    def contains(self, hash: str, ix: str) -> bool:
-        for item in self.sales['transactions']:
-            if item['input-hash'] == hash and item['input-ix'] == ix:
-                return True
+        self.replay_journal()
 
-        return False
+    def replay_journal(self) -> None:
+        try:
+            with open(self.journal_filename, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError as e:
+            return
+
+        offset = 0
+        while offset < len(data):
+            end = data.find(b'\n', offset)
+            if end < 0:
+                break
+
+            try:
+                record = json.loads(data[offset:end])
+            except ValueError:
+                break
+
+            if 'put' in record:
+                item = record['put']
+                self.transactions[(item['input-hash'], item['input-ix'])] = item
+            else:
+                (hash, ix) = record['remove']
+                self.transactions.pop((hash, ix), None)
+
+            self.journal_records += 1
+            offset = end + 1
+
+        if offset < len(data):
+            # A commit was interrupted part way through a record
+            logger.warning('Truncate incomplete sales journal record at: {}'.format(offset))
+            with open(self.journal_filename, 'r+b') as file:
+                file.truncate(offset)
+
+    def get(self, hash: str, ix: str) -> Dict:
+        return self.transactions.get((hash, ix))
+
+    def contains(self, hash: str, ix: str) -> bool:
+        return (hash, ix) in self.transactions
 
     def add_utxo(self, hash: str, ix: str, amount: int, count: int) -> bool:
-        if self.contains(hash, ix):
+        key = (hash, ix)
+        if key in self.transactions:
             return False
 
-        self.sales['transactions'].append({'input-hash': hash,
-                                           'input-ix': ix,
-                                           'input-amount': amount,
-                                           'count': count,
-                                           'time': {'epoch': round(time.time()),
-                                                    'date-time': datetime.now().strftime("%Y/%m/%d %H:%M:%S")}
-                                          })
+        self.transactions[key] = {'input-hash': hash,
+                                  'input-ix': ix,
+                                  'input-amount': amount,
+                                  'count': count,
+                                  'time': {'epoch': round(time.time()),
+                                           'date-time': datetime.now().strftime("%Y/%m/%d %H:%M:%S")}
+                                 }
+        self.changed[key] = True
         return True
 
     def remove_utxo(self, hash: str, ix: str) -> bool:
-        if not self.contains(hash, ix):
+        key = (hash, ix)
+        if not key in self.transactions:
             return False
 
-        for item in self.sales['transactions']:
-            if item['input-hash'] == hash and item['input-ix'] == ix:
-                self.sales['transactions'].remove(item)
-                return True
+        del self.transactions[key]
+        self.changed[key] = True
+        return True
+
+    def set_value(self, hash: str, ix: str, name: str, value) -> bool:
+        key = (hash, ix)
+        if not key in self.transactions:
+            return False
 
-        return False
+        self.transactions[key][name] = value
+        self.changed[key] = True
+        return True
 
     def set_input_address(self, hash: str, ix: str, address: str) -> bool:
-        for item in self.sales['transactions']:
-            if item['input-hash'] == hash and item['input-ix'] == ix:
-                item['input-address'] = address
-                return True
-
-        return False
+        return self.set_value(hash, ix, 'input-address', address)
 
     def set_tx_ada(self, hash: str, ix: str, out_min_ada: int) -> bool:
-        for item in self.sales['transactions']:
-            if item['input-hash'] == hash and item['input-ix'] == ix:
-                item['out-ada'] = out_min_ada
-                return True
-
-        return False
+        return self.set_value(hash, ix, 'out-ada', out_min_ada)
 
     def set_refund(self, hash: str, ix: str, fee: int, amount: int) -> bool:
-        for item in self.sales['transactions']:
-            if item['input-hash'] == hash and item['input-ix'] == ix:
-                item['refund'] = {'amount': amount, 'fee': fee}
-                return True
-
-        return False
+        return self.set_value(hash, ix, 'refund', {'amount': amount, 'fee': fee})
 
     def set_output_txid(self, hash: str, ix: str, txid: str) -> bool:
-        for item in self.sales['transactions']:
-            if item['input-hash'] == hash and item['input-ix'] == ix:
-                item['out-txid'] = txid
-                return True
-
-        return False
+        return self.set_value(hash, ix, 'out-txid', txid)
 
     def set_tokens_minted(self, hash: str, ix: str, tokens: List) -> bool:
-        for item in self.sales['transactions']:
-            if item['input-hash'] == hash and item['input-ix'] == ix:
-                item['tokens-minted'] = tokens
-                return True
-
-        return False
+        return self.set_value(hash, ix, 'tokens-minted', tokens)
 
     def commit(self) -> None:
-        with open(self.filename, 'w') as file:
-            file.write(json.dumps(self.sales, indent=4))
+        """
+        Append the sales changed since the last commit to the journal.
+        """
+
+        if len(self.changed) == 0:
+            return
+
+        lines = []
+        for key in self.changed:
+            if key in self.transactions:
+                lines.append(json.dumps({'put': self.transactions[key]}))
+            else:
+                lines.append(json.dumps({'remove': list(key)}))
+
+        with open(self.journal_filename, 'a') as file:
+            file.write('\n'.join(lines) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.journal_records += len(lines)
+        self.changed = {}
+
+        if self.journal_records >= self.compact_records:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Write all sales to sales.json and empty the journal.  sales.json is
+        replaced atomically so a crash leaves either the old file plus the
+        journal or the new file.
+        """
+
+        temp_filename = '{}.tmp'.format(self.filename)
+        with open(temp_filename, 'w') as file:
+            file.write(json.dumps({'transactions': list(self.transactions.values())}, indent=4))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, self.filename)
+
+        with open(self.journal_filename, 'w') as file:
+            pass
+
+        logger.debug('Compacted sales journal, {} records, {} sales'.format(self.journal_records,
+                                                                             len(self.transactions)))
+        self.journal_records = 0
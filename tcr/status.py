@@ -27,6 +27,7 @@ from tcr.cardano import Cardano
 from tcr.database import Database
 import logging
 import argparse
+import tcr.cardano
 import tcr.command
 import tcr.nftmint
 import traceback
@@ -44,10 +45,16 @@ def main():
                                     default=None,
                                     metavar='NAME',
                                     help='Dump UTXOs from wallet')
+    parser.add_argument('--utxo-source', required=False,
+                                         action='store',
+                                         choices=tcr.cardano.UTXO_SOURCES,
+                                         default=tcr.cardano.UTXO_SOURCE_NODE,
+                                         help='Read wallet UTXOs from the cardano node or from db-sync')
 
     args = parser.parse_args()
     network = args.network
     wallet_name = args.wallet
+    utxo_source = args.utxo_source
 
     if not network in tcr.command.networks:
         raise Exception('Invalid Network: {}'.format(network))
@@ -72,6 +79,7 @@ def main():
     logger.info('Cardano Node Tip Slot: {}'.format(tip_slot))
     logger.info(' Database Latest Slot: {}'.format(latest_slot))
     logger.info('Sync Progress: {}'.format(sync_progress))
+    cardano.set_utxo_source(utxo_source, database)
 
     wallet = None
     if wallet_name != None:
@@ -31,12 +31,19 @@ from typing import List
 
 from tcr.nft import Nft
 from tcr.cardano import Cardano
+from tcr.command import Command
 from tcr.wallet import Wallet
 from tcr.wallet import WalletExternal
 from tcr.database import Database
 from tcr.metadata_list import MetadataList
+from tcr.metadata_store import MetadataStore
+from tcr.watcher import PaymentWatcher
+from tcr.pipeline import MintPipeline
+from tcr.pipeline import DEFAULT_MAX_IN_FLIGHT
+from tcr.packer import BatchPacker
 
 import os
+import json
 import time
 import logging
 from tcr.sales import Sales
@@ -54,6 +61,9 @@ SECONDS_PER_YEAR = int(MONTHS_PER_YEAR * SECONDS_PER_MONTH)
 
 logger = logging.getLogger('tcr')
 
+TIP_ADDRESSES = {'mainnet': 'addr1q88q8fmttd9lt4pgtc3g778w74jxsk9r7q2mmt5lhpyw3sl8mam03vp3qc8k8lmgsdlf6p43xcmcmp6jgx2y6w62nszq070rcs',
+                 'testnet': 'addr_test1vzwyk8nwfh5esy09z79nzyxe69y8u5wdx60vgxsnu0w0q7cxqx50m'}
+
 def transfer_all_assets(cardano: Cardano,
                         from_wallet: Wallet,
                         to_wallet: Wallet) -> None:
@@ -85,16 +95,10 @@ def transfer_all_assets(cardano: Cardano,
                 'amount': 1,
                 'assets': incoming_assets}]
     fee = 0
-    cardano.create_transfer_transaction_file(from_utxos,
-                                             outputs,
-                                             fee,
-                                             'transaction/transfer_all_assets_draft_tx_{}'.format(os.getpid()))
+    draft = cardano.build_transfer_transaction(from_utxos, outputs, fee)
 
     # Calculate fee & update values
-    fee = cardano.calculate_min_fee('transaction/transfer_all_assets_draft_tx_{}'.format(os.getpid()),
-                                    len(from_utxos),
-                                    len(outputs),
-                                    2)
+    fee = cardano.calculate_transaction_fee(draft, 2)
     outputs[0]['amount'] = from_total_lovelace - fee
     logger.debug('Transfer All Assets, Fee = {} lovelace'.format(fee))
 
@@ -133,14 +137,10 @@ def transfer_utxo_ada(cardano: Cardano,
                 'amount': 1,
                 'assets': {}}]
     fee = 0
-    cardano.create_transfer_transaction_file([utxo],
-                                             outputs,
-                                             fee,
-                                             'transaction/transfer_utxo_ada_draft_tx_{}'.format(os.getpid()))
+    draft = cardano.build_transfer_transaction([utxo], outputs, fee)
 
     # Calculate fee & update values
-    fee = cardano.calculate_min_fee('transaction/transfer_utxo_ada_draft_tx_{}'.format(os.getpid()),
-                                    1, len(outputs), 2)
+    fee = cardano.calculate_transaction_fee(draft, 2)
     outputs[0]['amount'] = utxo['amount'] - fee
     logger.debug('Transfer UTXO ADA, Fee = {} lovelace'.format(fee))
     logger.debug('Transfer UTXO ADA, Lovelace = {} lovelace'.format(outputs[0]['amount']))
@@ -201,16 +201,10 @@ def transfer_ada(cardano: Cardano,
     outputs = [{'address': from_wallet.get_payment_address(Wallet.ADDRESS_INDEX_ROOT), 'amount': 1, 'assets': incoming_assets},
                {'address': to_wallet.get_payment_address(Wallet.ADDRESS_INDEX_ROOT), 'amount': 1, 'assets': {}}]
     fee = 0
-    cardano.create_transfer_transaction_file(input_utxos,
-                                             outputs,
-                                             fee,
-                                             'transaction/transfer_ada_draft_tx_{}'.format(os.getpid()))
+    draft = cardano.build_transfer_transaction(input_utxos, outputs, fee)
 
     # Calculate fee & update values
-    fee = cardano.calculate_min_fee('transaction/transfer_ada_draft_tx_{}'.format(os.getpid()),
-                                    len(input_utxos),
-                                    len(outputs),
-                                    2)
+    fee = cardano.calculate_transaction_fee(draft, 2)
     logger.debug('Transfer ADA, Fee = {} lovelace'.format(fee))
     outputs[0]['amount'] = input_lovelace - lovelace_amount - fee
     outputs[1]['amount'] = lovelace_amount
@@ -271,10 +265,7 @@ def transfer_nft(cardano: Cardano,
 
     #draft
     fee = 0
-    cardano.create_transfer_transaction_file(from_utxos,
-                                             outputs,
-                                             fee,
-                                             'transaction/transfer_nft_draft_tx_{}'.format(os.getpid()))
+    draft = cardano.build_transfer_transaction(from_utxos, outputs, fee)
 
     # https://github.com/input-output-hk/cardano-ledger-specs/blob/master/doc/explanations/min-utxo.rst
     # minUTxOValue is the minimum value if sending ADA only.  Since ADA plus a
@@ -283,10 +274,7 @@ def transfer_nft(cardano: Cardano,
     min_utxo_value = cardano.get_min_utxo_value() + 1000000
 
     # Calculate fee & update values
-    fee = cardano.calculate_min_fee('transaction/transfer_nft_draft_tx_{}'.format(os.getpid()),
-                                    len(from_utxos),
-                                    len(outputs),
-                                    2)
+    fee = cardano.calculate_transaction_fee(draft, 2)
     if (incoming_lovelace - fee) < min_utxo_value:
         # hopefully still enough
         min_utxo_value = incoming_lovelace - fee
@@ -338,18 +326,14 @@ def burn_nft_internal(cardano: Cardano,
                         'amount': 1, 'assets': incoming_assets}]
     fee = 0
     # draft
-    cardano.create_burn_nft_transaction_file(input_utxos,
-                                             address_outputs,
-                                             fee,
-                                             policy_name,
-                                             token_names,
-                                             token_amount,
-                                             'transaction/burn_nft_internal_draft_tx_{}'.format(os.getpid()))
+    draft = cardano.build_burn_nft_transaction(input_utxos,
+                                               address_outputs,
+                                               fee,
+                                               policy_name,
+                                               token_names,
+                                               token_amount)
     #fee
-    fee = cardano.calculate_min_fee('transaction/burn_nft_internal_draft_tx_{}'.format(os.getpid()),
-                                    len(input_utxos),
-                                    1,
-                                    2)
+    fee = cardano.calculate_transaction_fee(draft, 2)
     address_outputs[0]['amount'] = input_total_lovelace - fee
     #final
     cardano.create_burn_nft_transaction_file(input_utxos,
@@ -372,10 +356,10 @@ def burn_nft_internal(cardano: Cardano,
 def verify_unique_nfts(cardano: Cardano,
                        database: Database,
                        policy_name: str,
-                       nft_metadata_file: str) -> bool:
+                       raw_metadata: Dict) -> bool:
     # Make sure we're not about to mint multiple of the same token
     # Make sure the token we're about to mint hasn't already been minted
-    nft_metadata = Nft.parse_metadata_file(nft_metadata_file)
+    nft_metadata = Nft.parse_metadata(raw_metadata)
 
     policy_id = nft_metadata['policy-id']
     if policy_id == '777':
@@ -386,17 +370,14 @@ def verify_unique_nfts(cardano: Cardano,
         return False
 
     token_names = nft_metadata['token-names']
-    minted_nfts = database.query_mint_transactions(policy_id)
-    print(minted_nfts)
-
-    for name in token_names:
-        if token_names.count(name) > 1:
-            logger.error('Minting multiple of the same token')
-            return False
+    if len(set(token_names)) != len(token_names):
+        logger.error('Minting multiple of the same token')
+        return False
 
-        if name in minted_nfts:
-            logger.error('Token already minted!')
-            return False
+    minted_nfts = database.query_minted_token_names(policy_id)
+    if not minted_nfts.isdisjoint(token_names):
+        logger.error('Token already minted!')
+        return False
 
     return True
 
@@ -417,7 +398,10 @@ def mint_royalty_token(cardano: Cardano,
         logger.error('Wallet: {}, does not exist'.format(wallet_name))
         raise Exception('Wallet: {}, does not exist'.format(wallet_name))
 
-    if not verify_unique_nfts(cardano, database, policy_name, nft_metadata_file):
+    with open(nft_metadata_file, 'r') as file:
+        raw_metadata = json.load(file)
+
+    if not verify_unique_nfts(cardano, database, policy_name, raw_metadata):
         logger.error("NFT Uniqueness Violation found.")
         raise Exception('NFT Uniqueness Violation')
 
@@ -436,20 +420,18 @@ def mint_royalty_token(cardano: Cardano,
 
     # draft
     fee = 0
-    cardano.create_mint_royalty_token_transaction_file(input_utxo,
-                                                       mint_wallet.get_payment_address(Wallet.ADDRESS_INDEX_ROOT),
-                                                       fee,
-                                                       policy_name,
-                                                       nft_metadata_file,
-                                                       'transaction/mint_royalty_token_draft_tx_{}'.format(os.getpid()))
+    draft = cardano.build_mint_royalty_token_transaction(input_utxo,
+                                                         mint_wallet.get_payment_address(Wallet.ADDRESS_INDEX_ROOT),
+                                                         fee,
+                                                         policy_name,
+                                                         raw_metadata)
 
     total_input_lovelace = input_utxo['amount']
 
     logger.debug("Mint Royalty Token, total payment received: {} ADA".format(total_input_lovelace / 1000000))
 
     #fee
-    fee = cardano.calculate_min_fee('transaction/mint_royalty_token_draft_tx_{}'.format(os.getpid()),
-                                    1, 1, 2)
+    fee = cardano.calculate_transaction_fee(draft, 2)
 
     logger.debug('Mint Royalty Token, Fee = {} lovelace'.format(fee))
 
@@ -458,7 +440,7 @@ def mint_royalty_token(cardano: Cardano,
                                                                 mint_wallet.get_payment_address(Wallet.ADDRESS_INDEX_ROOT),
                                                                 fee,
                                                                 policy_name,
-                                                                nft_metadata_file,
+                                                                raw_metadata,
                                                                 'transaction/mint_royalty_token_unsigned_tx_{}'.format(os.getpid()))
     #sign
     cardano.sign_transaction('transaction/mint_royalty_token_unsigned_tx_{}'.format(os.getpid()),
@@ -467,6 +449,9 @@ def mint_royalty_token(cardano: Cardano,
                              'transaction/mint_royalty_token_signed_tx_{}'.format(os.getpid()))
     #submit
     tx_id = cardano.submit_transaction('transaction/mint_royalty_token_signed_tx_{}'.format(os.getpid()))
+    if tx_id != None:
+        # db-sync will not have this transaction for a while, the next mint must still see these tokens
+        database.add_minted_token_names(cardano.get_policy_id(policy_name), Nft.parse_metadata(raw_metadata)['token-names'])
 
     logger.debug('Submit Mint Royalty Token, TXID: {}'.format(tx_id))
 
@@ -477,19 +462,26 @@ def mint_nft_external(cardano: Cardano,
                       minting_wallet: Wallet,
                       policy_name: str,
                       input_utxos: List,
-                      nft_metadata_file: str,
-                      sales: Sales) -> bool:
+                      raw_metadata: Dict,
+                      sales: Sales,
+                      invalid_hereafter: int = None) -> str:
     """
     Mint an NFT to a different wallet.
 
+    raw_metadata is the transaction metadata, {'721': {policy_id: {...}}}.
+    It is only serialized once, in the transaction.
+
+    invalid_hereafter optionally makes the transaction expire before the
+    policy does.
+
     input_utxos is a list of dictionaries.  Each object in the list looks like:
     {"utxo": Dict, "count": N}
-    "utxo" is minting "N" NFTs.  The sum must add up to the number in nft_metadata_file
+    "utxo" is minting "N" NFTs.  The sum must add up to the number in raw_metadata
     Each utxo is assumed to contain 0 other assets.
     The destination address will be queried for each input utxo
     """
 
-    if not verify_unique_nfts(cardano, database, policy_name, nft_metadata_file):
+    if not verify_unique_nfts(cardano, database, policy_name, raw_metadata):
         logger.error("NFT Uniqueness Violation found.")
         raise Exception('NFT Uniqueness Violation')
 
@@ -500,8 +492,9 @@ def mint_nft_external(cardano: Cardano,
                            'assets': {}
                        }]
 
+    utxo_inputs = database.query_utxo_inputs_by_txids([item['utxo']['tx-hash'] for item in input_utxos])
     for item in input_utxos:
-        inputs = database.query_utxo_inputs(item['utxo']['tx-hash'])
+        inputs = utxo_inputs[item['utxo']['tx-hash']]
         if len(inputs) == 0:
             logger.warning('Mint NFT External, No UTXO Inputs - Waiting for DB SYNC.  Skip for now.')
             return None
@@ -517,25 +510,24 @@ def mint_nft_external(cardano: Cardano,
 
     # tip address
     address_outputs.append({
-                                'address': {'mainnet': 'addr1q88q8fmttd9lt4pgtc3g778w74jxsk9r7q2mmt5lhpyw3sl8mam03vp3qc8k8lmgsdlf6p43xcmcmp6jgx2y6w62nszq070rcs',
-                                            'testnet': 'addr_test1vzwyk8nwfh5esy09z79nzyxe69y8u5wdx60vgxsnu0w0q7cxqx50m'}[cardano.get_network()],
+                                'address': TIP_ADDRESSES[cardano.get_network()],
                                 'amount': 1,
                                 'assets': {}
                             })
 
     # draft
     fee = 0
-    cardano.create_mint_nft_transaction_file(input_utxos,
-                                             address_outputs,
-                                             fee,
-                                             policy_name,
-                                             nft_metadata_file,
-                                             'transaction/mint_nft_external_draft_tx_{}'.format(os.getpid()))
+    (draft, mint_map) = cardano.build_mint_nft_transaction(input_utxos,
+                                                           address_outputs,
+                                                           fee,
+                                                           policy_name,
+                                                           raw_metadata,
+                                                           invalid_hereafter)
 
     # https://github.com/input-output-hk/cardano-ledger-specs/blob/master/doc/explanations/min-utxo.rst
     cardano.calculate_min_required_utxo_mint(input_utxos,
                                              address_outputs,
-                                             nft_metadata_file)
+                                             raw_metadata)
 
     total_input_lovelace = 0
     for item in input_utxos:
@@ -544,10 +536,7 @@ def mint_nft_external(cardano: Cardano,
     logger.debug("Mint NFT External, total payment received: {} ADA".format(total_input_lovelace / 1000000))
 
     #fee
-    fee = cardano.calculate_min_fee('transaction/mint_nft_external_draft_tx_{}'.format(os.getpid()),
-                                    len(input_utxos),
-                                    len(address_outputs),
-                                    3)
+    fee = cardano.calculate_transaction_fee(draft, 3)
 
     # update output amounts
     address_outputs[0]['amount'] = total_input_lovelace - fee # the project keeps
@@ -586,8 +575,15 @@ def mint_nft_external(cardano: Cardano,
                                                                   address_outputs,
                                                                   fee,
                                                                   policy_name,
-                                                                  nft_metadata_file,
-                                                                  'transaction/mint_nft_external_unsigned_tx_{}'.format(os.getpid()))
+                                                                  raw_metadata,
+                                                                  'transaction/mint_nft_external_unsigned_tx_{}'.format(os.getpid()),
+                                                                  invalid_hereafter)
+    max_tx_size = cardano.get_protocol_parameters().get('maxTxSize')
+    size = len(output.serialize(3))
+    if max_tx_size != None and size > max_tx_size:
+        logger.error('Mint NFT External, Transaction too large: {} > {} bytes'.format(size, max_tx_size))
+        return None
+
     for item in mint_map:
         hash = item.split('#')[0]
         ix = int(item.split('#')[1])
@@ -601,6 +597,9 @@ def mint_nft_external(cardano: Cardano,
                              'transaction/mint_nft_external_signed_tx_{}'.format(os.getpid()))
     #submit
     tx_id = cardano.submit_transaction('transaction/mint_nft_external_signed_tx_{}'.format(os.getpid()))
+    if tx_id != None:
+        # db-sync will not have this transaction for a while, the next mint must still see these tokens
+        database.add_minted_token_names(cardano.get_policy_id(policy_name), Nft.parse_metadata(raw_metadata)['token-names'])
 
     return tx_id
 
@@ -609,20 +608,22 @@ def batch_mint_next_nft_in_series(cardano: Cardano,
                                   minting_wallet: Wallet,
                                   policy_name: str,
                                   input_utxos: List,
-                                  nft_metadata_file: str,
-                                  sales: Sales) -> bool:
+                                  raw_metadata: Dict,
+                                  sales: Sales,
+                                  invalid_hereafter: int = None) -> str:
     """
-    Mint the NFT defined in nft_metadata_file.
+    Mint the NFTs defined in raw_metadata.
 
-    @param nft_metadata_file Could contain a single asset or multiple assets
+    @param raw_metadata Could contain a single asset or multiple assets
+    @param invalid_hereafter Optional TTL, never later than the policy allows
+    @return The transaction id or None if nothing was submitted
     """
 
-    logger.debug('Mint Next Series NFT, merged nft metadata: {}'.format(nft_metadata_file))
     for item in input_utxos:
         logger.debug('Mint Next Series NFT, {} / {}, {} NFTs, input: {}#{}'.format(minting_wallet.get_name(), policy_name, item['count'], item['utxo']['tx-hash'], item['utxo']['tx-ix']))
         sales.add_utxo(item['utxo']['tx-hash'], item['utxo']['tx-ix'], item['utxo']['amount'], item['count'])
 
-    nft_metadata = Nft.parse_metadata_file(nft_metadata_file)
+    nft_metadata = Nft.parse_metadata(raw_metadata)
 
     logger.info('Mint Next Series NFT, Mint NFTs: {}'.format(nft_metadata['token-names']))
     tx_id = mint_nft_external(cardano,
@@ -630,8 +631,9 @@ def batch_mint_next_nft_in_series(cardano: Cardano,
                               minting_wallet,
                               policy_name,
                               input_utxos,
-                              nft_metadata_file,
-                              sales)
+                              raw_metadata,
+                              sales,
+                              invalid_hereafter)
 
     if tx_id != None:
         # Set the output txid to mark the transaction successful
@@ -642,7 +644,7 @@ def batch_mint_next_nft_in_series(cardano: Cardano,
         for item in input_utxos:
             sales.remove_utxo(item['utxo']['tx-hash'], item['utxo']['tx-ix'])
 
-    return True
+    return tx_id
 
 def refund_payment(cardano: Cardano,
                    database: Database,
@@ -682,10 +684,13 @@ def process_whitelist(cardano: Cardano,
                               drop_name: str,
                               metadata_set_file: str,
                               whitelist_payments: List,
-                              max_per_tx: int) -> None:
+                              max_per_tx: int,
+                              store: MetadataStore = None) -> None:
     """
     Process payments in the given whitelist.  The number of NFTs to mint for each
     transaction is set in the whitelist payment.
+
+    @param store The metadata of the drop.  Loaded if not given.
     """
 
     logger.info('Presale whitelist minting wallet address: {}'.format(minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_PRESALE)))
@@ -693,6 +698,8 @@ def process_whitelist(cardano: Cardano,
 
     nft_metadata = MetadataList(metadata_set_file)
     logger.info('Presale, NFTs Remaining: {}'.format(nft_metadata.get_remaining()))
+    if store == None:
+        store = MetadataStore(nft_metadata.get_next_files(nft_metadata.get_remaining()))
 
     for payment in whitelist_payments:
         # payment is a dictionary with:
@@ -727,7 +734,7 @@ def process_whitelist(cardano: Cardano,
             logger.error('Presale, NFTs Remaining: {}, Required: {}'.format(nft_metadata.get_remaining(), payment['nfts']))
             raise Exception('Presale, NFTs Remaining: {}, Required: {}'.format(nft_metadata.get_remaining(), payment['nfts']))
 
-        if payment['nfts'] < 1 or payment['nfts'] > max_per_tx:
+        if payment['nfts'] < 1 or (max_per_tx != None and payment['nfts'] > max_per_tx):
             logger.error('Presale, Invalid NFTs requested: {}'.format(payment['nfts']))
             raise Exception('Presale, Invalid NFTs requested: {}'.format(payment['nfts']))
 
@@ -747,15 +754,14 @@ def process_whitelist(cardano: Cardano,
             logger.debug('Merging NFT metadata: {}'.format(mdfile))
 
         policy_id = cardano.get_policy_id(policy_name)
-        merged_metadata_file = Nft.merge_metadata_files(policy_id,
-                                                        nft_metadata_files)
+        merged_metadata = store.merge(policy_id, nft_metadata_files)
 
         if not batch_mint_next_nft_in_series(cardano,
                                              database,
                                              minting_wallet,
                                              policy_name,
                                              input_utxos,
-                                             merged_metadata_file,
+                                             merged_metadata,
                                              sales):
             nft_metadata.revert()
             logger.error('process_incoming_payments, Fail to mint')
@@ -780,116 +786,141 @@ def process_incoming_payments(cardano: Cardano,
                               drop_name: str,
                               metadata_set_file: str,
                               prices: Dict[int, int],
-                              max_per_tx: int) -> None:
+                              max_per_tx: int,
+                              watcher: PaymentWatcher = None,
+                              max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                              store: MetadataStore = None) -> None:
     """
     Listing for incoming payments and mint NFT to the address the payment came
     from.  NFTs are minted in the order defined in metadata_set_file and assumes
     that all NFTs have the same price.
 
     @param prices A dictionary to define the price for a single item or a bundle.
+    @param max_per_tx Optional limit on the NFTs in one transaction.  Payments
+                      are packed up to the transaction size limit regardless.
+    @param watcher Waits for new payments between queries.  If not given, waits
+                   for new blocks that send to the mint addresses.
+    @param max_in_flight Mint transactions submitted and not yet confirmed
+    @param store The metadata of the drop.  Loaded if not given.
     """
 
-    logger.info('Monitor Incoming Payments on   (delegated): {}'.format(minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT, delegated=True)))
-    logger.info('Monitor Incoming Payments on (undelegated): {}'.format(minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT, delegated=False)))
+    mint_addresses = [minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT, delegated=True),
+                      minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT, delegated=False)]
+    logger.info('Monitor Incoming Payments on   (delegated): {}'.format(mint_addresses[0]))
+    logger.info('Monitor Incoming Payments on (undelegated): {}'.format(mint_addresses[1]))
     sales = Sales(cardano.get_network(), drop_name)
 
+    if watcher == None:
+        watcher = PaymentWatcher(database, mint_addresses)
+
     nft_metadata = MetadataList(metadata_set_file)
     logger.info('process_incoming_payments, NFTs Remaining: {}'.format(nft_metadata.get_remaining()))
+    if store == None:
+        store = MetadataStore(nft_metadata.get_next_files(nft_metadata.get_remaining()))
+
+    pipeline = MintPipeline(cardano.get_network(), drop_name, max_in_flight)
+    policy_id = cardano.get_policy_id(policy_name)
+    packer = BatchPacker(cardano,
+                         policy_name,
+                         minting_wallet.get_payment_address(0),
+                         TIP_ADDRESSES[cardano.get_network()],
+                         store,
+                         max_per_tx)
 
     while True:
         #time.sleep(2)
-        (utxos, total_lovelace) = cardano.query_utxos(minting_wallet,
-                                                      [minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT, delegated=True),
-                                                       minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT, delegated=False)])
+        # Fees and min-ADA follow the protocol parameters of the current epoch
+        cardano.refresh_protocol_parameters(database.query_latest_epoch())
+
+        (utxos, total_lovelace) = cardano.query_utxos(minting_wallet, mint_addresses)
         utxos = cardano.query_utxos_time(database, utxos)
         utxos.sort(key=lambda item : item['slot-no'])
 
+        # Forget mint transactions that are on chain and give back the ones
+        # that expired without making it on chain
+        slot = database.query_latest_slot()
+        pipeline.update(utxos, slot, database, nft_metadata, sales)
+        pending_inputs = pipeline.get_pending_inputs()
+
         matching_utxos = 0
         for utxo in utxos:
-            if utxo['amount'] in prices and not sales.contains(utxo['tx-hash'], utxo['tx-ix']):
+            if utxo['amount'] in prices and not sales.contains(utxo['tx-hash'], utxo['tx-ix']) and not (utxo.tx_hash, utxo.tx_ix) in pending_inputs:
                 matching_utxos += 1
+            elif not utxo['amount'] in prices and not sales.contains(utxo['tx-hash'], utxo['tx-ix']):
+                # Don't know what to do this this UTXO
+                logger.warning('RX UTXO (Invalid Price) {}: {} lovelace'.format(utxo['tx-hash'], utxo['amount']))
 
         if matching_utxos == 0:
             logger.debug('process_incoming_payments, Waiting for a new matching UTXO')
-            time.sleep(30)
+            watcher.wait()
             continue
 
         if nft_metadata.get_remaining() > 0:
-            if len(utxos) > 0:
-                # There are NFTs available.  So go find a UTXO that NFTs can be minted to.
-                # Collect incoming utxos that match a payment and batch them together for processing
-                input_utxos = []
-                nfts_to_mint = 0
-
-                # search for UTXOs that the full requested amount can be fulfilled
-                for utxo in utxos:
-                    if sales.contains(utxo['tx-hash'], utxo['tx-ix']):
-                        # If already processed this UTXO then skip it.
-                        continue
-
-                    if utxo['amount'] in prices:
-                        num_nfts = prices[utxo['amount']]
-                        if num_nfts + nfts_to_mint <= nft_metadata.get_remaining() and num_nfts + nfts_to_mint <= max_per_tx:
-                            logger.info('RX UTXO {}: {} lovelace'.format(utxo['tx-hash'], utxo['amount']))
-                            logger.info('Request {} NFTs'.format(num_nfts))
-                            input_utxos.append({'utxo': utxo, 'count': num_nfts, 'refund': 0})
-                            logger.debug('Queue For Mint, UTXO {} = {} NFTs, refund: {}'.format(utxo['tx-hash'], num_nfts, 0))
-                            nfts_to_mint += num_nfts
-                        else:
-                            # reached the maximum amount that can be processed
-                            # or that is available.  Check to see if a partial
-                            # amount can be granted
-                            if nfts_to_mint == 0:
-                                # This could happen on the last mint transaction
-                                if num_nfts > nft_metadata.get_remaining():
-                                    price_per_nft = utxo['amount'] / num_nfts
-                                    refund_nfts = num_nfts - nft_metadata.get_remaining()
-                                    refund_price = int(refund_nfts * price_per_nft)
-                                    num_nfts = nft_metadata.get_remaining()
-                                    input_utxos.append({'utxo': utxo, 'count': num_nfts, 'refund': refund_price})
-                                    nfts_to_mint += num_nfts
-                                    logger.debug('Queue For Mint, UTXO {} = {} NFTs, refund: {}'.format(utxo['tx-hash'], num_nfts, refund_price))
-                                else:
-                                    logger.error("Configuration error: max_per_tx < num requested for price")
-                                    raise Exception("Configuration error: max_per_tx < num requested for price")
-                            break
-                    else :
-                        # Don't know what to do this this UTXO
-                        logger.warning('RX UTXO (Invalid Price) {}: {} lovelace'.format(utxo['tx-hash'], utxo['amount']))
-
-                # by now there should be something to mint.  If not then that means a
-                # UTXO was received that did not have a match to any payment price.
-                if nfts_to_mint > 0:
-                    logger.debug('Mint {} NFTs for {} queued UTXOs'.format(nfts_to_mint, len(input_utxos)))
-                    # Mint the NFTs requested
-                    nft_metadata_files = []
-                    for i in range(0, nfts_to_mint):
-                        mdfile = nft_metadata.peek_next_file()
-                        nft_metadata_files.append(mdfile)
-                        logger.debug('Merging NFT metadata: {}'.format(mdfile))
-
-                    policy_id = cardano.get_policy_id(policy_name)
-                    merged_metadata_file = Nft.merge_metadata_files(policy_id,
-                                                                    nft_metadata_files)
-
-                    if not batch_mint_next_nft_in_series(cardano,
-                                                         database,
-                                                         minting_wallet,
-                                                         policy_name,
-                                                         input_utxos,
-                                                         merged_metadata_file,
-                                                         sales):
-                        nft_metadata.revert()
-                        logger.error('process_incoming_payments, Fail to mint')
-                    else:
-                        nft_metadata.commit()
-                        logger.info('Mint complete')
-                        logger.info('Monitor Incoming Payments on: {}'.format(minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT)))
-                        logger.info('process_incoming_payments, NFTs Remaining: {}'.format(nft_metadata.get_remaining()))
+            # Submit one batch after the other from the same UTXOs.  Each batch
+            # spends different payments so none has to wait for the previous one
+            # to be confirmed.
+            submitted = 0
+            while not pipeline.is_full() and nft_metadata.get_remaining() > 0:
+                (input_utxos, refunds) = packer.pack(utxos,
+                                                     prices,
+                                                     nft_metadata.get_next_files(nft_metadata.get_remaining()),
+                                                     sales,
+                                                     pending_inputs)
+                for utxo in refunds:
+                    logger.info("Refund: {} = {}".format(utxo['tx-hash'], utxo['amount']))
+                    if not refund_payment(cardano, database, minting_wallet, utxo, sales):
+                        logger.error('processing_incoming_payments, Fail to refund')
+
+                nfts_to_mint = sum([item['count'] for item in input_utxos])
+                if nfts_to_mint == 0:
+                    break
+
+                logger.debug('Mint {} NFTs for {} queued UTXOs'.format(nfts_to_mint, len(input_utxos)))
+                # Mint the NFTs requested
+                nft_metadata_files = []
+                for i in range(0, nfts_to_mint):
+                    mdfile = nft_metadata.peek_next_file()
+                    nft_metadata_files.append(mdfile)
+                    logger.debug('Merging NFT metadata: {}'.format(mdfile))
+
+                merged_metadata = store.merge(policy_id, nft_metadata_files)
+
+                # The transaction must expire soon so it can be rolled back
+                # safely if it never makes it on chain
+                invalid_hereafter = pipeline.get_invalid_hereafter(slot, Cardano.get_invalid_hereafter(cardano.get_policy_script(policy_name)))
+                tx_id = batch_mint_next_nft_in_series(cardano,
+                                                      database,
+                                                      minting_wallet,
+                                                      policy_name,
+                                                      input_utxos,
+                                                      merged_metadata,
+                                                      sales,
+                                                      invalid_hereafter)
+                if tx_id == None:
+                    nft_metadata.revert()
                     sales.commit()
-                else:
-                    # The UTXO is being processed
-                    pass
+                    logger.error('process_incoming_payments, Fail to mint')
+                    break
+
+                nft_metadata.commit()
+                pipeline.add(tx_id,
+                             input_utxos,
+                             nft_metadata_files,
+                             policy_id,
+                             list(merged_metadata['721'][policy_id].keys()),
+                             invalid_hereafter)
+                sales.commit()
+                submitted += 1
+                logger.info('Mint submitted: {}'.format(tx_id))
+                logger.info('Monitor Incoming Payments on: {}'.format(minting_wallet.get_payment_address(Wallet.ADDRESS_INDEX_MINT)))
+                logger.info('process_incoming_payments, NFTs Remaining: {}'.format(nft_metadata.get_remaining()))
+                Command.log_timings()
+
+            # Nothing more can be submitted until a payment arrives or a
+            # transaction is confirmed
+            if pipeline.is_full() or submitted == 0:
+                logger.debug('process_incoming_payments, {} mint transactions in flight'.format(len(pipeline.transactions)))
+                watcher.wait()
         else:
             # No NFTs available.  Any UTXO that matches a payment amount will be
             # refunded
@@ -897,7 +928,7 @@ def process_incoming_payments(cardano: Cardano,
 
             # Copy the UTXOs that match a payment amount
             for utxo in utxos:
-                if sales.contains(utxo['tx-hash'], utxo['tx-ix']):
+                if sales.contains(utxo['tx-hash'], utxo['tx-ix']) or (utxo.tx_hash, utxo.tx_ix) in pending_inputs:
                     # If already processed this UTXO then skip it.
                     continue
 
@@ -912,7 +943,7 @@ def process_incoming_payments(cardano: Cardano,
                     logger.error('processing_incoming_payments, Fail to refund')
                 else:
                     logger.info('processing_incoming_payments, Refund complete.')
-            time.sleep(30)
+            watcher.wait()
 
 
     logger.info('!!!!!!!!!!!!!!!!!!!!!!!!')
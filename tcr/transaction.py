@@ -0,0 +1,365 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+File: transaction.py
+Author: SuperKK
+
+Build transactions in memory instead of with 'cardano-cli transaction build-raw'.
+
+The transaction is serialized in the ledger CBOR format:
+    [transaction_body, transaction_witness_set, is_valid, auxiliary_data]
+
+and written as a cardano-cli text envelope so it can still be signed and
+submitted with cardano-cli.
+"""
+
+from typing import Dict, List, Tuple
+
+import json
+import hashlib
+import logging
+import tcr.cbor
+
+logger = logging.getLogger('transaction')
+
+TRANSACTION_ENVELOPE_TYPE = 'Tx AlonzoEra'
+
+BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+# Transaction body map keys
+BODY_INPUTS = 0
+BODY_OUTPUTS = 1
+BODY_FEE = 2
+BODY_TTL = 3
+BODY_AUXILIARY_DATA_HASH = 7
+BODY_MINT = 9
+
+# Transaction witness set map keys
+WITNESS_VKEY = 0
+WITNESS_NATIVE_SCRIPT = 1
+
+# Transaction metadata strings and bytes are limited to 64 bytes
+METADATA_MAX_LENGTH = 64
+
+# A vkey witness is [vkey (32 bytes), signature (64 bytes)]
+DUMMY_VKEY_WITNESS = [bytes(32), bytes(64)]
+
+# Largest growth of a uint when a placeholder value is replaced with the final
+# value.  Used to pad the fee estimate for the fee and each output amount.
+UINT_GROWTH = 8
+
+def bech32_polymod(values: List[int]) -> int:
+    generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i in range(0, 5):
+            checksum ^= generator[i] if ((top >> i) & 1) else 0
+    return checksum
+
+def bech32_decode(address: str) -> Tuple[str, bytes]:
+    """
+    Decode a bech32 string.  Cardano addresses are longer than the 90 character
+    limit from BIP-0173 so the length is not checked.
+
+    @return (human readable part, data bytes)
+    """
+
+    address = address.lower()
+    separator = address.rfind('1')
+    if separator < 1 or separator + 7 > len(address):
+        raise Exception('Invalid bech32 string: {}'.format(address))
+
+    hrp = address[:separator]
+    values = []
+    for c in address[separator+1:]:
+        if not c in BECH32_CHARSET:
+            raise Exception('Invalid bech32 character: {}'.format(c))
+        values.append(BECH32_CHARSET.find(c))
+
+    expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    if bech32_polymod(expanded + values) != 1:
+        raise Exception('Invalid bech32 checksum: {}'.format(address))
+
+    # convert the 5 bit groups, less the checksum, to bytes
+    accumulator = 0
+    bits = 0
+    data = bytearray()
+    for value in values[:-6]:
+        accumulator = (accumulator << 5) | value
+        bits += 5
+        if bits >= 8:
+            bits -= 8
+            data.append((accumulator >> bits) & 0xff)
+
+    return (hrp, bytes(data))
+
+def base58_decode(address: str) -> bytes:
+    number = 0
+    for c in address:
+        if not c in BASE58_ALPHABET:
+            raise Exception('Invalid base58 character: {}'.format(c))
+        number = number * 58 + BASE58_ALPHABET.find(c)
+
+    data = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    leading_zeros = len(address) - len(address.lstrip('1'))
+    return bytes(leading_zeros) + data
+
+def address_to_bytes(address: str) -> bytes:
+    """
+    Convert a Shelley (bech32) or Byron (base58) address to the raw bytes used
+    in a transaction output.
+    """
+
+    if address.startswith('addr'):
+        (hrp, data) = bech32_decode(address)
+        return data
+
+    return base58_decode(address)
+
+def asset_name_to_bytes(name: str) -> bytes:
+    return name.encode('utf-8')
+
+def split_full_name(full_name: str) -> Tuple[str, str]:
+    """
+    Split 'policy.name' into (policy, name).  Just 'policy' is a token with
+    an empty name, such as the royalty token.
+    """
+
+    if '.' in full_name:
+        (policy_id, name) = full_name.split('.', 1)
+        return (policy_id, name)
+
+    return (full_name, '')
+
+def metadata_string_to_cbor_value(value: str):
+    if value.startswith('0x'):
+        try:
+            data = bytes.fromhex(value[2:])
+            if len(data) > METADATA_MAX_LENGTH:
+                raise Exception('Metadata bytes longer than {}: {}'.format(METADATA_MAX_LENGTH, value))
+            return data
+        except ValueError:
+            pass
+
+    if len(value.encode('utf-8')) > METADATA_MAX_LENGTH:
+        raise Exception('Metadata string longer than {}: {}'.format(METADATA_MAX_LENGTH, value))
+
+    return value
+
+def metadata_key_to_cbor_value(key: str):
+    try:
+        number = int(key)
+        if number >= -(1 << 64) and number < (1 << 64):
+            return number
+    except ValueError:
+        pass
+
+    return metadata_string_to_cbor_value(key)
+
+def metadata_to_cbor_value(value):
+    """
+    Convert JSON metadata to CBOR values using the same "no schema" mapping as
+    'cardano-cli --metadata-json-file'.
+    """
+
+    if isinstance(value, bool) or value == None:
+        raise Exception('Metadata does not support: {}'.format(value))
+    elif isinstance(value, int):
+        return value
+    elif isinstance(value, str):
+        return metadata_string_to_cbor_value(value)
+    elif isinstance(value, list):
+        return [metadata_to_cbor_value(item) for item in value]
+    elif isinstance(value, dict):
+        return {metadata_key_to_cbor_value(k): metadata_to_cbor_value(value[k]) for k in value}
+
+    raise Exception('Metadata does not support: {}'.format(value))
+
+def native_script_to_cbor_value(script: Dict) -> List:
+    """
+    Convert a JSON native script, as stored in policy/<network>/<policy>.script,
+    to the ledger representation.
+    """
+
+    if script['type'] == 'sig':
+        return [0, bytes.fromhex(script['keyHash'])]
+    elif script['type'] == 'all':
+        return [1, [native_script_to_cbor_value(s) for s in script['scripts']]]
+    elif script['type'] == 'any':
+        return [2, [native_script_to_cbor_value(s) for s in script['scripts']]]
+    elif script['type'] == 'atLeast':
+        return [3, script['required'], [native_script_to_cbor_value(s) for s in script['scripts']]]
+    elif script['type'] == 'after':
+        return [4, script['slot']]
+    elif script['type'] == 'before':
+        return [5, script['slot']]
+
+    raise Exception('Unknown native script type: {}'.format(script['type']))
+
+def calculate_policy_id(script: Dict) -> str:
+    data = b'\x00' + tcr.cbor.encode(native_script_to_cbor_value(script))
+    return hashlib.blake2b(data, digest_size=28).hexdigest()
+
+class Transaction:
+    """
+    A transaction built in memory.  Outputs and mint take asset names in the
+    same 'policy.name' form used by Cardano.query_utxos.
+    """
+
+    def __init__(self):
+        self.inputs = []
+        self.outputs = []
+        self.fee = 0
+        self.invalid_hereafter = None
+        self.mint = {}
+        self.metadata = None
+        self.scripts = []
+
+    def add_input(self, tx_hash: str, tx_ix: int) -> None:
+        self.inputs.append((tx_hash, int(tx_ix)))
+
+    def add_output(self, address: str, amount: int, assets: Dict[str, int]) -> None:
+        self.outputs.append((address, amount, dict(assets)))
+
+    def set_fee(self, fee: int) -> None:
+        self.fee = fee
+
+    def set_invalid_hereafter(self, slot: int) -> None:
+        self.invalid_hereafter = slot
+
+    def add_mint(self, full_name: str, amount: int) -> None:
+        if full_name in self.mint:
+            self.mint[full_name] += amount
+        else:
+            self.mint[full_name] = amount
+
+    def set_metadata(self, metadata: Dict) -> None:
+        """
+        @param metadata The JSON metadata, e.g. {"721": {...}}
+        """
+
+        self.metadata = metadata
+
+    def add_script(self, script: Dict) -> None:
+        """
+        @param script A JSON native script, e.g. a policy script
+        """
+
+        self.scripts.append(script)
+
+    @staticmethod
+    def get_multi_asset(assets: Dict[str, int]) -> Dict:
+        multi_asset = {}
+        for full_name in assets:
+            if assets[full_name] == 0:
+                continue
+
+            (policy_id, name) = split_full_name(full_name)
+            policy = bytes.fromhex(policy_id)
+            if not policy in multi_asset:
+                multi_asset[policy] = {}
+            multi_asset[policy][asset_name_to_bytes(name)] = assets[full_name]
+
+        return multi_asset
+
+    def get_auxiliary_data(self):
+        if self.metadata == None:
+            return None
+
+        return metadata_to_cbor_value(self.metadata)
+
+    def get_body(self) -> Dict:
+        body = {}
+        body[BODY_INPUTS] = [[bytes.fromhex(tx_hash), tx_ix] for (tx_hash, tx_ix) in self.inputs]
+
+        outputs = []
+        for (address, amount, assets) in self.outputs:
+            multi_asset = Transaction.get_multi_asset(assets)
+            if len(multi_asset) > 0:
+                outputs.append([address_to_bytes(address), [amount, multi_asset]])
+            else:
+                outputs.append([address_to_bytes(address), amount])
+        body[BODY_OUTPUTS] = outputs
+
+        body[BODY_FEE] = self.fee
+        if self.invalid_hereafter != None:
+            body[BODY_TTL] = self.invalid_hereafter
+
+        auxiliary_data = self.get_auxiliary_data()
+        if auxiliary_data != None:
+            body[BODY_AUXILIARY_DATA_HASH] = hashlib.blake2b(tcr.cbor.encode(auxiliary_data), digest_size=32).digest()
+
+        mint = Transaction.get_multi_asset(self.mint)
+        if len(mint) > 0:
+            body[BODY_MINT] = mint
+
+        return body
+
+    def serialize(self, witness_count: int = 0) -> bytes:
+        """
+        Serialize the transaction.
+
+        @param witness_count Add this many placeholder vkey witnesses.  Only
+                             used to measure the size of the signed transaction.
+        """
+
+        witness_set = {}
+        if witness_count > 0:
+            witness_set[WITNESS_VKEY] = [DUMMY_VKEY_WITNESS] * witness_count
+        if len(self.scripts) > 0:
+            witness_set[WITNESS_NATIVE_SCRIPT] = [native_script_to_cbor_value(s) for s in self.scripts]
+
+        return tcr.cbor.encode([self.get_body(), witness_set, True, self.get_auxiliary_data()])
+
+    def get_transaction_id(self) -> str:
+        return hashlib.blake2b(tcr.cbor.encode(self.get_body()), digest_size=32).hexdigest()
+
+    def calculate_min_fee(self, protocol_parameters: Dict, witness_count: int) -> int:
+        """
+        Calculate the linear fee, txFeeFixed + txFeePerByte * size, of the signed
+        transaction.  The fee and output amounts are usually placeholders when
+        this is called so the size is padded for them to grow.
+        """
+
+        size = len(self.serialize(witness_count))
+        size += UINT_GROWTH * (len(self.outputs) + 1)
+        fee = protocol_parameters['txFeeFixed'] + protocol_parameters['txFeePerByte'] * size
+        logger.debug('Transaction size = {} bytes, min fee = {} lovelace'.format(size, fee))
+        return fee
+
+    def write_file(self, transaction_file: str) -> None:
+        """
+        Write the unsigned transaction as a cardano-cli text envelope.
+        """
+
+        envelope = {'type': TRANSACTION_ENVELOPE_TYPE,
+                    'description': '',
+                    'cborHex': self.serialize().hex()}
+
+        with open(transaction_file, 'w') as file:
+            file.write(json.dumps(envelope, indent=4))
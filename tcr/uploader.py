@@ -0,0 +1,293 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: uploader.py
+Author: SuperKK
+
+Upload files to IPFS on a pool of threads sharing one keep-alive session.
+Each upload is recorded in a manifest so a re-run skips files that were
+already uploaded.
+"""
+
+from typing import Dict, List, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tcr.cid
+from tcr.cid import CidBuilder
+
+logger = logging.getLogger('ipfs')
+
+INFURA_API_URL = 'https://ipfs.infura.io:5001/api/v0'
+
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 5
+
+# Seconds to wait before the first retry, doubled for each retry after that
+DEFAULT_BACKOFF = 1.0
+
+# Seconds to wait for the IPFS API to respond
+DEFAULT_TIMEOUT = 300
+
+# Status codes worth trying again, rate limited or a server side error
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+def hash_file(filename: str) -> Tuple[str, str]:
+    """
+    Read a file once to calculate both hashes.
+
+    @return (sha256 hex digest, CIDv0 IPFS will give the file)
+    """
+
+    hasher = hashlib.sha256()
+    builder = CidBuilder()
+    with open(filename, 'rb') as file:
+        buf = file.read(tcr.cid.CHUNK_SIZE)
+        while len(buf) > 0:
+            hasher.update(buf)
+            builder.update(buf)
+            buf = file.read(tcr.cid.CHUNK_SIZE)
+    return (hasher.hexdigest(), builder.hexdigest())
+
+class UploadManifest:
+    """
+    Files already uploaded to IPFS.  One JSON record per line,
+    {'path', 'sha256', 'cid'}.  A later record for the same path replaces an
+    earlier one.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.file = None
+
+        if os.path.isfile(self.filename):
+            self.read()
+
+    def read(self) -> None:
+        with open(self.filename, 'rb') as file:
+            data = file.read()
+
+        offset = 0
+        while offset < len(data):
+            end = data.find(b'\n', offset)
+            if end < 0:
+                break
+
+            try:
+                record = json.loads(data[offset:end])
+            except ValueError:
+                break
+
+            self.entries[record['path']] = record
+            offset = end + 1
+
+        if offset < len(data):
+            logger.warning('Truncate incomplete upload manifest record at: {}'.format(offset))
+            with open(self.filename, 'r+b') as file:
+                file.truncate(offset)
+
+    @staticmethod
+    def get_key(path: str) -> str:
+        return os.path.normpath(path)
+
+    def get_cid(self, path: str, sha256: str) -> str:
+        """
+        @return The CID path was uploaded as if its content has not changed
+        """
+
+        entry = self.entries.get(UploadManifest.get_key(path))
+        if entry == None or entry['sha256'] != sha256:
+            return None
+        return entry['cid']
+
+    def add(self, path: str, sha256: str, cid: str) -> None:
+        record = {'path': UploadManifest.get_key(path), 'sha256': sha256, 'cid': cid}
+        with self.lock:
+            if self.file == None:
+                self.file = open(self.filename, 'a')
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.entries[record['path']] = record
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file != None:
+                self.file.close()
+                self.file = None
+
+class Uploader:
+    """
+    Upload and pin files with the IPFS HTTP API.
+    """
+
+    def __init__(self,
+                 projectid: str,
+                 projectsecret: str,
+                 manifest: UploadManifest = None,
+                 api_url: str = INFURA_API_URL,
+                 max_workers: int = DEFAULT_WORKERS,
+                 retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.manifest = manifest
+        self.api_url = api_url.rstrip('/')
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # One connection per worker is kept alive and reused for every file
+        self.session = requests.Session()
+        self.session.auth = (projectid, projectsecret)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, endpoint: str, filename: str = None, params: Dict = None) -> Dict:
+        """
+        Call the API, retrying with exponential backoff when the connection
+        fails or the server is busy.
+
+        @param endpoint The API endpoint, e.g. 'add'
+        @param filename Optional file to send as multipart form data
+        """
+
+        url = '{}/{}'.format(self.api_url, endpoint)
+        attempt = 0
+        while True:
+            error = None
+            try:
+                if filename != None:
+                    with open(filename, 'rb') as file:
+                        files = {'file': (os.path.basename(filename), file)}
+                        response = self.session.post(url, params=params, files=files, timeout=self.timeout)
+                else:
+                    response = self.session.post(url, params=params, timeout=self.timeout)
+
+                if response.status_code == 200:
+                    return response.json()
+
+                error = '{} Status Code: {}'.format(endpoint, response.status_code)
+                if not response.status_code in RETRY_STATUS_CODES:
+                    logger.error(error)
+                    raise Exception(error)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = '{} Failed: {}'.format(endpoint, e)
+
+            if attempt >= self.retries:
+                logger.error('{}, giving up after {} attempts'.format(error, attempt + 1))
+                raise Exception('{}, giving up after {} attempts'.format(error, attempt + 1))
+
+            delay = self.backoff * (2 ** attempt)
+            logger.warning('{}, retry in {} seconds'.format(error, delay))
+            time.sleep(delay)
+            attempt += 1
+
+    def get_pins(self) -> Set[str]:
+        """
+        @return The CIDs pinned recursively, i.e. files already uploaded
+        """
+
+        pin_json = self.post('pin/ls', params={'type': 'recursive'})
+        return set(pin_json['Keys'].keys())
+
+    def upload(self, filename: str, pins: Set[str] = None) -> str:
+        """
+        Upload and pin one file.  Skipped if the manifest has the file with the
+        same content, or if the CID calculated locally is already pinned.
+
+        @param pins Optional CIDs already pinned, see get_pins
+        @return The CID of the file
+        """
+
+        (sha256, local_cid) = hash_file(filename)
+        if self.manifest != None:
+            cid = self.manifest.get_cid(filename, sha256)
+            if cid != None:
+                logger.debug('Already Uploaded: {} = {}'.format(filename, cid))
+                return cid
+
+        if pins != None and local_cid in pins:
+            logger.info('Already Pinned: {} = {}'.format(filename, local_cid))
+            cid = local_cid
+        else:
+            logger.info('Uploading: {}'.format(filename))
+            upload_json = self.post('add', filename=filename, params={'pin': 'true'})
+            cid = upload_json['Hash']
+            logger.info('Uploaded: {} = {}'.format(filename, cid))
+            logger.info('   Verify: http://ipfs.io/ipfs/{}'.format(cid))
+            if cid != local_cid:
+                logger.warning('Uploaded CID {} is not the CID calculated locally {}'.format(cid, local_cid))
+
+        if self.manifest != None:
+            self.manifest.add(filename, sha256, cid)
+
+        return cid
+
+    def upload_all(self, filenames: List[str], check_pins: bool = False) -> Dict[str, str]:
+        """
+        Upload files concurrently.  If any upload fails, the files not started
+        yet are cancelled and the error is raised once the others finish.  The
+        uploads that finished are in the manifest for the next run.
+
+        @param check_pins Skip files already pinned that are not in the manifest
+        @return {filename: CID}
+        """
+
+        pins = None
+        if check_pins:
+            pins = self.get_pins()
+            logger.info('Pinned: {}'.format(len(pins)))
+
+        filenames = list(dict.fromkeys(filenames))
+        cids = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.upload, filename, pins): filename for filename in filenames}
+            try:
+                for future in as_completed(futures):
+                    cids[futures[future]] = future.result()
+            except:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        logger.info('Uploaded {} files'.format(len(cids)))
+        return cids
+
+    def close(self) -> None:
+        self.session.close()
+        if self.manifest != None:
+            self.manifest.close()
@@ -0,0 +1,167 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: utxo.py
+Author: SuperKK
+"""
+
+from typing import Dict, Tuple
+
+# Datum value used by the cardano-cli table output when there is no datum
+DATUM_NONE = 'TxOutDatumNone'
+
+class Utxo:
+    """
+    An unspent transaction output.
+
+    assets is keyed by (policy id, asset name).  Royalty tokens have an empty
+    asset name.
+
+    The keys of the dictionary originally returned by Cardano.query_utxos,
+    'tx-hash', 'tx-ix', 'amount', 'assets', 'tx-out-datum-hash', 'address',
+    'time' and 'slot-no', can still be used with utxo[key].  utxo['assets']
+    returns the assets keyed by 'policy.name' and must be treated as read only.
+    Any other key is stored in extra.
+    """
+
+    __slots__ = ('tx_hash', 'tx_ix', 'amount', 'assets', 'datum_hash', 'address',
+                 'time', 'slot_no', 'extra', 'asset_names')
+
+    KEYS = {'tx-hash': 'tx_hash',
+            'tx-ix': 'tx_ix',
+            'amount': 'amount',
+            'tx-out-datum-hash': 'datum_hash',
+            'address': 'address',
+            'time': 'time',
+            'slot-no': 'slot_no'}
+
+    def __init__(self,
+                 tx_hash: str,
+                 tx_ix: int,
+                 amount: int,
+                 assets: Dict[Tuple[str, str], int] = None,
+                 datum_hash: str = None,
+                 address: str = None):
+        self.tx_hash = tx_hash
+        self.tx_ix = tx_ix
+        self.amount = amount
+        self.assets = assets if assets != None else {}
+        self.datum_hash = datum_hash
+        self.address = address
+        self.time = None
+        self.slot_no = None
+        self.extra = None
+        self.asset_names = None
+
+    @staticmethod
+    def get_full_name(policy_id: str, name: str) -> str:
+        if len(name) == 0:
+            return policy_id
+        return '{}.{}'.format(policy_id, name)
+
+    @staticmethod
+    def decode_asset_name(raw: bytes) -> str:
+        """
+        Asset names minted by this tool are utf-8 text, anything else is kept
+        as hex.
+        """
+
+        try:
+            return raw.decode('utf-8')
+        except UnicodeDecodeError:
+            return raw.hex()
+
+    @staticmethod
+    def split_full_name(full_name: str) -> Tuple[str, str]:
+        if '.' in full_name:
+            (policy_id, name) = full_name.split('.', 1)
+            return (policy_id, name)
+        return (full_name, '')
+
+    def get_asset_names(self) -> Dict[str, int]:
+        """
+        The assets keyed by 'policy.name', or 'policy' for an empty name.
+        """
+
+        if self.asset_names == None:
+            self.asset_names = {Utxo.get_full_name(policy_id, name): amount
+                                for ((policy_id, name), amount) in self.assets.items()}
+        return self.asset_names
+
+    def has_policy(self, policy_id: str) -> bool:
+        for (policy, name) in self.assets:
+            if policy == policy_id:
+                return True
+        return False
+
+    def __getitem__(self, key: str):
+        if key == 'assets':
+            return self.get_asset_names()
+
+        if key == 'tx-out-datum-hash' and self.datum_hash == None:
+            return DATUM_NONE
+
+        if key in Utxo.KEYS:
+            value = getattr(self, Utxo.KEYS[key])
+            if value != None:
+                return value
+        elif self.extra != None and key in self.extra:
+            return self.extra[key]
+
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key == 'assets':
+            self.assets = {Utxo.split_full_name(full_name): amount for (full_name, amount) in value.items()}
+            self.asset_names = None
+        elif key in Utxo.KEYS:
+            setattr(self, Utxo.KEYS[key], value)
+        else:
+            if self.extra == None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Utxo):
+            return NotImplemented
+        return self.tx_hash == other.tx_hash and self.tx_ix == other.tx_ix
+
+    def __hash__(self) -> int:
+        return hash((self.tx_hash, self.tx_ix))
+
+    def __repr__(self) -> str:
+        return 'Utxo({}#{}, {}, {})'.format(self.tx_hash, self.tx_ix, self.amount, self.get_asset_names())
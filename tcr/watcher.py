@@ -0,0 +1,134 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+File: watcher.py
+Author: SuperKK
+
+Wait for new blocks that touch a set of addresses instead of sleeping for a
+fixed amount of time between payment queries.
+"""
+
+from typing import List
+
+import logging
+import time
+from tcr.database import Database
+
+logger = logging.getLogger('watcher')
+
+WATCH_NOTIFY = 'notify'
+WATCH_TIP = 'tip'
+WATCH_SLEEP = 'sleep'
+
+WATCH_MODES = [WATCH_NOTIFY, WATCH_TIP, WATCH_SLEEP]
+
+DEFAULT_POLL_INTERVAL = 30
+DEFAULT_TIP_INTERVAL = 2
+
+class PaymentWatcher:
+    """
+    Block until a new block sends an output to one of the watched addresses or
+    until the fallback poll interval elapses, whichever happens first.
+
+    Modes:
+        'notify' - LISTEN for a NOTIFY from a trigger on the db-sync block table.
+                   @see Database.install_block_notify_trigger
+        'tip'    - Check the latest db-sync block id every tip_interval seconds.
+        'sleep'  - Just sleep for poll_interval seconds.
+    """
+
+    def __init__(self,
+                 database: Database,
+                 addresses: List[str],
+                 mode: str = WATCH_TIP,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 tip_interval: float = DEFAULT_TIP_INTERVAL):
+        """
+        @param database An open database.
+        @param addresses Wake when a block sends an output to one of these.
+        @param mode One of WATCH_MODES.
+        @param poll_interval Maximum seconds to wait before returning anyway.
+        @param tip_interval Seconds between checks for a new block in 'tip' mode.
+        """
+
+        if not mode in WATCH_MODES:
+            logger.error('Invalid watch mode: {}'.format(mode))
+            raise Exception('Invalid watch mode: {}'.format(mode))
+
+        self.database = database
+        self.addresses = [address for address in addresses if address != None]
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.tip_interval = tip_interval
+        self.last_block_id = None
+
+        if self.mode == WATCH_NOTIFY:
+            self.database.listen_for_blocks()
+
+        if self.mode != WATCH_SLEEP:
+            self.last_block_id = self.database.query_latest_block_id()
+
+        logger.info('Payment watcher, mode = {}, poll interval = {}s'.format(self.mode, self.poll_interval))
+
+    def check_activity(self, block_id: int) -> bool:
+        """
+        Check the blocks since the last check for outputs to the watched
+        addresses and move the last checked block up to block_id.
+        """
+
+        if block_id == None or block_id <= self.last_block_id:
+            return False
+
+        touched = self.database.query_address_activity(self.addresses, self.last_block_id)
+        logger.debug('Payment watcher, block {} -> {}, touched = {}'.format(self.last_block_id, block_id, touched))
+        self.last_block_id = block_id
+        return touched
+
+    def wait(self) -> bool:
+        """
+        Wait for activity on the watched addresses.
+
+        @return True if a new block touched the addresses, False if the poll
+                interval elapsed first.
+        """
+
+        if self.mode == WATCH_SLEEP:
+            time.sleep(self.poll_interval)
+            return False
+
+        deadline = time.monotonic() + self.poll_interval
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            if self.mode == WATCH_NOTIFY:
+                block_id = self.database.wait_for_block(remaining)
+            else:
+                time.sleep(min(self.tip_interval, remaining))
+                block_id = self.database.query_latest_block_id()
+
+            if self.check_activity(block_id):
+                return True
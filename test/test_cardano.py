@@ -0,0 +1,207 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_cardano.py
+Author: SuperKK
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tcr.cardano import Cardano
+from tcr.command import Command
+from tcr.utxo import Utxo
+
+POLICY_ID = '2222222222222222222222222222222222222222222222222222222a'
+
+# A signed transaction, [body, witnesses, valid, auxiliary data], and the id
+# of its body
+SIGNED_TX_CBOR = ('84a30081825820111111111111111111111111111111111111111111111111111111111111111100018182581d60'
+                  '2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a2a1a000f4240021a00029810a10081825820'
+                  '3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b3b5840'
+                  '9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e'
+                  '9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9e9ef5f6')
+SIGNED_TX_ID = '7a20baf48bb7a29fd0b793577a240250da5acad4118c06e658af8716b673c7d4'
+
+def make_utxo_outputs(count: int):
+    """
+    The same wallet as cardano-cli query utxo table and --out-file JSON output.
+    """
+
+    table = ['                           TxHash                                 TxIx        Amount',
+             '--------------------------------------------------------------------------------------']
+    utxos = {}
+    for i in range(0, count):
+        tx_hash = '{:064x}'.format(i)
+        name = 'TCR{:04d}'.format(i)
+        if i % 2 == 0:
+            table.append('{}     {}        {} lovelace + TxOutDatumNone'.format(tx_hash, i % 3, 2000000 + i))
+            value = {'lovelace': 2000000 + i}
+        else:
+            table.append('{}     {}        {} lovelace + 1 {}.{} + TxOutDatumNone'.format(tx_hash, i % 3, 2000000 + i, POLICY_ID, name))
+            value = {'lovelace': 2000000 + i, POLICY_ID: {name.encode('utf-8').hex(): 1}}
+        utxos['{}#{}'.format(tx_hash, i % 3)] = {'address': 'addr_test1vqmint', 'value': value}
+
+    return ('\n'.join(table), json.dumps(utxos))
+
+class TestQueryUtxos(unittest.TestCase):
+    def test_parse_utxo_json(self):
+        output = json.dumps({
+            'aa{}#0'.format('0' * 62): {
+                'address': 'addr_test1vqroot',
+                'value': {'lovelace': 10000000}
+            },
+            'bb{}#1'.format('0' * 62): {
+                'address': 'addr_test1vqmint',
+                'value': {'lovelace': 2000000,
+                          POLICY_ID: {'54435230303031': 1, '': 5}},
+                'datumhash': None
+            }
+        })
+
+        utxos = Cardano.parse_utxo_json(output)
+        self.assertEqual(2, len(utxos))
+        self.assertEqual('aa{}'.format('0' * 62), utxos[0].tx_hash)
+        self.assertEqual(0, utxos[0].tx_ix)
+        self.assertEqual(10000000, utxos[0].amount)
+        self.assertEqual({}, utxos[0].assets)
+        self.assertEqual('addr_test1vqroot', utxos[0].address)
+        self.assertEqual(None, utxos[0].datum_hash)
+
+        self.assertEqual(1, utxos[1].tx_ix)
+        self.assertEqual({(POLICY_ID, 'TCR0001'): 1, (POLICY_ID, ''): 5}, utxos[1].assets)
+        self.assertEqual('addr_test1vqmint', utxos[1].address)
+
+    def test_legacy_keys(self):
+        utxo = Utxo('aa' * 32, 1, 2000000, {(POLICY_ID, 'TCR0001'): 1, (POLICY_ID, ''): 5})
+        self.assertEqual('aa' * 32, utxo['tx-hash'])
+        self.assertEqual(1, utxo['tx-ix'])
+        self.assertEqual(2000000, utxo['amount'])
+        self.assertEqual({'{}.TCR0001'.format(POLICY_ID): 1, POLICY_ID: 5}, utxo['assets'])
+        self.assertEqual('TxOutDatumNone', utxo['tx-out-datum-hash'])
+        self.assertFalse('time' in utxo)
+
+        utxo['time'] = 100
+        utxo['from'] = 'addr_test1vqbuyer'
+        self.assertTrue('time' in utxo)
+        self.assertEqual(100, utxo.time)
+        self.assertEqual('addr_test1vqbuyer', utxo['from'])
+        self.assertRaises(KeyError, lambda: utxo['from_stake'])
+        self.assertTrue(Utxo('aa' * 32, 1, 0) in [utxo])
+
+    def test_parse_utxo_table(self):
+        (table, output) = make_utxo_outputs(1500)
+        from_table = Cardano.parse_utxo_table(table)
+        from_json = Cardano.parse_utxo_json(output)
+        self.assertEqual(1500, len(from_json))
+        self.assertEqual(from_table, from_json)
+        for (a, b) in zip(from_table, from_json):
+            self.assertEqual(a.amount, b.amount)
+            self.assertEqual(a.assets, b.assets)
+
+    def test_parse_asset_name(self):
+        self.assertEqual('TCR0001', Cardano.parse_asset_name('54435230303031'))
+        self.assertEqual('', Cardano.parse_asset_name(''))
+        self.assertEqual('ff00', Cardano.parse_asset_name('ff00'))
+
+        # plain names in the table are not mistaken for hex
+        table = ['                           TxHash                                 TxIx        Amount',
+                 '--------------------------------------------------------------------------------------',
+                 '{}     0        2000000 lovelace + 1 {}.4142 + 1 {}.TCR0001 + TxOutDatumNone'.format('aa' * 32, POLICY_ID, POLICY_ID)]
+        utxo = Cardano.parse_utxo_table('\n'.join(table))[0]
+        self.assertEqual({(POLICY_ID, '4142'): 1, (POLICY_ID, 'TCR0001'): 1}, utxo.assets)
+
+class FakeTimeDatabase:
+    """
+    Only knows about a transaction after it has been asked for it once.
+    """
+
+    def __init__(self, times):
+        self.times = times
+        self.seen = set()
+        self.calls = []
+
+    def query_txhash_times(self, txhashes):
+        txhashes = set(txhashes)
+        self.calls.append(txhashes)
+        found = {txhash: self.times[txhash] for txhash in txhashes if txhash in self.seen and txhash in self.times}
+        self.seen.update(txhashes)
+        return (found, txhashes - found.keys())
+
+class TestQueryUtxosTime(unittest.TestCase):
+    def test_query_utxos_time(self):
+        times = {'aa' * 32: (1000, 10), 'bb' * 32: (2000, 20)}
+        database = FakeTimeDatabase(times)
+        utxos = [Utxo('bb' * 32, 0, 1), Utxo('aa' * 32, 0, 1), Utxo('aa' * 32, 1, 1), Utxo('cc' * 32, 0, 1)]
+
+        cardano = Cardano('testnet', 'testnet_protocol_parameters.json')
+        with mock.patch('time.sleep') as sleep:
+            self.assertEqual([], cardano.query_utxos_time(database, utxos))
+
+            # one query for all the hashes, no waiting for db-sync
+            self.assertEqual([set(['aa' * 32, 'bb' * 32, 'cc' * 32])], database.calls)
+
+            # the next pass picks up what db-sync has seen since
+            found = cardano.query_utxos_time(database, utxos)
+            self.assertEqual(0, sleep.call_count)
+
+        self.assertEqual(2, len(database.calls))
+        self.assertEqual(utxos[:3], found)
+        self.assertEqual([20, 10, 10], [utxo.slot_no for utxo in found])
+        self.assertEqual([2000, 1000, 1000], [utxo.time for utxo in found])
+
+class TestTransactionId(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write_envelope(self, name, type, cbor_hex):
+        filename = os.path.join(self.tempdir.name, name)
+        with open(filename, 'w') as file:
+            file.write(json.dumps({'type': type, 'description': '', 'cborHex': cbor_hex}))
+        return filename
+
+    def test_signed(self):
+        tx_file = self.write_envelope('tx.signed', 'Tx AlonzoEra', SIGNED_TX_CBOR)
+        self.assertEqual(SIGNED_TX_ID, Cardano.calculate_transaction_id(tx_file))
+        self.assertEqual(SIGNED_TX_ID, Cardano.transaction_id_inprocess(['cardano-cli', 'transaction', 'txid', '--tx-file', tx_file]))
+
+        # answered in-process, no cardano-cli needed
+        with mock.patch('subprocess.run') as run:
+            self.assertEqual(SIGNED_TX_ID, Command.run(['cardano-cli', 'transaction', 'txid', '--tx-file', tx_file], None))
+            self.assertEqual(0, run.call_count)
+
+    def test_fallback(self):
+        body_file = self.write_envelope('tx.raw', 'TxBodyAlonzo', SIGNED_TX_CBOR)
+        self.assertEqual(None, Cardano.calculate_transaction_id(body_file))
+        self.assertEqual(None, Cardano.transaction_id_inprocess(['cardano-cli', 'transaction', 'txid', '--tx-body-file', body_file]))
+
+        # unreadable, cardano-cli reports the error
+        missing_file = os.path.join(self.tempdir.name, 'missing.signed')
+        self.assertEqual(None, Cardano.transaction_id_inprocess(['cardano-cli', 'transaction', 'txid', '--tx-file', missing_file]))
@@ -0,0 +1,76 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_cid.py
+Author: SuperKK
+"""
+
+import os
+import tempfile
+import unittest
+
+import tcr.cid
+from tcr.cid import CidBuilder
+
+class TestCid(unittest.TestCase):
+    def test_known_cids(self):
+        # CIDs given by 'ipfs add' and 'ipfs add --cid-version=1'
+        self.assertEqual('QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH', tcr.cid.calc_cid(b''))
+        self.assertEqual('QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o', tcr.cid.calc_cid(b'hello world\n'))
+        self.assertEqual('bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku', tcr.cid.calc_cid(b'', 1))
+        self.assertEqual('bafkreifjjcie6lypi6ny7amxnfftagclbuxndqonfipmb64f2km2devei4', tcr.cid.calc_cid(b'hello world\n', 1))
+
+    def test_chunks(self):
+        size = tcr.cid.CHUNK_SIZE * 2 + 100
+        data = (bytes(range(0, 251)) * (size // 251 + 1))[:size]
+
+        # the result does not depend on how the content is fed
+        builder = CidBuilder()
+        for start in range(0, len(data), 100000):
+            builder.update(data[start:start + 100000])
+        self.assertEqual(tcr.cid.calc_cid(data), builder.hexdigest())
+
+        # more than one chunk is a dag-pb root, even for CIDv1
+        self.assertTrue(tcr.cid.calc_cid(data, 1).startswith('bafybei'))
+        self.assertTrue(tcr.cid.calc_cid(data[:tcr.cid.CHUNK_SIZE], 1).startswith('bafkrei'))
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, 'image.png')
+            with open(filename, 'wb') as file:
+                file.write(data)
+            self.assertEqual(tcr.cid.calc_cid(data), tcr.cid.calc_file_cid(filename))
+            self.assertEqual(tcr.cid.calc_cid(data, 1), tcr.cid.calc_file_cid(filename, 1))
+
+    def test_levels(self):
+        # a full root then a second level once there are more than MAX_LINKS chunks
+        builder = CidBuilder()
+        for i in range(0, tcr.cid.MAX_LINKS + 1):
+            builder.add_leaf(bytes([i]))
+        root = builder.digest()
+        self.assertEqual(2 + 32, len(root))
+
+        builder = CidBuilder()
+        for i in range(0, tcr.cid.MAX_LINKS):
+            builder.add_leaf(bytes([i]))
+        self.assertNotEqual(root, builder.digest())
@@ -0,0 +1,116 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_command.py
+Author: SuperKK
+"""
+
+import subprocess
+import threading
+import time
+import unittest
+from unittest import mock
+
+from tcr.command import Command
+import tcr.command
+
+class FakeProcesses:
+    """
+    Stands in for subprocess.run and counts the processes running at once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def run(self, command, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return subprocess.CompletedProcess(command, 0, stdout=' '.join(command) + '\n')
+
+class TestCommand(unittest.TestCase):
+    def setUp(self):
+        self.processes = FakeProcesses()
+        patcher = mock.patch('subprocess.run', self.processes.run)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Command.reset_timings()
+
+    def tearDown(self):
+        Command.set_max_workers(tcr.command.DEFAULT_MAX_WORKERS)
+        Command.inprocess_handlers.pop('echo in process', None)
+        Command.reset_timings()
+
+    def test_run_many(self):
+        Command.set_max_workers(2)
+        commands = [['echo', '{}'.format(i)] for i in range(0, 8)]
+        self.assertEqual(['echo {}'.format(i) for i in range(0, 8)], Command.run_many(commands, None))
+        self.assertEqual(2, self.processes.max_running)
+        self.assertEqual(8, sum([timing['count'] for timing in Command.get_timings().values()]))
+
+        # the bound holds for commands submitted from several threads
+        futures = [Command.submit(['echo', 'submit'], None) for i in range(0, 6)]
+        threads = [threading.Thread(target=Command.run_generic, args=(['echo', 'generic'],)) for i in range(0, 4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['echo submit'] * 6, [future.result() for future in futures])
+        self.assertEqual(2, self.processes.max_running)
+        self.assertRaises(Exception, Command.set_max_workers, 0)
+
+    def test_inprocess(self):
+        def handler(command):
+            return None if command[-1] == 'decline' else 'handled {}'.format(command[-1])
+        Command.register_inprocess('echo in process', handler)
+
+        self.assertEqual('handled 1', Command.run(['echo', 'in', 'process', '1'], None))
+        self.assertEqual(0, self.processes.max_running)
+
+        # declined, the command runs
+        self.assertEqual('echo in process decline', Command.run(['echo', 'in', 'process', 'decline'], None))
+        self.assertEqual(1, self.processes.max_running)
+
+        timings = Command.get_timings()
+        self.assertEqual(1, timings['echo in process (in-process)']['count'])
+        self.assertEqual(1, timings['echo in process']['count'])
+
+        Command.use_inprocess = False
+        try:
+            self.assertEqual('echo in process 2', Command.run(['echo', 'in', 'process', '2'], None))
+        finally:
+            Command.use_inprocess = True
+
+    def test_record_timing(self):
+        Command.record_timing('cardano-cli query tip', 0.5)
+        Command.record_timing('cardano-cli query tip', 0.25)
+        self.assertEqual({'cardano-cli query tip': {'count': 2, 'total': 0.75, 'max': 0.5}}, Command.get_timings())
+
+        Command.reset_timings()
+        self.assertEqual({}, Command.get_timings())
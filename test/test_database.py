@@ -0,0 +1,213 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_database.py
+Author: SuperKK
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import psycopg2
+
+import tcr.database
+from tcr.database import Database
+from tcr.pipeline import MintPipeline
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append((sql, params))
+        if self.connection.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.rows = self.connection.rows.get(sql.split(' ')[1], [])
+
+    def fetchone(self):
+        return self.rows[0] if len(self.rows) > 0 else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+        self.autocommit = False
+        self.broken = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+class FakePool:
+    def __init__(self, minconn, maxconn, **params):
+        self.available = []
+        self.connections = []
+        self.lock = threading.Lock()
+        self.closed = []
+
+    def getconn(self):
+        with self.lock:
+            if len(self.available) > 0:
+                return self.available.pop()
+            connection = FakeConnection(self.rows)
+            self.connections.append(connection)
+            return connection
+
+    def putconn(self, connection, close=False):
+        with self.lock:
+            if close:
+                self.closed.append(connection)
+            else:
+                self.available.append(connection)
+
+    def closeall(self):
+        pass
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.config_file = os.path.join(self.tempdir.name, 'testnet.ini')
+        with open(self.config_file, 'w') as file:
+            file.write('[postgresql]\nhost=localhost\ndatabase=cexplorer\nuser=tcr\n')
+
+        FakePool.rows = {'tcr_txhash_time': [('2022-01-01 00:00:00', 1234)],
+                         'tcr_utxo_inputs': [('addr_test1', 5000000), ('addr_test2', None)],
+                         'tcr_utxo_inputs_by_txids': [(b'\xab' * 32, 'addr_test1', 5000000),
+                                                      (b'\xab' * 32, 'addr_test2', 1000000),
+                                                      (b'\xcd' * 32, 'addr_test3', None)],
+                         'tcr_stake_addresses': [('addr_test1', 'stake_test1')],
+                         'tcr_owners_by_fingerprints': [('asset1', 'stake_test1')]}
+        patcher = mock.patch('psycopg2.pool.ThreadedConnectionPool', FakePool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.database = Database(self.config_file, max_connections=2)
+        self.database.open()
+
+    def tearDown(self):
+        self.database.close()
+        self.tempdir.cleanup()
+
+    def test_prepared(self):
+        self.assertEqual(('2022-01-01 00:00:00', 1234), self.database.query_txhash_time('ab' * 32))
+        self.assertEqual([{'address': 'addr_test1', 'value': 5000000}, {'address': 'addr_test2', 'value': 0}],
+                         self.database.query_utxo_inputs('cd' * 32))
+        self.assertEqual(None, self.database.query_stake_address('addr_test1'))
+
+        connection = self.database.pool.connections[0]
+        self.assertTrue(connection.autocommit)
+        prepares = [sql for (sql, params) in connection.statements if sql.startswith('prepare ')]
+        self.assertEqual(len(tcr.database.PREPARED_STATEMENTS), len(prepares))
+        self.assertTrue(('execute tcr_txhash_time (%s);', (bytes.fromhex('ab' * 32),)) in connection.statements)
+
+        timings = self.database.get_timings()
+        self.assertEqual(1, timings['query_txhash_time']['count'])
+        self.assertEqual(1, timings['query_stake_address']['count'])
+
+    def test_bulk(self):
+        inputs = self.database.query_utxo_inputs_by_txids(['ab' * 32, 'cd' * 32, 'ef' * 32, 'ab' * 32])
+        self.assertEqual({'ab' * 32: [{'address': 'addr_test1', 'value': 5000000}, {'address': 'addr_test2', 'value': 1000000}],
+                          'cd' * 32: [{'address': 'addr_test3', 'value': 0}],
+                          'ef' * 32: []}, inputs)
+
+        self.assertEqual({'addr_test1': 'stake_test1', 'addr_test2': None},
+                         self.database.query_stake_addresses(['addr_test1', 'addr_test2']))
+        self.assertEqual({'asset1': 'stake_test1', 'asset2': ''},
+                         self.database.query_owners_by_fingerprints(['asset1', 'asset2']))
+
+        # one statement for each lookup
+        connection = self.database.pool.connections[0]
+        executes = [sql for (sql, params) in connection.statements if sql.startswith('execute ')]
+        self.assertEqual(3, len(executes))
+        self.assertEqual({'ab' * 32, 'cd' * 32, 'ef' * 32}, set([txid.hex() for txid in connection.statements[-3][1][0]]))
+        self.assertEqual({}, self.database.query_utxo_inputs_by_txids([]))
+
+    def test_minted_token_names(self):
+        rows = FakePool.rows
+        rows['max(id)'] = [(10,)]
+        rows['hash'] = [(b'\x10',)]
+        rows['tcr_mint_names_after'] = [(b'TCR1',), (b'TCR2',)]
+        connection = self.database.pool.connections[0]
+
+        def mint_queries():
+            return [params for (sql, params) in connection.statements if sql.startswith('execute tcr_mint_names_after')]
+
+        policy_id = 'ab' * 28
+        self.assertEqual({'TCR1', 'TCR2'}, self.database.query_minted_token_names(policy_id))
+        self.assertEqual([(bytes.fromhex(policy_id), 0, 10)], mint_queries())
+
+        # no new block, nothing to read
+        self.database.add_minted_token_names(policy_id, ['TCR3'])
+        self.assertEqual({'TCR1', 'TCR2', 'TCR3'}, self.database.query_minted_token_names(policy_id))
+        self.assertEqual(1, len(mint_queries()))
+
+        # only the new blocks are read
+        rows['max(id)'] = [(12,)]
+        rows['tcr_mint_names_after'] = [(b'TCR4',)]
+        self.assertEqual({'TCR1', 'TCR2', 'TCR3', 'TCR4'}, self.database.query_minted_token_names(policy_id))
+        self.assertEqual((bytes.fromhex(policy_id), 10, 12), mint_queries()[-1])
+
+        # block 12 rolled back, read everything again
+        rows['max(id)'] = [(13,)]
+        rows['hash'] = [(b'\x13',)]
+        self.database.query_minted_token_names(policy_id)
+        self.assertEqual((bytes.fromhex(policy_id), 0, 13), mint_queries()[-1])
+
+    def test_latest_slot(self):
+        FakePool.rows['slot_no'] = [(52000123,)]
+        slot = self.database.query_latest_slot()
+        self.assertEqual(52000123, slot)
+
+        # the mint TTL is counted from the latest slot
+        pipeline = MintPipeline('testnet', 'drop', timeout=600)
+        self.assertEqual(52000723, pipeline.get_invalid_hereafter(slot, 60000000))
+        self.assertEqual(52000500, pipeline.get_invalid_hereafter(slot, 52000500))
+
+    def test_threads(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(self.database.query_txhash_time, ['ab' * 32] * 100))
+
+        self.assertEqual(100, self.database.get_timings()['query_txhash_time']['count'])
+        for connection in self.database.pool.connections:
+            prepares = [sql for (sql, params) in connection.statements if sql.startswith('prepare ')]
+            self.assertEqual(len(tcr.database.PREPARED_STATEMENTS), len(prepares))
+
+    def test_broken_connection(self):
+        connection = self.database.pool.connections[0]
+        connection.broken = True
+        self.assertRaises(psycopg2.OperationalError, self.database.query_txhash_time, 'ab' * 32)
+        self.assertEqual([connection], self.database.pool.closed)
+
+        self.assertEqual(('2022-01-01 00:00:00', 1234), self.database.query_txhash_time('ab' * 32))
+        self.assertEqual(2, len(self.database.pool.connections))
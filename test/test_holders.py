@@ -0,0 +1,100 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_holders.py
+Author: SuperKK
+"""
+
+import os
+import tempfile
+import unittest
+
+from tcr.holders import HolderIndex
+
+class FakeHolderDatabase:
+    """
+    db-sync with outputs per block.  blocks is a list of (block hash,
+    [(policy, token name, stake address, slot), ...]), block ids start at 1.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.queries = []
+
+    def query_latest_block_id(self) -> int:
+        return len(self.blocks)
+
+    def query_block_hash(self, block_id: int) -> str:
+        if block_id < 1 or block_id > len(self.blocks):
+            return None
+        return self.blocks[block_id - 1][0]
+
+    def query_policy_outputs(self, policy_id: str, after_block_id: int, to_block_id: int) -> list:
+        self.queries.append((after_block_id, to_block_id))
+        outputs = []
+        for (hash, block_outputs) in self.blocks[after_block_id:to_block_id]:
+            outputs.extend([(name, address, slot) for (policy, name, address, slot) in block_outputs if policy == policy_id])
+        return outputs
+
+class TestHolderIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tempdir.name, 'testnet_holders.sqlite')
+        self.database = FakeHolderDatabase()
+        self.database.blocks = [('h1', [('p1', 'TCR1', 'stake_a', 10), ('p1', 'TCR2', 'stake_a', 10), ('p2', 'X', 'stake_c', 10)]),
+                                ('h2', [('p1', 'TCR1', 'stake_b', 20)])]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_refresh(self):
+        index = HolderIndex('testnet', self.filename)
+        self.assertEqual(3, index.refresh(self.database, 'p1'))
+        self.assertEqual({'TCR1': {'address': 'stake_b', 'slot': 20},
+                          'TCR2': {'address': 'stake_a', 'slot': 10}}, index.get_holders('p1'))
+        self.assertEqual(0, index.refresh(self.database, 'p1'))
+        index.close()
+
+        # only the new block is read after reopening
+        self.database.blocks.append(('h3', [('p1', 'TCR2', 'stake_c', 30), ('p1', 'TCR3', 'stake_c', 30)]))
+        index = HolderIndex('testnet', self.filename)
+        self.assertEqual(2, index.refresh(self.database, 'p1'))
+        self.assertEqual((2, 3), self.database.queries[-1])
+        self.assertEqual({'TCR1': {'address': 'stake_b', 'slot': 20},
+                          'TCR2': {'address': 'stake_c', 'slot': 30},
+                          'TCR3': {'address': 'stake_c', 'slot': 30}}, index.get_holders('p1'))
+        self.assertEqual({}, index.get_holders('p2'))
+        index.close()
+
+    def test_rollback(self):
+        index = HolderIndex('testnet', self.filename)
+        index.refresh(self.database, 'p1')
+
+        # block 2 is replaced by a different block
+        self.database.blocks[1] = ('h2b', [('p1', 'TCR2', 'stake_d', 21)])
+        index.refresh(self.database, 'p1')
+        self.assertEqual((0, 2), self.database.queries[-1])
+        self.assertEqual({'TCR1': {'address': 'stake_a', 'slot': 10},
+                          'TCR2': {'address': 'stake_d', 'slot': 21}}, index.get_holders('p1'))
+        index.close()
@@ -0,0 +1,182 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_ipfs.py
+Author: SuperKK
+"""
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import os
+import tempfile
+import threading
+import unittest
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+import tcr.cid
+from tcr.uploader import UploadManifest
+from tcr.uploader import Uploader
+
+class IpfsHandler(BaseHTTPRequestHandler):
+    """
+    Stand in for the IPFS add and pin/ls API.
+    """
+
+    def do_POST(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        body = self.rfile.read(int(self.headers['Content-Length']))
+
+        with server.lock:
+            server.requests.append(url.path)
+            fail = server.failures > 0
+            if fail:
+                server.failures -= 1
+
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if url.path == '/api/v0/pin/ls':
+            with server.lock:
+                keys = {cid: {'Type': 'recursive'} for cid in server.uploads}
+            self.send_json({'Keys': keys})
+            return
+
+        if url.path != '/api/v0/add' or params.get('pin') != ['true']:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        boundary = self.headers['Content-Type'].split('boundary=')[1].encode()
+        part = body.split(b'--' + boundary)[1]
+        content = part.split(b'\r\n\r\n', 1)[1][:-2]
+        cid = tcr.cid.calc_cid(content)
+        with server.lock:
+            server.uploads[cid] = content
+
+        self.send_json({'Name': 'file', 'Hash': cid, 'Size': str(len(content))})
+
+    def send_json(self, value):
+        response = json.dumps(value).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestUploader(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), IpfsHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.uploads = {}
+        self.server.failures = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.api_url = 'http://127.0.0.1:{}/api/v0'.format(self.server.server_address[1])
+
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(0, 20):
+            filename = os.path.join(self.tempdir.name, '{:05}.png'.format(i))
+            with open(filename, 'wb') as file:
+                file.write('image {}'.format(i).encode() * 1000)
+            self.files.append(filename)
+        self.manifest_file = os.path.join(self.tempdir.name, 'ipfs_manifest.journal')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tempdir.cleanup()
+
+    def create_uploader(self) -> Uploader:
+        return Uploader('id', 'secret', UploadManifest(self.manifest_file),
+                        api_url=self.api_url, max_workers=4, backoff=0)
+
+    def test_upload_all(self):
+        uploader = self.create_uploader()
+        cids = uploader.upload_all(self.files + self.files[:5])
+        uploader.close()
+
+        self.assertEqual(20, len(cids))
+        self.assertEqual(20, len(self.server.requests))
+        for filename in self.files:
+            with open(filename, 'rb') as file:
+                self.assertEqual(file.read(), self.server.uploads[cids[filename]])
+
+        # Nothing is uploaded again, except a file that changed
+        with open(self.files[3], 'ab') as file:
+            file.write(b'changed')
+        uploader = self.create_uploader()
+        self.assertEqual(cids[self.files[0]], uploader.upload_all(self.files)[self.files[0]])
+        uploader.close()
+        self.assertEqual(21, len(self.server.requests))
+
+    def test_check_pins(self):
+        uploader = Uploader('id', 'secret', api_url=self.api_url, backoff=0)
+        cids = uploader.upload_all(self.files[:5])
+        self.assertEqual(5, len(self.server.requests))
+        for filename in self.files[:5]:
+            self.assertEqual(tcr.cid.calc_file_cid(filename), cids[filename])
+
+        # Without a manifest the pinned files are found by their local CIDs
+        self.assertEqual(cids, uploader.upload_all(self.files[:5], check_pins=True))
+        self.assertEqual(5 + 1, len(self.server.requests))
+        uploader.close()
+
+    def test_retry(self):
+        self.server.failures = 3
+        uploader = self.create_uploader()
+        cids = uploader.upload_all(self.files[:2])
+        uploader.close()
+        self.assertEqual(2, len(cids))
+        self.assertEqual(5, len(self.server.requests))
+
+        self.server.failures = 10
+        uploader = Uploader('id', 'secret', api_url=self.api_url, retries=2, backoff=0)
+        self.assertRaises(Exception, uploader.upload, self.files[5])
+        uploader.close()
+        self.assertEqual(5 + 3, len(self.server.requests))
+
+    def test_manifest_incomplete_record(self):
+        uploader = self.create_uploader()
+        uploader.upload_all(self.files[:3])
+        uploader.close()
+
+        with open(self.manifest_file, 'a') as file:
+            file.write('{"path": "x", "sha')
+
+        manifest = UploadManifest(self.manifest_file)
+        self.assertEqual(3, len(manifest.entries))
+        manifest.add(self.files[4], 'abc', 'Qmabc')
+        manifest.close()
+        self.assertEqual(4, len(UploadManifest(self.manifest_file).entries))
@@ -0,0 +1,119 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_ipfs_check.py
+Author: SuperKK
+"""
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import tcr.cid
+import tcr.ipfs_check
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """
+    Stand in for an IPFS gateway serving /ipfs/<cid>
+    """
+
+    def do_GET(self):
+        content = self.server.content.get(self.path[len('/ipfs/'):])
+        if content == None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestIpfsCheck(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), GatewayHandler)
+        self.server.content = {}
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.gateway = 'http://127.0.0.1:{}/ipfs/'.format(self.server.server_address[1])
+
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.items = []
+        for i in range(0, 10):
+            image = 'image {}'.format(i).encode() * 10000
+            cid = tcr.cid.calc_cid(image)
+            self.server.content[cid] = image
+
+            image_file = os.path.join(self.tempdir.name, '{:05}.png'.format(i))
+            with open(image_file, 'wb') as file:
+                file.write(image)
+            metadata_file = os.path.join(self.tempdir.name, '{:05}.json'.format(i))
+            with open(metadata_file, 'w') as file:
+                file.write(json.dumps({'721': {'policy': {'token': {'image': 'ipfs://{}'.format(cid)}}}}))
+            self.items.append((metadata_file, image_file))
+        self.cache_file = os.path.join(self.tempdir.name, tcr.ipfs_check.CACHE_FILE)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tempdir.cleanup()
+
+    def test_verify(self):
+        report = tcr.ipfs_check.verify(self.items, self.gateway, 4, cache_file=self.cache_file, hash_workers=1)
+        self.assertEqual(10, report['checked'])
+        self.assertEqual([], report['mismatches'])
+        self.assertTrue('download-seconds-max' in report['timings'])
+
+        # a different image on the gateway and one missing
+        cids = list(self.server.content.keys())
+        self.server.content[cids[2]] = b'different'
+        del self.server.content[cids[5]]
+        with mock.patch('time.sleep'):
+            report = tcr.ipfs_check.verify(self.items, self.gateway, 4, cache_file=self.cache_file, hash_workers=1)
+        self.assertEqual([self.items[2][0], self.items[5][0]], [mismatch['metadata'] for mismatch in report['mismatches']])
+        self.assertTrue('error' in report['mismatches'][1])
+
+    def test_offline(self):
+        report = tcr.ipfs_check.verify(self.items, offline=True, cache_file=self.cache_file, hash_workers=1)
+        self.assertEqual([], report['mismatches'])
+
+        with open(self.items[3][1], 'ab') as file:
+            file.write(b'x')
+        report = tcr.ipfs_check.verify(self.items, offline=True, cache_file=self.cache_file, hash_workers=1)
+        self.assertEqual([self.items[3][1]], [mismatch['image'] for mismatch in report['mismatches']])
+
+    def test_cache(self):
+        tcr.ipfs_check.get_local_hashes([image for (metadata, image) in self.items], self.cache_file, 2)
+        with mock.patch('tcr.ipfs_check.hash_file', side_effect=tcr.ipfs_check.hash_file) as hash_file:
+            hashes = tcr.ipfs_check.get_local_hashes([image for (metadata, image) in self.items], self.cache_file, 1)
+            self.assertEqual(0, hash_file.call_count)
+        self.assertEqual(tcr.cid.calc_file_cid(self.items[0][1]), hashes[self.items[0][1]]['cid'])
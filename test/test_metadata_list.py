@@ -51,6 +51,8 @@ class TestMetadataList(unittest.TestCase):
 
     def tearDown(self):
         os.remove(self.filename)
+        if os.path.exists('{}.cursor'.format(self.filename)):
+            os.remove('{}.cursor'.format(self.filename))
 
     def test_peek_two_commit(self):
         self.assertEqual('file0000.json', self.metadata_list.peek_next_file())
@@ -89,3 +91,51 @@ class TestMetadataList(unittest.TestCase):
             self.metadata_list.commit()
             self.assertEqual('file{:04}.json'.format(i), fname)
             self.metadata_list = MetadataList(self.filename)
+
+    def test_cursor_mismatch(self):
+        self.metadata_list.peek_next_file()
+        self.metadata_list.commit()
+
+        with open(self.filename, 'w') as file:
+            file.write(json.dumps({'files': ['other0000.json', 'other0001.json']}, indent=4))
+
+        self.assertRaises(Exception, MetadataList, self.filename)
+
+    def test_return_files(self):
+        for i in range(0, 4):
+            self.metadata_list.peek_next_file()
+        self.metadata_list.commit()
+        self.metadata_list.return_files(['file0001.json', 'file0002.json'])
+        self.assertEqual(self.count - 2, self.metadata_list.get_remaining())
+
+        # returned files come first and survive a reopen
+        list2 = MetadataList(self.filename)
+        self.assertEqual(self.count - 2, list2.get_remaining())
+        self.assertEqual('file0001.json', list2.peek_next_file())
+        self.assertEqual('file0002.json', list2.peek_next_file())
+        self.assertEqual('file0004.json', list2.peek_next_file())
+        list2.revert()
+
+        self.assertEqual('file0001.json', list2.peek_next_file())
+        list2.commit()
+        self.assertEqual('file0002.json', list2.peek_next_file())
+        self.assertRaises(Exception, list2.return_files, ['file0001.json'])
+        self.assertEqual('file0004.json', list2.peek_next_file())
+        list2.commit()
+
+        list3 = MetadataList(self.filename)
+        self.assertEqual(self.count - 5, list3.get_remaining())
+        self.assertEqual('file0005.json', list3.peek_next_file())
+
+    def test_get_next_files(self):
+        self.metadata_list.peek_next_file()
+        self.metadata_list.peek_next_file()
+        self.metadata_list.commit()
+        self.metadata_list.return_files(['file0000.json'])
+        self.metadata_list.peek_next_file()
+
+        self.assertEqual(['file0002.json', 'file0003.json'], self.metadata_list.get_next_files(2))
+        self.assertEqual('file0002.json', self.metadata_list.peek_next_file())
+        self.metadata_list.revert()
+        self.assertEqual(['file0000.json', 'file0002.json'], self.metadata_list.get_next_files(2))
+        self.assertEqual(self.count - 1, len(self.metadata_list.get_next_files(self.count)))
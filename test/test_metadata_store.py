@@ -0,0 +1,113 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_metadata_store.py
+Author: SuperKK
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tcr.metadata_store import MetadataStore
+import tcr.metadata_store
+from tcr.nft import Nft
+
+class TestMetadataStore(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+
+        self.policy_id = 'a1b2c3d4' * 7
+        self.files = []
+        for i in range(0, 5):
+            filename = 'nft{}.json'.format(i)
+            with open(filename, 'w') as file:
+                file.write(json.dumps({'721': {self.policy_id: {'NFT{}'.format(i): {'name': 'NFT {}'.format(i)}}}}))
+            self.files.append(filename)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def test_merge(self):
+        store = MetadataStore(self.files[:4])
+        expected = Nft.merge_metadata(self.policy_id, self.files[1:4])
+
+        # the files are not read again
+        for filename in self.files[:4]:
+            os.remove(filename)
+        self.assertEqual(expected, store.merge(self.policy_id, self.files[1:4]))
+        self.assertEqual(['NFT1', 'NFT2', 'NFT3'], Nft.parse_metadata(expected)['token-names'])
+
+        # files not loaded up front are read when needed
+        self.assertEqual(('NFT4', {'name': 'NFT 4'}), store.get_token('nft4.json'))
+
+    def test_pack(self):
+        with open('drop.json', 'w') as file:
+            file.write(json.dumps({'files': self.files[:4]}))
+
+        pack = tcr.metadata_store.open_pack('drop.json', self.files[:4])
+        self.assertEqual(4, len(pack))
+        for filename in self.files[:4]:
+            with open(filename, 'r') as file:
+                self.assertEqual(json.load(file), pack.get(filename))
+
+        store = MetadataStore(pack=pack)
+        expected = Nft.merge_metadata(self.policy_id, self.files[1:3])
+        for filename in self.files[:4]:
+            os.remove(filename)
+        self.assertEqual(expected, store.merge(self.policy_id, self.files[1:3]))
+
+        # parsed once, later reads do not go to the pack
+        with mock.patch.object(pack, 'get') as get:
+            self.assertEqual(expected, store.merge(self.policy_id, self.files[1:3]))
+            self.assertEqual(0, get.call_count)
+        pack.close()
+
+        # the pack is opened again without the metadata files
+        pack = tcr.metadata_store.open_pack('drop.json', self.files[:4])
+        self.assertEqual(('NFT3', {'name': 'NFT 3'}), MetadataStore(pack=pack).get_token('nft3.json'))
+        pack.close()
+
+        # a pack without every file is rebuilt
+        self.assertRaises(FileNotFoundError, tcr.metadata_store.open_pack, 'drop.json', self.files)
+
+    def test_pack_changed_file(self):
+        with open('drop.json', 'w') as file:
+            file.write(json.dumps({'files': self.files}))
+        tcr.metadata_store.open_pack('drop.json', self.files).close()
+
+        # edited after the pack was built, e.g. by hand
+        with open('nft2.json', 'w') as file:
+            file.write(json.dumps({'721': {self.policy_id: {'NFT2': {'name': 'Fixed'}}}}))
+        os.utime('nft2.json', ns=(10 ** 18, 10 ** 18))
+
+        pack = tcr.metadata_store.open_pack('drop.json', self.files)
+        self.assertEqual(('NFT2', {'name': 'Fixed'}), MetadataStore(pack=pack).get_token('nft2.json'))
+        self.assertTrue(pack.is_current(self.files))
+        pack.close()
@@ -0,0 +1,259 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_nft.py
+Author: SuperKK
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy
+from PIL import Image
+
+import tcr.compositor
+from tcr.compositor import Compositor
+from tcr.drop import DropContext
+from tcr.drop import DropProgress
+from tcr.nft import Nft
+
+def create_drop(network: str, drop_name: str, total: int) -> dict:
+    """
+    A small drop with two layer sets.  Each layer image is a solid square at
+    a different position so every combination is a different image.
+    """
+
+    drop_dir = 'nft/{}/{}'.format(network, drop_name)
+    os.makedirs(os.path.join(drop_dir, 'art'))
+
+    Image.new('RGBA', (40, 40), (0, 0, 0, 255)).save(os.path.join(drop_dir, 'art/bg.png'))
+    layer_sets = []
+    for s in range(0, 2):
+        images = []
+        for i in range(0, 4):
+            filename = 'art/set{}_item{}.png'.format(s, i)
+            im = Image.new('RGBA', (40, 40), (0, 0, 0, 0))
+            im.paste((255, 64 * s, 60 * i, 255), (i * 8, s * 20, i * 8 + 6, s * 20 + 6))
+            im.save(os.path.join(drop_dir, filename))
+            images.append({'properties': {'item': i}, 'weight': 25, 'offset-x': 0, 'offset-y': 0, 'image': filename})
+
+        hat = []
+        for i in range(0, 2):
+            filename = 'art/set{}_hat{}.png'.format(s, i)
+            im = Image.new('RGBA', (10, 10), (0, 0, 0, 0))
+            im.paste((0, 255, 0, 128), (0, 0, 5 + i * 5, 5))
+            im.save(os.path.join(drop_dir, filename))
+            hat.append({'properties': {'hat': i}, 'weight': 50, 'offset-x': 30, 'offset-y': -2, 'image': filename})
+
+        layer_set = {'name': 'set{}'.format(s),
+                     'layers': [{'name': 'Standard', 'width': 40, 'height': 40,
+                                 'images': [{'properties': {'id': 0}, 'weight': 100, 'image': None}]},
+                                {'name': 'Scene', 'width': 40, 'height': 40,
+                                 'images': [{'weight': 100, 'offset-x': 0, 'offset-y': 0, 'image': 'art/bg.png'}]},
+                                {'name': 'Item', 'width': 40, 'height': 40, 'images': images},
+                                {'name': 'Hat', 'width': 10, 'height': 10, 'images': hat}]}
+        with open(os.path.join(drop_dir, 'art/set{}.json'.format(s)), 'w') as file:
+            file.write(json.dumps(layer_set))
+        layer_sets.append({'file': 'art/set{}.json'.format(s), 'weight': 50})
+
+    metametadata = {'series': 2,
+                    'drop-name': drop_name,
+                    'init-nft-id': 1,
+                    'token-name': 'TCRx{:03}x{:04}x{}',
+                    'nft-name': 'Test {}.{} [{}/{}]',
+                    'total': total,
+                    'output-width': 20,
+                    'output-height': 30,
+                    'layer-sets': layer_sets,
+                    'self': os.path.join(drop_dir, '{}_metametadata.json'.format(drop_name))}
+    with open(metametadata['self'], 'w') as file:
+        file.write(json.dumps(metametadata))
+
+    return metametadata
+
+class TestCompositor(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def save(self, name: str, image: Image.Image) -> str:
+        path = os.path.join(self.tempdir.name, name)
+        image.save(path)
+        return path
+
+    def test_compose_image(self):
+        bg = self.save('bg.png', Image.new('RGBA', (20, 10), (255, 0, 0, 255)))
+        overlay = Image.new('RGBA', (10, 10), (0, 0, 0, 0))
+        overlay.paste((0, 0, 255, 255), (0, 0, 4, 4))
+        top = self.save('top.png', overlay)
+        empty = self.save('empty.png', Image.new('RGBA', (10, 10), (0, 0, 0, 0)))
+
+        image = tcr.compositor.compose_image([(bg, 0, 0), (empty, 0, 0), (top, -2, 8)])
+        self.assertEqual((20, 10), image.size)
+        self.assertEqual((0, 0, 255, 255), image.getpixel((0, 8)))
+        self.assertEqual((0, 0, 255, 255), image.getpixel((1, 9)))
+        self.assertEqual((255, 0, 0, 255), image.getpixel((2, 8)))
+        self.assertEqual((255, 0, 0, 255), image.getpixel((0, 7)))
+
+        image = tcr.compositor.compose_image([(bg, 0, 0), (top, 18, 0)], resize=(10, 10))
+        self.assertEqual((10, 5), image.size)
+
+    def test_compose_all(self):
+        bg = self.save('bg.png', Image.new('RGBA', (8, 8), (255, 0, 0, 255)))
+        jobs = []
+        for i in range(0, 8):
+            dot = Image.new('RGBA', (8, 8), (0, 0, 0, 0))
+            dot.putpixel((i, i), (0, 255, 0, 255))
+            jobs.append({'layers': [(bg, 0, 0), (self.save('dot{}.png'.format(i), dot), 0, 0)], 'resize': None})
+
+        serial = list(Compositor(max_workers=1).compose_all(jobs))
+        parallel = list(Compositor(max_workers=2).compose_all(jobs))
+        self.assertEqual(serial, parallel)
+        for (data, hash, dhash) in parallel:
+            self.assertEqual(hashlib.sha256(data).hexdigest(), hash)
+        self.assertEqual(8, len(set([hash for (data, hash, dhash) in parallel])))
+
+class TestDropContext(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def test_sample(self):
+        metametadata = create_drop('testnet', 'drop', 4)
+        context = DropContext(metametadata)
+        self.assertEqual([0, 8], context.code_offsets)
+
+        sample = context.sample(16, numpy.random.RandomState(3))
+        self.assertEqual(16, len(set([(s, tuple(choices)) for (s, choices) in sample])))
+        self.assertEqual(sample, context.sample(16, numpy.random.RandomState(3)))
+        self.assertNotEqual(sample, context.sample(16, numpy.random.RandomState(4)))
+        for (layer_set_index, choices) in sample:
+            self.assertEqual([0, 0], choices[0:2])
+            self.assertTrue(choices[2] < 4 and choices[3] < 2)
+
+        self.assertRaises(Exception, context.sample, 17, numpy.random.RandomState(3))
+
+        codes = context.encode(1, numpy.array([[0, 0, 3, 1], [0, 0, 2, 0]]))
+        self.assertEqual([15, 12], list(codes))
+        self.assertEqual([[0, 0, 3, 1], [0, 0, 2, 0]], context.decode(1, codes).tolist())
+
+    def test_image_size_cache(self):
+        metametadata = create_drop('testnet', 'drop', 4)
+        self.assertEqual(16, Nft.calculate_total_combinations(metametadata))
+
+        context = DropContext(metametadata)
+        self.assertEqual(13, len(context.image_sizes))
+        self.assertEqual((10, 10), context.get_image_size('art/set0_hat0.png'))
+        self.assertFalse(context.image_sizes_changed)
+
+        path = context.get_image_path('art/set0_hat0.png')
+        Image.new('RGBA', (12, 10), (0, 0, 0, 0)).save(path)
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000))
+        self.assertEqual((12, 10), context.get_image_size('art/set0_hat0.png'))
+        self.assertTrue(context.image_sizes_changed)
+
+class TestRandomDropSet(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def test_create_random_drop_set(self):
+        metametadata = create_drop('testnet', 'drop', 12)
+        fnames = Nft.create_random_drop_set('testnet', '00' * 28, metametadata, numpy.random.RandomState(1))
+        self.assertEqual(12, len(fnames))
+
+        images = set()
+        for (i, fname) in enumerate(fnames):
+            nftmd = Nft.parse_metadata_file(fname)
+            properties = nftmd['properties'][nftmd['token-names'][0]]
+            self.assertEqual(i + 1, properties['id'])
+            self.assertTrue(os.path.basename(properties['image']).startswith('{:05}_set'.format(i + 1)))
+            with Image.open(properties['image']) as im:
+                self.assertEqual((20, 20), im.size)
+            images.add(Nft.calc_sha256(properties['image']))
+
+        self.assertEqual(12, len(images))
+
+    def test_resume(self):
+        metametadata = create_drop('testnet', 'drop', 12)
+        compose_all = Compositor.compose_all
+        composed = []
+
+        def crash_after_five(compositor, jobs):
+            for (i, result) in enumerate(compose_all(compositor, jobs)):
+                if i == 5:
+                    raise Exception('crash')
+                yield result
+
+        def count_jobs(compositor, jobs):
+            composed.extend(jobs)
+            return compose_all(compositor, jobs)
+
+        with mock.patch.object(Compositor, 'compose_all', crash_after_five):
+            self.assertRaises(Exception, Nft.create_random_drop_set,
+                              'testnet', '00' * 28, metametadata, numpy.random.RandomState(1))
+
+        # a different seed is a different plan
+        self.assertRaises(Exception, Nft.create_random_drop_set,
+                          'testnet', '00' * 28, metametadata, numpy.random.RandomState(2))
+
+        # change one of the finished images, it has to be created again
+        with open(DropProgress('testnet', 'drop').plan_file, 'r') as file:
+            plan = json.load(file)
+        with open(plan[0]['file'], 'ab') as file:
+            file.write(b'x')
+
+        with mock.patch.object(Compositor, 'compose_all', count_jobs):
+            fnames = Nft.create_random_drop_set('testnet', '00' * 28, metametadata, numpy.random.RandomState(1))
+        self.assertEqual(12, len(fnames))
+        self.assertEqual(12 - 4, len(composed))
+
+        hashes = [Nft.calc_sha256(item['file']) for item in plan]
+        DropProgress('testnet', 'drop').remove()
+        Nft.create_random_drop_set('testnet', '00' * 28, metametadata, numpy.random.RandomState(1))
+        self.assertEqual(hashes, [Nft.calc_sha256(item['file']) for item in plan])
+
+
+    def test_near_duplicate(self):
+        # every 64 bit hash is within 64 bits of every other one
+        metametadata = create_drop('testnet', 'drop', 2)
+        metametadata['near-duplicate-distance'] = 64
+        self.assertRaises(Exception, Nft.create_random_drop_set,
+                          'testnet', '00' * 28, metametadata, numpy.random.RandomState(1))
@@ -0,0 +1,148 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_packer.py
+Author: SuperKK
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from tcr.cardano import Cardano
+from tcr.metadata_store import MetadataStore
+from tcr.packer import BatchPacker
+from tcr.sales import Sales
+from tcr.utxo import Utxo
+
+class FakeCardano(Cardano):
+    def __init__(self):
+        super().__init__('testnet', 'testnet_protocol_parameters.json')
+        self.protocol_parameters = {'txFeeFixed': 155381,
+                                    'txFeePerByte': 44,
+                                    'maxTxSize': 16384,
+                                    'minUTxOValue': None}
+
+    def get_policy_id(self, policy_name):
+        return 'a1b2c3d4' * 7
+
+    def get_policy_script(self, policy_name):
+        return {'type': 'all',
+                'scripts': [{'type': 'before', 'slot': 1000},
+                            {'type': 'sig', 'keyHash': 'ab' * 28}]}
+
+class TestBatchPacker(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+        os.makedirs('nft/testnet/drop')
+
+        # about 1KB of metadata per NFT, a transaction fits around 14
+        self.files = []
+        for i in range(0, 40):
+            filename = 'nft/testnet/drop/nft{:02}.json'.format(i)
+            properties = {'name': 'NFT {}'.format(i),
+                          'image': 'ipfs://Qm' + 'x' * 44,
+                          'description': ['{:02} {}'.format(i, 'd' * 60)] * 15}
+            with open(filename, 'w') as file:
+                file.write(json.dumps({'721': {'a1b2c3d4' * 7: {'NFT{:02}'.format(i): properties}}}))
+            self.files.append(filename)
+
+        self.address = 'addr_test1vz2fxv2umyhttkxyxp8x0dlpdt3k6cwng5pxj3jhsydzerspjrlsz'
+        self.packer = BatchPacker(FakeCardano(), 'policy', self.address, self.address, MetadataStore(self.files))
+        self.sales = Sales('testnet', 'drop')
+        self.prices = {1000000: 1, 10000000: 1, 30000000: 3, 100000000: 10}
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def get_utxos(self, amounts):
+        return [Utxo('{:064x}'.format(i), 0, amount) for (i, amount) in enumerate(amounts)]
+
+    def test_fill(self):
+        utxos = self.get_utxos([10000000] * 30)
+        (batch, refunds) = self.packer.pack(utxos, self.prices, self.files, self.sales, set())
+        count = len(batch)
+        self.assertTrue(count > 3)
+        self.assertEqual(utxos[:count], [item['utxo'] for item in batch])
+
+        # close to the limit, one more NFT does not fit
+        (size, fee, paid) = self.packer.estimate(batch, self.files)
+        self.assertTrue(size <= self.packer.get_max_size())
+        more = batch + [{'utxo': utxos[count], 'count': 1, 'refund': 0}]
+        self.assertTrue(self.packer.estimate(more, self.files)[0] > self.packer.get_max_size())
+
+        # the optional limit still applies
+        self.packer.max_per_tx = 2
+        self.assertEqual(2, len(self.packer.pack(utxos, self.prices, self.files, self.sales, set())[0]))
+
+    def test_older_first(self):
+        utxos = self.get_utxos([30000000] * 4 + [100000000, 10000000])
+        (batch, refunds) = self.packer.pack(utxos, self.prices, self.files, self.sales, set())
+
+        # the bundle of 10 does not fit after 12 NFTs, a later single fills the transaction
+        self.assertEqual(utxos[:4] + utxos[5:], [item['utxo'] for item in batch])
+
+        # the bundle that was passed over starts the next transaction
+        pending = set([(item['utxo'].tx_hash, item['utxo'].tx_ix) for item in batch])
+        (batch, refunds) = self.packer.pack(utxos, self.prices, self.files[13:], self.sales, pending)
+        self.assertEqual([utxos[4]], [item['utxo'] for item in batch])
+
+    def test_sold_out(self):
+        utxos = self.get_utxos([30000000, 10000000])
+        (batch, refunds) = self.packer.pack(utxos, self.prices, self.files[:2], self.sales, set())
+        self.assertEqual(1, len(batch))
+        self.assertEqual(2, batch[0]['count'])
+        self.assertEqual(10000000, batch[0]['refund'])
+
+        # a payment can never take the last NFTs from an earlier one
+        self.sales.add_utxo(utxos[0].tx_hash, 0, 30000000, 2)
+        (batch, refunds) = self.packer.pack(utxos, self.prices, self.files[:1], self.sales, set())
+        self.assertEqual([utxos[1]], [item['utxo'] for item in batch])
+        self.assertEqual(0, batch[0]['refund'])
+
+    def test_too_large(self):
+        # 10 NFTs can never fit, the bundle is refunded and the single after it minted
+        utxos = self.get_utxos([100000000, 10000000])
+        self.packer.cardano.protocol_parameters['maxTxSize'] = 4512
+        (batch, refunds) = self.packer.pack(utxos, self.prices, self.files, self.sales, set())
+        self.assertEqual([utxos[0]], refunds)
+        self.assertEqual([utxos[1]], [item['utxo'] for item in batch])
+
+        # same for a bundle over max_per_tx
+        self.packer.cardano.protocol_parameters['maxTxSize'] = 16384
+        self.packer.max_per_tx = 3
+        (batch, refunds) = self.packer.pack(utxos, self.prices, self.files, self.sales, set())
+        self.assertEqual([utxos[0]], refunds)
+        self.assertEqual([utxos[1]], [item['utxo'] for item in batch])
+
+    def test_underfunded(self):
+        # 1 ADA does not cover the fee and the min-ADA of the outputs
+        utxos = self.get_utxos([1000000, 10000000])
+        (batch, refunds) = self.packer.pack(utxos, self.prices, self.files, self.sales, set())
+        self.assertEqual([utxos[0]], refunds)
+        self.assertEqual([utxos[1]], [item['utxo'] for item in batch])
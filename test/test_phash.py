@@ -0,0 +1,88 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_phash.py
+Author: SuperKK
+"""
+
+import os
+import random
+import tempfile
+import unittest
+
+from PIL import Image
+
+import tcr.dedupe
+import tcr.phash
+from tcr.phash import BKTree
+
+def create_image(filename: str, pixels: list) -> None:
+    image = Image.new('L', (9, 8))
+    image.putdata(pixels)
+    image.save(filename)
+
+class TestPhash(unittest.TestCase):
+    def test_dhash(self):
+        gradient = Image.new('L', (90, 80))
+        gradient.putdata([255 - x for y in range(0, 80) for x in range(0, 90)])
+        self.assertEqual(2 ** 64 - 1, tcr.phash.dhash(gradient))
+        self.assertEqual(0, tcr.phash.dhash(gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+
+        # one changed pixel does not change the hash
+        changed = gradient.copy()
+        changed.putpixel((45, 40), 0)
+        self.assertEqual(tcr.phash.dhash(gradient), tcr.phash.dhash(changed))
+
+    def test_bktree(self):
+        rng = random.Random(1)
+        hashes = [rng.getrandbits(64) for i in range(0, 500)]
+        tree = BKTree()
+        for (i, hash) in enumerate(hashes):
+            tree.add(hash, i)
+        self.assertEqual(500, len(tree))
+
+        for max_distance in [0, 8, 24, 32]:
+            query = hashes[0] ^ 0xff
+            expected = sorted([(tcr.phash.distance(query, hash), i) for (i, hash) in enumerate(hashes)
+                               if tcr.phash.distance(query, hash) <= max_distance])
+            self.assertEqual(expected, sorted(tree.search(query, max_distance)))
+
+    def test_find_near_duplicates(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            image_dir = os.path.join(tempdir, 'nft_img')
+            os.mkdir(image_dir)
+            pixels = [(x * 28 + y * 3) % 256 for y in range(0, 8) for x in range(0, 9)]
+            create_image(os.path.join(image_dir, 'a.png'), pixels)
+            create_image(os.path.join(image_dir, 'b.png'), list(reversed(pixels)))
+            pixels[0] = 255
+            create_image(os.path.join(image_dir, 'c.png'), pixels)
+
+            filenames = tcr.dedupe.get_image_files(tempdir)
+            self.assertEqual(3, len(filenames))
+
+            duplicates = tcr.dedupe.find_near_duplicates(filenames, 1, max_workers=1)
+            self.assertEqual(1, len(duplicates))
+            self.assertEqual(filenames[0], duplicates[0][1])
+            self.assertEqual(filenames[2], duplicates[0][2])
+            self.assertEqual(duplicates, tcr.dedupe.find_near_duplicates(filenames, 1, max_workers=2))
@@ -0,0 +1,124 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_pipeline.py
+Author: SuperKK
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from tcr.metadata_list import MetadataList
+from tcr.pipeline import MintPipeline
+from tcr.sales import Sales
+from tcr.utxo import Utxo
+
+class FakePipelineDatabase:
+    def __init__(self):
+        self.on_chain = set()
+        self.removed = []
+
+    def query_txhash_times(self, txhashes):
+        times = {txhash: (0, 0) for txhash in txhashes if txhash in self.on_chain}
+        return (times, set(txhashes) - times.keys())
+
+    def remove_minted_token_names(self, policy_id, names):
+        self.removed.append((policy_id, names))
+
+class TestMintPipeline(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+        os.makedirs('nft/testnet/drop')
+
+        with open('metadata_set.json', 'w') as file:
+            file.write(json.dumps({'files': ['file{}.json'.format(i) for i in range(0, 6)]}))
+
+        self.database = FakePipelineDatabase()
+        self.sales = Sales('testnet', 'drop')
+        self.metadata = MetadataList('metadata_set.json')
+        self.utxos = [Utxo('aa', 0, 10000000), Utxo('bb', 0, 20000000)]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def submit(self, pipeline, tx_id, utxo, count):
+        self.sales.add_utxo(utxo.tx_hash, utxo.tx_ix, utxo.amount, count)
+        files = [self.metadata.peek_next_file() for i in range(0, count)]
+        self.metadata.commit()
+        invalid_hereafter = pipeline.get_invalid_hereafter(1000, 100000)
+        pipeline.add(tx_id, [{'utxo': utxo, 'count': count}], files, 'policy', [os.path.splitext(f)[0] for f in files], invalid_hereafter)
+        self.sales.commit()
+
+    def test_confirm(self):
+        pipeline = MintPipeline('testnet', 'drop', max_in_flight=2)
+        self.submit(pipeline, 'tx1', self.utxos[0], 1)
+        self.assertFalse(pipeline.is_full())
+        self.submit(pipeline, 'tx2', self.utxos[1], 2)
+        self.assertTrue(pipeline.is_full())
+        self.assertEqual(set([('aa', 0), ('bb', 0)]), pipeline.get_pending_inputs())
+
+        # in flight transactions survive a restart
+        pipeline = MintPipeline('testnet', 'drop', max_in_flight=2)
+        self.assertEqual(2, len(pipeline.transactions))
+
+        # tx1 spent its input
+        pipeline.update(self.utxos[1:], 1000, self.database, self.metadata, self.sales)
+        self.assertEqual(set([('bb', 0)]), pipeline.get_pending_inputs())
+        self.assertFalse(pipeline.is_full())
+        self.assertEqual(3, self.metadata.get_remaining())
+        self.assertEqual([], self.database.removed)
+
+    def test_invalid_hereafter(self):
+        pipeline = MintPipeline('testnet', 'drop', timeout=600)
+        self.assertEqual(1600, pipeline.get_invalid_hereafter(1000, 100000))
+        self.assertEqual(1200, pipeline.get_invalid_hereafter(1000, 1200))
+
+    def test_rollback(self):
+        pipeline = MintPipeline('testnet', 'drop', timeout=600)
+        self.submit(pipeline, 'tx1', self.utxos[0], 1)
+        self.submit(pipeline, 'tx2', self.utxos[1], 2)
+        self.database.on_chain.add('tx1')
+
+        # nothing is rolled back until db-sync is past the TTL, tx2 could still be included
+        pipeline.update(self.utxos, 1600, self.database, self.metadata, self.sales)
+        self.assertEqual(2, len(pipeline.transactions))
+        self.assertEqual([], self.database.removed)
+
+        # tx1 is on chain even though the node has not caught up, tx2 expired
+        pipeline.update(self.utxos, 1601, self.database, self.metadata, self.sales)
+        self.assertEqual(set([('aa', 0)]), pipeline.get_pending_inputs())
+        self.assertEqual([('policy', ['file1', 'file2'])], self.database.removed)
+        self.assertTrue(self.sales.contains('aa', 0))
+        self.assertFalse(Sales('testnet', 'drop').contains('bb', 0))
+
+        # the metadata files are minted again next
+        self.assertEqual(5, self.metadata.get_remaining())
+        self.assertEqual('file1.json', self.metadata.peek_next_file())
+        self.assertEqual('file2.json', self.metadata.peek_next_file())
+        self.assertEqual('file3.json', self.metadata.peek_next_file())
@@ -0,0 +1,100 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_policy.py
+Author: SuperKK
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from tcr.cardano import Cardano
+from tcr.policy import PolicyCache
+
+class CountingCardano(Cardano):
+    def __init__(self):
+        super().__init__('testnet', 'testnet_protocol_parameters.json')
+        self.queries = 0
+
+    def query_protocol_parameters(self):
+        self.queries += 1
+        self.protocol_parameters = {'txFeeFixed': 155381 + self.queries}
+        return self.protocol_parameters
+
+class TestPolicy(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+        os.makedirs('policy/testnet')
+
+        self.write('id', 'a1b2c3d4' * 7)
+        self.write('owner', 'wallet')
+        self.write('script', json.dumps({'type': 'all',
+                                         'scripts': [{'type': 'before', 'slot': 1000},
+                                                     {'type': 'sig', 'keyHash': 'ab' * 28}]}))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def write(self, extension, text, mtime_ns=None):
+        filename = 'policy/testnet/policy.{}'.format(extension)
+        with open(filename, 'w') as file:
+            file.write(text)
+        if mtime_ns != None:
+            os.utime(filename, ns=(mtime_ns, mtime_ns))
+
+    def test_cache(self):
+        cache = PolicyCache('testnet')
+        policy = cache.get('policy')
+        self.assertEqual('a1b2c3d4' * 7, policy.policy_id)
+        self.assertEqual('wallet', policy.owner)
+        self.assertEqual(1000, policy.invalid_hereafter)
+        self.assertIs(policy, cache.get('policy'))
+
+        # a changed file is loaded again
+        self.write('owner', 'other', 10 ** 18)
+        self.assertEqual('other', cache.get('policy').owner)
+
+        missing = cache.get('missing')
+        self.assertEqual(None, missing.policy_id)
+        self.assertEqual(None, missing.script)
+
+    def test_cardano(self):
+        cardano = CountingCardano()
+        self.assertEqual('wallet', cardano.get_policy_owner('policy'))
+        self.assertEqual(None, cardano.get_policy_id('missing'))
+        self.assertRaises(Exception, cardano.get_policy_script, 'missing')
+
+    def test_protocol_parameters(self):
+        cardano = CountingCardano()
+        self.assertTrue(cardano.refresh_protocol_parameters(300))
+        self.assertFalse(cardano.refresh_protocol_parameters(300))
+        self.assertEqual(1, cardano.queries)
+
+        self.assertTrue(cardano.refresh_protocol_parameters(301))
+        self.assertEqual(155383, cardano.get_protocol_parameters()['txFeeFixed'])
@@ -0,0 +1,102 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_sales.py
+Author: SuperKK
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from tcr.sales import Sales
+
+class TestSales(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+        os.makedirs('nft/testnet/drop')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def test_journal(self):
+        sales = Sales('testnet', 'drop')
+        self.assertTrue(sales.add_utxo('aa', 0, 10000000, 1))
+        self.assertFalse(sales.add_utxo('aa', 0, 10000000, 1))
+        self.assertTrue(sales.add_utxo('bb', 1, 20000000, 2))
+        self.assertTrue(sales.set_output_txid('aa', 0, 'cc'))
+        self.assertFalse(sales.set_output_txid('aa', 1, 'cc'))
+        sales.commit()
+
+        self.assertTrue(sales.remove_utxo('bb', 1))
+        sales.commit()
+
+        # only the changed sale is written by the second commit
+        with open('nft/testnet/drop/sales.journal', 'r') as file:
+            self.assertEqual(3, len(file.readlines()))
+        self.assertFalse(os.path.exists('nft/testnet/drop/sales.json'))
+
+        sales = Sales('testnet', 'drop')
+        self.assertTrue(sales.contains('aa', 0))
+        self.assertFalse(sales.contains('bb', 1))
+        self.assertEqual('cc', sales.get('aa', 0)['out-txid'])
+
+    def test_incomplete_record(self):
+        sales = Sales('testnet', 'drop')
+        sales.add_utxo('aa', 0, 10000000, 1)
+        sales.commit()
+
+        with open('nft/testnet/drop/sales.journal', 'a') as file:
+            file.write('{"put": {"input-hash": "bb"')
+
+        sales = Sales('testnet', 'drop')
+        self.assertTrue(sales.contains('aa', 0))
+        sales.add_utxo('bb', 1, 20000000, 1)
+        sales.commit()
+
+        sales = Sales('testnet', 'drop')
+        self.assertTrue(sales.contains('aa', 0))
+        self.assertTrue(sales.contains('bb', 1))
+
+    def test_compact(self):
+        sales = Sales('testnet', 'drop', compact_records=2)
+        sales.add_utxo('aa', 0, 10000000, 1)
+        sales.commit()
+        sales.add_utxo('bb', 1, 20000000, 1)
+        sales.commit()
+
+        self.assertEqual(0, os.path.getsize('nft/testnet/drop/sales.journal'))
+        with open('nft/testnet/drop/sales.json', 'r') as file:
+            transactions = json.load(file)['transactions']
+        self.assertEqual(['aa', 'bb'], [item['input-hash'] for item in transactions])
+
+        sales.set_tx_ada('aa', 0, 2000000)
+        sales.commit()
+        sales = Sales('testnet', 'drop')
+        self.assertEqual(2000000, sales.get('aa', 0)['out-ada'])
+        self.assertTrue(sales.contains('bb', 1))
@@ -0,0 +1,119 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_transaction.py
+Author: SuperKK
+"""
+
+import unittest
+
+import tcr.cbor
+from tcr.transaction import Transaction
+from tcr.transaction import address_to_bytes
+from tcr.transaction import metadata_to_cbor_value
+
+class TestCbor(unittest.TestCase):
+    def test_encode(self):
+        # Examples from RFC 8949, Appendix A
+        self.assertEqual('00', tcr.cbor.encode(0).hex())
+        self.assertEqual('17', tcr.cbor.encode(23).hex())
+        self.assertEqual('1818', tcr.cbor.encode(24).hex())
+        self.assertEqual('1903e8', tcr.cbor.encode(1000).hex())
+        self.assertEqual('1a000f4240', tcr.cbor.encode(1000000).hex())
+        self.assertEqual('1b000000e8d4a51000', tcr.cbor.encode(1000000000000).hex())
+        self.assertEqual('3863', tcr.cbor.encode(-100).hex())
+        self.assertEqual('4401020304', tcr.cbor.encode(bytes([1, 2, 3, 4])).hex())
+        self.assertEqual('6449455446', tcr.cbor.encode('IETF').hex())
+        self.assertEqual('83010203', tcr.cbor.encode([1, 2, 3]).hex())
+        self.assertEqual('a201020304', tcr.cbor.encode({1: 2, 3: 4}).hex())
+        self.assertEqual('f5f4f6', (tcr.cbor.encode(True) + tcr.cbor.encode(False) + tcr.cbor.encode(None)).hex())
+
+    def test_item_end(self):
+        data = tcr.cbor.encode([{1: [b'abc', 'def']}, -1000, True])
+        self.assertEqual(len(data), tcr.cbor.item_end(data))
+
+        # indefinite length array containing an indefinite length byte string
+        data = bytes.fromhex('9f015f41614162ffff')
+        self.assertEqual(len(data), tcr.cbor.item_end(data))
+
+    def test_array_items(self):
+        items = [{0: [1, 2]}, {}, True, None]
+        data = tcr.cbor.encode(items)
+        self.assertEqual([tcr.cbor.encode(item) for item in items], tcr.cbor.array_items(data))
+
+class TestTransaction(unittest.TestCase):
+    def setUp(self):
+        self.policy_id = 'a1b2c3d4' * 7
+        self.address = 'addr_test1vz2fxv2umyhttkxyxp8x0dlpdt3k6cwng5pxj3jhsydzerspjrlsz'
+        self.script = {'type': 'all',
+                       'scripts': [{'type': 'before', 'slot': 1000},
+                                   {'type': 'sig', 'keyHash': 'ab' * 28}]}
+
+    def test_address_to_bytes(self):
+        # Test vectors from CIP-0019
+        self.assertEqual('609493315cd92eb5d8c4304e67b7e16ae36d61d34502694657811a2c8e',
+                         address_to_bytes(self.address).hex())
+        self.assertEqual('82d818582183581cba970ad36654d8dd8f74274b733452ddeab9a62a397746be3c42ccdda0001a9026da5b',
+                         address_to_bytes('Ae2tdPwUPEZFRbyhz3cpfC2CumGzNkFBN2L42rcUc2yjQpEkxDbkPodpMAi').hex())
+
+    def test_metadata(self):
+        metadata = {'721': {self.policy_id: {'TCR': {'name': 'TCR', 'id': 1, 'tags': ['a', '0x0102']}}}}
+        self.assertEqual({721: {self.policy_id: {'TCR': {'name': 'TCR', 'id': 1, 'tags': ['a', bytes([1, 2])]}}}},
+                         metadata_to_cbor_value(metadata))
+
+        with self.assertRaises(Exception):
+            metadata_to_cbor_value({'721': 'x' * 65})
+
+    def test_mint_transaction(self):
+        transaction = Transaction()
+        transaction.add_input('00' * 32, 1)
+        transaction.add_output(self.address, 2000000, {'{}.TCR'.format(self.policy_id): 1})
+        transaction.add_mint('{}.TCR'.format(self.policy_id), 1)
+        transaction.add_script(self.script)
+        transaction.set_metadata({'721': {self.policy_id: {'TCR': {'name': 'TCR'}}}})
+        transaction.set_invalid_hereafter(1000)
+        transaction.set_fee(200000)
+
+        body = transaction.get_body()
+        self.assertEqual([[bytes(32), 1]], body[0])
+        self.assertEqual([[address_to_bytes(self.address), [2000000, {bytes.fromhex(self.policy_id): {b'TCR': 1}}]]], body[1])
+        self.assertEqual(200000, body[2])
+        self.assertEqual(1000, body[3])
+        self.assertEqual({bytes.fromhex(self.policy_id): {b'TCR': 1}}, body[9])
+
+        data = transaction.serialize()
+        items = tcr.cbor.array_items(data)
+        self.assertEqual(4, len(items))
+        self.assertEqual(tcr.cbor.encode(body), items[0])
+
+    def test_min_fee(self):
+        transaction = Transaction()
+        transaction.add_input('00' * 32, 0)
+        transaction.add_output(self.address, 1, {})
+
+        parameters = {'txFeeFixed': 155381, 'txFeePerByte': 44}
+        unsigned = transaction.calculate_min_fee(parameters, 0)
+        signed = transaction.calculate_min_fee(parameters, 2)
+        self.assertEqual(155381 + 44 * (len(transaction.serialize()) + 16), unsigned)
+        self.assertTrue(signed > unsigned + 44 * 2 * 100)
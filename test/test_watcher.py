@@ -0,0 +1,157 @@
+#
+# Copyright 2021-2022 The Card Room
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File: test_watcher.py
+Author: SuperKK
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import tcr.database
+from tcr.database import Database
+from tcr.watcher import PaymentWatcher
+import tcr.watcher
+
+class FakeNotify:
+    def __init__(self, payload):
+        self.payload = payload
+
+class FakeListenCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql):
+        self.connection.statements.append(sql)
+
+    def close(self):
+        pass
+
+class FakeListenConnection:
+    """
+    NOTIFYs sent by the trigger wait in pending until select and poll read them.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.pending = []
+        self.notifies = []
+
+    def set_isolation_level(self, level):
+        self.isolation_level = level
+
+    def cursor(self):
+        return FakeListenCursor(self)
+
+    def poll(self):
+        self.notifies.extend(self.pending)
+        self.pending = []
+
+    def select(self, readable, writable, exceptional, timeout):
+        if len(self.pending) > 0:
+            return (readable, [], [])
+        time.sleep(timeout)
+        return ([], [], [])
+
+class FakeWatchDatabase(Database):
+    def __init__(self, config_file, block_ids, touched):
+        super().__init__(config_file)
+        self.block_ids = block_ids
+        self.touched = touched
+        self.activity = []
+
+    def query_latest_block_id(self):
+        # the last block id stays the tip
+        if len(self.block_ids) > 1:
+            return self.block_ids.pop(0)
+        return self.block_ids[0]
+
+    def query_address_activity(self, addresses, after_block_id):
+        self.activity.append((addresses, after_block_id))
+        return self.touched
+
+class TestPaymentWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.config_file = os.path.join(self.tempdir.name, 'testnet.ini')
+        with open(self.config_file, 'w') as file:
+            file.write('[postgresql]\nhost=localhost\ndatabase=cexplorer\nuser=tcr\n')
+
+        self.connection = FakeListenConnection()
+        for patcher in [mock.patch('psycopg2.connect', return_value=self.connection),
+                        mock.patch('select.select', self.connection.select)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.addresses = ['addr_test1', 'addr_test2']
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_notify(self):
+        database = FakeWatchDatabase(self.config_file, [10], True)
+        watcher = PaymentWatcher(database, self.addresses + [None], mode=tcr.watcher.WATCH_NOTIFY, poll_interval=5)
+        self.assertEqual(['listen {};'.format(tcr.database.BLOCK_NOTIFY_CHANNEL)], self.connection.statements)
+
+        # both blocks are checked at once
+        self.connection.pending = [FakeNotify('11'), FakeNotify('12')]
+        start = time.monotonic()
+        self.assertTrue(watcher.wait())
+        self.assertTrue(time.monotonic() - start < 1)
+        self.assertEqual([(self.addresses, 10)], database.activity)
+        self.assertEqual(12, watcher.last_block_id)
+
+    def test_notify_timeout(self):
+        # a block for other addresses does not end the wait
+        database = FakeWatchDatabase(self.config_file, [10], False)
+        watcher = PaymentWatcher(database, self.addresses, mode=tcr.watcher.WATCH_NOTIFY, poll_interval=0.2)
+        self.connection.pending = [FakeNotify('11')]
+        start = time.monotonic()
+        self.assertFalse(watcher.wait())
+        self.assertTrue(time.monotonic() - start >= 0.2)
+        self.assertEqual([(self.addresses, 10)], database.activity)
+        self.assertEqual(11, watcher.last_block_id)
+
+    def test_tip(self):
+        database = FakeWatchDatabase(self.config_file, [10, 10, 10, 11], True)
+        watcher = PaymentWatcher(database, self.addresses, mode=tcr.watcher.WATCH_TIP, poll_interval=5, tip_interval=0.01)
+        self.assertTrue(watcher.wait())
+        self.assertEqual([(self.addresses, 10)], database.activity)
+        self.assertEqual(11, watcher.last_block_id)
+        self.assertEqual([], self.connection.statements)
+
+    def test_tip_timeout(self):
+        database = FakeWatchDatabase(self.config_file, [10], True)
+        watcher = PaymentWatcher(database, self.addresses, mode=tcr.watcher.WATCH_TIP, poll_interval=0.1, tip_interval=0.02)
+        start = time.monotonic()
+        self.assertFalse(watcher.wait())
+        self.assertTrue(time.monotonic() - start >= 0.1)
+        self.assertEqual([], database.activity)
+
+    def test_invalid_mode(self):
+        database = FakeWatchDatabase(self.config_file, [10], True)
+        self.assertRaises(Exception, PaymentWatcher, database, self.addresses, 'poll')